@@ -1,23 +1,86 @@
-# 4. Создайте app/bot/batch_sender.py для массовых рассылок:
 """
-Модуль для оптимизированной отправки сообщений
+Модуль для оптимизированной отправки сообщений.
+
+Сообщения накапливаются в очереди и отправляются пачками параллельно, в
+пределах лимитов Telegram (общий token bucket и лимит на чат, см.
+app.bot.rate_limit). На TelegramRetryAfter общий лимит ставится на паузу, а
+сообщение отправляется повторно. Если к боту подключен OutboundMiddleware
+(app.bot.outbound), лимиты и повторы выполняет он; отправки помечаются как
+массовые (bulk_requests) и получают строгий лимит чата.
+
+Ошибки отправки делятся на постоянные (бот заблокирован, чат не найден,
+аккаунт удален) и временные (сеть, ошибки сервера, flood control). Чаты с
+постоянной ошибкой после flush одним запросом отписываются от рассылок
+(subscribed_to_offers=False, last_delivery_error), поэтому следующие рассылки
+не тратят на них запросы.
 """
 import asyncio
-from typing import List, Tuple, Dict, Any
+from typing import List, Optional, Tuple, Dict, Any
 from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound, TelegramRetryAfter
 import logging
 
+from app.bot.outbound import bulk_requests, find_outbound
+from app.bot.rate_limit import TelegramRateLimiter, telegram_limiter
+from app.database.crud import mark_chats_undeliverable
+
 logger = logging.getLogger(__name__)
 
+# Сколько раз повторять сообщение после RetryAfter
+MAX_RETRIES = 3
+
+# Ответы BadRequest, после которых в этот чат писать бесполезно
+PERMANENT_ERROR_MARKERS = (
+    "chat not found",
+    "user not found",
+    "user is deactivated",
+    "peer_id_invalid",
+    "bot was blocked",
+    "bot was kicked",
+)
+
+# Максимальная длина сохраняемого текста ошибки
+MAX_ERROR_LENGTH = 500
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """Постоянная ошибка: чат больше не сможет получать сообщения"""
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    if isinstance(error, (TelegramBadRequest, TelegramNotFound)):
+        message = error.message.lower()
+        return any(marker in message for marker in PERMANENT_ERROR_MARKERS)
+    return False
+
+
+def error_text(error: Exception) -> str:
+    return f"{type(error).__name__}: {error}"[:MAX_ERROR_LENGTH]
+
 
 class BatchMessageSender:
     """Отправка сообщений батчами"""
 
-    def __init__(self, bot: Bot, batch_size: int = 30, delay: float = 0.05):
+    def __init__(self, bot: Bot, batch_size: int = 30, delay: float = 0,
+                 limiter: Optional[TelegramRateLimiter] = None, concurrency: int = 10,
+                 prune_dead_chats: bool = True):
         self.bot = bot
         self.batch_size = batch_size
-        self.delay = delay  # Задержка между сообщениями
+        self.delay = delay  # Дополнительная пауза после сообщения
+        self.limiter = limiter or telegram_limiter
+        # Если к боту подключен OutboundMiddleware, лимиты и повторы - на нем
+        self.outbound = find_outbound(bot)
+        self.concurrency = concurrency
+        # Отписывать чаты с постоянными ошибками после каждого flush
+        self.prune_dead_chats = prune_dead_chats
         self.queue: List[Tuple[int, str, Dict[str, Any]]] = []
+        # Итоги по всем flush
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.permanent = 0
+        self.pruned = 0
+        # Ошибки последнего flush: (chat_id, исключение)
+        self.errors: List[Tuple[int, Exception]] = []
 
     async def add_message(self, chat_id: int, text: str, **kwargs):
         """Добавить сообщение в очередь"""
@@ -26,23 +89,74 @@ class BatchMessageSender:
         if len(self.queue) >= self.batch_size:
             await self.flush()
 
+    async def _send(self, chat_id: int, text: str, kwargs: Dict[str, Any],
+                    semaphore: asyncio.Semaphore) -> Optional[Exception]:
+        """Отправить одно сообщение; вернуть ошибку или None"""
+        if self.outbound is not None:
+            try:
+                with bulk_requests():
+                    async with semaphore:
+                        await self.bot.send_message(chat_id, text, **kwargs)
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                return None
+            except Exception as e:
+                return e
+
+        for attempt in range(MAX_RETRIES + 1):
+            # Ожидание лимита - вне семафора: он ограничивает только запросы в полете
+            await self.limiter.acquire(chat_id)
+            try:
+                async with semaphore:
+                    await self.bot.send_message(chat_id, text, **kwargs)
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                return None
+            except TelegramRetryAfter as e:
+                # Flood control: ставим общий лимит на паузу и повторяем
+                self.limiter.pause(e.retry_after)
+                self.retries += 1
+                logger.warning(f"Flood control for {chat_id}, retry after {e.retry_after}s")
+                if attempt == MAX_RETRIES:
+                    return e
+            except Exception as e:
+                return e
+
     async def flush(self):
         """Отправить все сообщения из очереди"""
         if not self.queue:
-            return
+            return 0
+
+        batch, self.queue = self.queue, []
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(
+            self._send(chat_id, text, kwargs, semaphore) for chat_id, text, kwargs in batch
+        ))
+
+        self.errors = []
+        for (chat_id, _, _), error in zip(batch, results):
+            if error is not None:
+                self.errors.append((chat_id, error))
+                if is_permanent_error(error):
+                    logger.info(f"Chat {chat_id} is unreachable: {error}")
+                else:
+                    logger.error(f"Failed to send message to {chat_id}: {error}")
 
-        success_count = 0
+        success_count = len(batch) - len(self.errors)
+        self.sent += success_count
+        self.failed += len(self.errors)
+        dead_chats = self.permanent_errors()
+        self.permanent += len(dead_chats)
+        logger.info(f"Sent {success_count}/{len(batch)} messages")
 
-        # Отправляем по одному с небольшой задержкой
-        for chat_id, text, kwargs in self.queue:
+        if dead_chats and self.prune_dead_chats:
             try:
-                await self.bot.send_message(chat_id, text, **kwargs)
-                success_count += 1
-                await asyncio.sleep(self.delay)  # Защита от rate limit
+                self.pruned += await mark_chats_undeliverable(None, dead_chats)
             except Exception as e:
-                logger.error(f"Failed to send message to {chat_id}: {e}")
+                logger.error(f"Error unsubscribing {len(dead_chats)} unreachable chats: {e}")
 
-        logger.info(f"Sent {success_count}/{len(self.queue)} messages")
-        self.queue.clear()
+        return success_count
 
-        return success_count
\ No newline at end of file
+    def permanent_errors(self) -> List[Tuple[int, str]]:
+        """Постоянные ошибки последнего flush: (chat_id, текст ошибки)"""
+        return [(chat_id, error_text(error)) for chat_id, error in self.errors if is_permanent_error(error)]
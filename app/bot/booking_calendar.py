@@ -0,0 +1,107 @@
+"""
+Календарь выбора дат бронирования.
+
+Сетка месяца (заголовок, дни недели, кнопки всех дней во всех вариантах:
+прошедший, свободный, занятый, выбранный, и навигация) строится один раз на
+(год, месяц, сегодня) и кешируется. Показ календаря для номера - это выбор
+готовых кнопок по множеству занятых ночей, которое загружается одним
+запросом по диапазону месяца (индекс ix_bookings_room_status_dates).
+"""
+import calendar
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Iterable, List, Optional, Set
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.bot.callbacks import BusyDateCB, CalendarCB, IgnoreCB, SelectDateCB, UnselectDateCB, day_code
+from app.database.crud import get_booked_nights
+
+WEEK_DAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+IGNORE = IgnoreCB().pack()
+
+BLANK = InlineKeyboardButton(text=" ", callback_data=IGNORE)
+
+
+def _month_data(day: date) -> str:
+    return CalendarCB(year=day.year, month=day.month).pack()
+
+
+class DayButtons:
+    """Готовые варианты кнопки одного дня"""
+    __slots__ = ("day", "past", "free", "busy", "selected")
+
+    def __init__(self, day: date, today: date):
+        self.day = day
+        number = day.day
+        code = day_code(day)
+        self.past = InlineKeyboardButton(text=f"·{number}·", callback_data=IGNORE)
+        # Выходные дни подсвечиваем
+        self.free = InlineKeyboardButton(
+            text=f"🔴 {number}" if day.weekday() in (4, 5, 6) else str(number),
+            callback_data=SelectDateCB(day=code).pack()
+        )
+        self.busy = InlineKeyboardButton(text=f"✖️{number}", callback_data=BusyDateCB(day=code).pack())
+        self.selected = InlineKeyboardButton(text=f"✅ {number}", callback_data=UnselectDateCB(day=code).pack())
+        if day < today:
+            self.free = self.busy = self.past
+
+
+class MonthSkeleton:
+    """Неизменяемая часть календаря месяца"""
+
+    def __init__(self, year: int, month: int, today: date):
+        self.first_day = date(year, month, 1)
+        self.next_month = (self.first_day + timedelta(days=31)).replace(day=1)
+        self.header = [
+            [InlineKeyboardButton(text=f"{calendar.month_name[month]} {year}", callback_data=IGNORE)],
+            [InlineKeyboardButton(text=day, callback_data=IGNORE) for day in WEEK_DAYS],
+        ]
+        self.weeks: List[List[Optional[DayButtons]]] = [
+            [DayButtons(date(year, month, day), today) if day else None for day in week]
+            for week in calendar.monthcalendar(year, month)
+        ]
+
+        previous = self.first_day - timedelta(days=1)
+        nav = []
+        if (year, month) > (today.year, today.month):
+            nav.append(InlineKeyboardButton(text="◀️", callback_data=_month_data(previous)))
+        nav.append(InlineKeyboardButton(text="📅 Сегодня", callback_data=_month_data(today)))
+        nav.append(InlineKeyboardButton(
+            text="▶️", callback_data=_month_data(self.next_month)
+        ))
+        self.nav = nav
+
+    def render(self, booked: Set[date] = frozenset(), selected: Iterable[date] = ()) -> InlineKeyboardMarkup:
+        """Клавиатура месяца с занятыми и выбранными днями"""
+        selected = set(selected)
+        rows = list(self.header)
+        for week in self.weeks:
+            row = []
+            for cell in week:
+                if cell is None:
+                    row.append(BLANK)
+                elif cell.day in selected:
+                    row.append(cell.selected)
+                elif cell.day in booked:
+                    row.append(cell.busy)
+                else:
+                    row.append(cell.free)
+            rows.append(row)
+        rows.append(self.nav)
+        return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+@lru_cache(maxsize=64)
+def month_skeleton(year: int, month: int, today: date) -> MonthSkeleton:
+    return MonthSkeleton(year, month, today)
+
+
+async def room_calendar(session: AsyncSession, room_id: int, year: int, month: int,
+                        selected: Iterable[date] = ()) -> InlineKeyboardMarkup:
+    """Календарь месяца с занятыми ночами номера (один запрос к базе)"""
+    skeleton = month_skeleton(year, month, date.today())
+    booked = await get_booked_nights(session, room_id, skeleton.first_day, skeleton.next_month)
+    return skeleton.render(booked, selected)
@@ -0,0 +1,330 @@
+"""
+Рассылки подписчикам.
+
+Подписчики читаются из базы порциями с keyset-пагинацией (WHERE id > последний
+id ORDER BY id LIMIT n), каждая порция - в короткой сессии, поэтому
+соединение не удерживается на время отправки. Сообщения отправляются
+параллельно через BatchMessageSender в пределах лимитов Telegram.
+
+Рассылка хранится в таблице broadcasts. После каждой пачки сообщений
+результаты доставки (broadcast_deliveries), счетчики и точка продолжения
+last_user_id записываются одной транзакцией, поэтому после перезапуска
+рассылка продолжается с последней сохраненной пачки: повторно могут уйти
+только сообщения пачки, отправлявшейся в момент падения.
+
+Рассылку выполняет один воркер: он занимает ее (worker, heartbeat_at) и
+обновляет heartbeat с каждой пачкой. Рассылку без heartbeat дольше
+BROADCAST_LEASE секунд подхватывает resume_broadcasts.
+
+Чаты с постоянной ошибкой отправки (бот заблокирован, чат не найден)
+отписываются от рассылок в той же транзакции, что и результаты пачки, и в
+следующие рассылки не попадают; заблокировавшие бота пользователи, кроме
+того, помечаются bot_blocked.
+"""
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy import desc, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.bot.batch_sender import BatchMessageSender, error_text, is_permanent_error
+from app.bot.rate_limit import TelegramRateLimiter
+from app.config import (
+    BROADCAST_BATCH_SIZE, BROADCAST_CHUNK_SIZE, BROADCAST_CONCURRENCY, BROADCAST_LEASE
+)
+from app.database import SessionLocal
+from app.database.crud import user_cache, write_undeliverable_chats
+from app.database.models import Broadcast, BroadcastDelivery, User
+from app.database.writer import db_writer
+
+logger = logging.getLogger(__name__)
+
+WORKER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class BroadcastLeaseLost(RuntimeError):
+    """Рассылку перехватил другой воркер (heartbeat устарел)"""
+
+
+def _subscribers():
+    return select(User.id, User.telegram_id).where(
+        User.subscribed_to_offers == True,
+        User.bot_blocked == False
+    )
+
+
+async def iter_subscriber_chunks(chunk_size: int = BROADCAST_CHUNK_SIZE,
+                                 after_id: int = 0) -> AsyncIterator[List[Any]]:
+    """Подписчики на акции порциями (строки с id и telegram_id) по возрастанию id"""
+    last_id = after_id
+    while True:
+        async with SessionLocal() as session:
+            rows = (await session.execute(
+                _subscribers().where(User.id > last_id).order_by(User.id).limit(chunk_size)
+            )).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1].id
+
+
+async def create_broadcast(name: str, text: str,
+                           reply_markup: Optional[InlineKeyboardMarkup] = None) -> int:
+    """Сохранить новую рассылку, вернуть ее id"""
+    async with SessionLocal() as session:
+        recipients = (await session.execute(
+            select(func.count()).select_from(_subscribers().subquery())
+        )).scalar()
+
+    async def write(session: AsyncSession) -> int:
+        broadcast = Broadcast(
+            name=name,
+            text=text,
+            reply_markup=reply_markup.model_dump_json(exclude_none=True) if reply_markup else None,
+            status="pending",
+            recipients=recipients
+        )
+        session.add(broadcast)
+        await session.flush()
+        return broadcast.id
+
+    return await db_writer.run(write)
+
+
+async def _claim(broadcast_id: int) -> Optional[Dict[str, Any]]:
+    """Занять рассылку этим воркером; None - ее выполняет другой воркер или она завершена"""
+
+    async def write(session: AsyncSession) -> Optional[Dict[str, Any]]:
+        now = datetime.now()
+        result = await session.execute(
+            update(Broadcast)
+            .where(
+                Broadcast.id == broadcast_id,
+                Broadcast.status.in_(("pending", "running")),
+                or_(
+                    Broadcast.worker.is_(None),
+                    Broadcast.worker == WORKER,
+                    Broadcast.heartbeat_at < now - timedelta(seconds=BROADCAST_LEASE)
+                )
+            )
+            .values(
+                status="running",
+                worker=WORKER,
+                heartbeat_at=now,
+                started_at=func.coalesce(Broadcast.started_at, now)
+            )
+        )
+        if result.rowcount != 1:
+            return None
+        row = (await session.execute(
+            select(Broadcast.text, Broadcast.reply_markup, Broadcast.last_user_id)
+            .where(Broadcast.id == broadcast_id)
+        )).one()
+        return row._asdict()
+
+    return await db_writer.run(write)
+
+
+async def _save_batch(broadcast_id: int, rows: Sequence[Any],
+                      errors: List[Tuple[int, Exception]]) -> Dict[str, int]:
+    """Записать результаты пачки, счетчики и точку продолжения одной транзакцией"""
+    now = datetime.now()
+    failed_by_chat = dict(errors)
+    # blocked - постоянные ошибки (чат недоступен), failed - временные
+    counts = {"sent": 0, "failed": 0, "blocked": 0}
+    deliveries = []
+    dead_chats = []
+    blocked = []
+
+    for row in rows:
+        error = failed_by_chat.get(row.telegram_id)
+        if error is None:
+            status = "sent"
+        elif is_permanent_error(error):
+            status = "blocked"
+            dead_chats.append((row.telegram_id, error_text(error)))
+            if isinstance(error, TelegramForbiddenError):
+                blocked.append(row)
+        else:
+            status = "failed"
+        counts[status] += 1
+        deliveries.append({
+            "broadcast_id": broadcast_id,
+            "user_id": row.id,
+            "status": status,
+            "error": error_text(error) if error is not None else None,
+            "sent_at": now,
+        })
+
+    async def write(session: AsyncSession):
+        result = await session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.worker == WORKER)
+            .values(
+                sent=Broadcast.sent + counts["sent"],
+                failed=Broadcast.failed + counts["failed"],
+                blocked=Broadcast.blocked + counts["blocked"],
+                last_user_id=rows[-1].id,
+                heartbeat_at=now
+            )
+        )
+        if result.rowcount != 1:
+            raise BroadcastLeaseLost(f"Broadcast {broadcast_id} was taken over by another worker")
+        await session.execute(insert(BroadcastDelivery), deliveries)
+        await write_undeliverable_chats(session, dead_chats)
+        if blocked:
+            await session.execute(
+                update(User).where(User.id.in_([row.id for row in blocked])).values(bot_blocked=True)
+            )
+
+    await db_writer.run(write)
+    # Следующий /start такого пользователя должен дойти до базы и снять флаг
+    for row in blocked:
+        user_cache.delete(str(row.telegram_id))
+    return counts
+
+
+async def _finish(broadcast_id: int, status: str):
+    async def write(session: AsyncSession):
+        await session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.worker == WORKER)
+            .values(status=status, finished_at=datetime.now(), heartbeat_at=datetime.now())
+        )
+
+    await db_writer.run(write)
+
+
+async def _release(broadcast_id: int):
+    """Освободить рассылку, чтобы ее сразу мог продолжить следующий запуск"""
+
+    async def write(session: AsyncSession):
+        await session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.worker == WORKER)
+            .values(worker=None)
+        )
+
+    await db_writer.run(write)
+
+
+async def run_broadcast(bot: Bot, broadcast_id: int, chunk_size: int = BROADCAST_CHUNK_SIZE,
+                        batch_size: int = BROADCAST_BATCH_SIZE,
+                        concurrency: int = BROADCAST_CONCURRENCY,
+                        limiter: Optional[TelegramRateLimiter] = None) -> Optional[Dict[str, Any]]:
+    """Выполнить (или продолжить) рассылку; None - ее выполняет другой воркер"""
+    job = await _claim(broadcast_id)
+    if job is None:
+        logger.info(f"Broadcast {broadcast_id} is finished or handled by another worker")
+        return None
+
+    kwargs = {}
+    if job["reply_markup"]:
+        kwargs["reply_markup"] = InlineKeyboardMarkup.model_validate_json(job["reply_markup"])
+    if job["last_user_id"]:
+        logger.info(f"Resuming broadcast {broadcast_id} after user {job['last_user_id']}")
+
+    # Недоступные чаты отписывает _save_batch вместе с результатами пачки
+    sender = BatchMessageSender(bot, batch_size=batch_size, limiter=limiter, concurrency=concurrency,
+                                prune_dead_chats=False)
+    started = time.monotonic()
+    processed = 0
+    try:
+        async for chunk in iter_subscriber_chunks(chunk_size, after_id=job["last_user_id"]):
+            for offset in range(0, len(chunk), batch_size):
+                batch = chunk[offset:offset + batch_size]
+                for row in batch:
+                    await sender.add_message(row.telegram_id, job["text"], **kwargs)
+                # Последний add_message мог уже отправить пачку; errors - ошибки этой пачки
+                await sender.flush()
+                await _save_batch(broadcast_id, batch, sender.errors)
+                processed += len(batch)
+
+            elapsed = time.monotonic() - started
+            logger.info(f"Broadcast {broadcast_id} progress: {processed} processed in this run, "
+                        f"{sender.sent / elapsed if elapsed else 0:.1f} msg/s")
+    except BroadcastLeaseLost as e:
+        logger.warning(str(e))
+        return None
+    except Exception:
+        await _release(broadcast_id)
+        raise
+
+    await _finish(broadcast_id, "completed")
+    async with SessionLocal() as session:
+        result = await broadcast_progress(session, broadcast_id)
+    logger.info(f"Broadcast {broadcast_id} finished: {result}")
+    return result
+
+
+async def broadcast(bot: Bot, text: str, name: str = "manual",
+                    reply_markup: Optional[InlineKeyboardMarkup] = None, **kwargs) -> Dict[str, Any]:
+    """Создать рассылку всем подписчикам и выполнить ее; kwargs передаются в run_broadcast"""
+    broadcast_id = await create_broadcast(name, text, reply_markup)
+    return await run_broadcast(bot, broadcast_id, **kwargs)
+
+
+async def resume_broadcasts(bot: Bot) -> List[int]:
+    """Продолжить незавершенные рассылки, брошенные воркерами (после падения/рестарта)"""
+    stale = datetime.now() - timedelta(seconds=BROADCAST_LEASE)
+    async with SessionLocal() as session:
+        ids = (await session.execute(
+            select(Broadcast.id)
+            .where(
+                Broadcast.status.in_(("pending", "running")),
+                or_(Broadcast.worker.is_(None), Broadcast.worker == WORKER, Broadcast.heartbeat_at < stale)
+            )
+            .order_by(Broadcast.id)
+        )).scalars().all()
+
+    resumed = []
+    for broadcast_id in ids:
+        try:
+            if await run_broadcast(bot, broadcast_id) is not None:
+                resumed.append(broadcast_id)
+        except Exception as e:
+            logger.error(f"Error resuming broadcast {broadcast_id}: {e}")
+    return resumed
+
+
+def _progress(broadcast: Broadcast) -> Dict[str, Any]:
+    processed = broadcast.sent + broadcast.failed + broadcast.blocked
+    end = broadcast.finished_at or broadcast.heartbeat_at
+    duration = (end - broadcast.started_at).total_seconds() if broadcast.started_at and end else 0
+    return {
+        "id": broadcast.id,
+        "name": broadcast.name,
+        "status": broadcast.status,
+        "recipients": broadcast.recipients,
+        "processed": processed,
+        "sent": broadcast.sent,
+        "failed": broadcast.failed,
+        "blocked": broadcast.blocked,
+        "progress": round(processed / broadcast.recipients, 3) if broadcast.recipients else 1.0,
+        "duration_s": round(duration, 2),
+        "rate_per_s": round(broadcast.sent / duration, 1) if duration else 0,
+        "worker": broadcast.worker,
+        "created_at": broadcast.created_at.isoformat() if broadcast.created_at else None,
+        "finished_at": broadcast.finished_at.isoformat() if broadcast.finished_at else None,
+    }
+
+
+async def broadcast_progress(session: AsyncSession, broadcast_id: int) -> Optional[Dict[str, Any]]:
+    """Прогресс и скорость рассылки"""
+    broadcast = await session.get(Broadcast, broadcast_id)
+    return _progress(broadcast) if broadcast else None
+
+
+async def recent_broadcasts(session: AsyncSession, limit: int = 20) -> List[Dict[str, Any]]:
+    """Последние рассылки с прогрессом"""
+    result = await session.execute(select(Broadcast).order_by(desc(Broadcast.id)).limit(limit))
+    return [_progress(broadcast) for broadcast in result.scalars()]
@@ -0,0 +1,239 @@
+"""
+callback_data кнопок бота и их маршрутизация.
+
+Каждый тип кнопки - фабрика CallbackData aiogram с коротким префиксом
+("r:12", "xb:3:1020:2"); даты кодируются числом дней от EPOCH, поэтому
+payload экспресс-бронирования занимает ~12 байт вместо ~36 при лимите
+Telegram в 64 байта.
+
+CallbackDispatcher хранит таблицу префикс -> (фабрика, хендлер) и
+регистрируется в роутере как единственный обработчик callback_query:
+маршрутизация нажатия - это один поиск в словаре вместо последовательной
+проверки lambda-фильтров. Старые payload ("room_12", "express_book_...")
+из уже отправленных сообщений переводятся в новые фабрики.
+"""
+import inspect
+import logging
+import re
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type, Union
+
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery
+from pydantic import Field
+
+logger = logging.getLogger(__name__)
+
+# Точка отсчета для дат в callback_data
+EPOCH = date(2024, 1, 1)
+
+# Границы значений из callback_data: payload приходит от клиента и может быть подделан
+MAX_DAY_CODE = 100 * 366
+MAX_NIGHTS = 365
+
+
+def day_code(day: date) -> int:
+    return (day - EPOCH).days
+
+
+def code_day(code: int) -> date:
+    return EPOCH + timedelta(days=code)
+
+
+# Кнопки без параметров
+class IgnoreCB(CallbackData, prefix="_"):
+    pass
+
+
+class BackToMainCB(CallbackData, prefix="bm"):
+    pass
+
+
+class BackToRoomsCB(CallbackData, prefix="br"):
+    pass
+
+
+class PhoneNumberCB(CallbackData, prefix="pn"):
+    pass
+
+
+class CallSupportCB(CallbackData, prefix="cs"):
+    pass
+
+
+# Номера
+class RoomTypeCB(CallbackData, prefix="rt"):
+    room_type: str
+
+
+class RoomCB(CallbackData, prefix="r"):
+    room_id: int
+
+
+class ReviewsCB(CallbackData, prefix="rv"):
+    room_id: int
+
+
+class VideoTourCB(CallbackData, prefix="vt"):
+    room_id: int
+
+
+class PhotosCB(CallbackData, prefix="ph"):
+    room_id: int
+
+
+# Бронирование
+class QuickBookCB(CallbackData, prefix="qb"):
+    room_id: int
+
+
+class ExpressBookCB(CallbackData, prefix="xb"):
+    room_id: int
+    day: int = Field(ge=0, le=MAX_DAY_CODE)  # day_code(check_in)
+    nights: int = Field(ge=1, le=MAX_NIGHTS)
+
+    @classmethod
+    def for_dates(cls, room_id: int, check_in: date, check_out: date) -> "ExpressBookCB":
+        return cls(room_id=room_id, day=day_code(check_in), nights=(check_out - check_in).days)
+
+    @property
+    def check_in(self) -> date:
+        return code_day(self.day)
+
+    @property
+    def check_out(self) -> date:
+        return code_day(self.day + self.nights)
+
+
+class CalendarBookCB(CallbackData, prefix="cb"):
+    room_id: int
+
+
+class CalendarCB(CallbackData, prefix="c"):
+    year: int = Field(ge=EPOCH.year, le=EPOCH.year + 100)
+    month: int = Field(ge=1, le=12)
+
+
+class SelectDateCB(CallbackData, prefix="ds"):
+    day: int = Field(ge=0, le=MAX_DAY_CODE)  # day_code
+
+    @property
+    def date(self) -> date:
+        return code_day(self.day)
+
+
+class BusyDateCB(SelectDateCB, prefix="db"):
+    pass
+
+
+class UnselectDateCB(SelectDateCB, prefix="du"):
+    pass
+
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+def _legacy(data: str) -> Optional[CallbackData]:
+    """Payload старого формата из ранее отправленных сообщений"""
+    static = _LEGACY_STATIC.get(data)
+    if static is not None:
+        return static
+    for pattern, build in _LEGACY_PATTERNS:
+        match = pattern.fullmatch(data)
+        if match:
+            try:
+                return build(*match.groups())
+            except ValueError:
+                # Некорректная дата или значение вне границ
+                return None
+    return None
+
+
+_LEGACY_STATIC: Dict[str, CallbackData] = {
+    "ignore": IgnoreCB(),
+    "back_to_main": BackToMainCB(),
+    "back_to_rooms": BackToRoomsCB(),
+    "phone_number": PhoneNumberCB(),
+    "call_support": CallSupportCB(),
+}
+
+_LEGACY_PATTERNS = [
+    (re.compile(r"room_type_(\w+)"), lambda room_type: RoomTypeCB(room_type=room_type)),
+    (re.compile(r"room_(\d+)"), lambda room_id: RoomCB(room_id=int(room_id))),
+    (re.compile(r"reviews_(\d+)"), lambda room_id: ReviewsCB(room_id=int(room_id))),
+    (re.compile(r"video_tour_(\d+)"), lambda room_id: VideoTourCB(room_id=int(room_id))),
+    (re.compile(r"all_photos_(\d+)"), lambda room_id: PhotosCB(room_id=int(room_id))),
+    (re.compile(r"quick_book_(\d+)"), lambda room_id: QuickBookCB(room_id=int(room_id))),
+    (re.compile(r"calendar_book_(\d+)"), lambda room_id: CalendarBookCB(room_id=int(room_id))),
+    (
+        re.compile(r"express_book_(\d+)_([\d-]+)_([\d-]+)"),
+        lambda room_id, check_in, check_out: ExpressBookCB.for_dates(
+            int(room_id), date.fromisoformat(check_in), date.fromisoformat(check_out)
+        )
+    ),
+]
+
+
+class CallbackDispatcher:
+    """Таблица префикс callback_data -> хендлер"""
+
+    def __init__(self):
+        # prefix -> (фабрика, хендлер, имена параметров или None - передавать все)
+        self._routes: Dict[str, Tuple[Type[CallbackData], Handler, Optional[frozenset]]] = {}
+        self.legacy = 0
+
+    def register(self, *factories: Type[CallbackData]) -> Callable[[Handler], Handler]:
+        """Декоратор: хендлер(callback, callback_data, ...) для кнопок этих фабрик"""
+
+        def decorator(handler: Handler) -> Handler:
+            parameters = inspect.signature(handler).parameters.values()
+            if any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters):
+                names = None
+            else:
+                names = frozenset(p.name for p in parameters)
+            for factory in factories:
+                if factory.__prefix__ in self._routes:
+                    raise ValueError(f"Callback prefix '{factory.__prefix__}' is already registered")
+                self._routes[factory.__prefix__] = (factory, handler, names)
+            return handler
+
+        return decorator
+
+    def resolve(self, data: Optional[str]) -> Optional[Tuple[Handler, CallbackData, Optional[frozenset]]]:
+        """Найти хендлер и разобрать callback_data"""
+        if not data:
+            return None
+        route = self._routes.get(data.split(":", 1)[0])
+        if route is not None:
+            factory, handler, names = route
+            try:
+                return handler, factory.unpack(data), names
+            except (TypeError, ValueError):
+                return None
+
+        callback_data = _legacy(data)
+        if callback_data is None:
+            return None
+        route = self._routes.get(callback_data.__prefix__)
+        if route is None:
+            return None
+        self.legacy += 1
+        return route[1], callback_data, route[2]
+
+    async def filter(self, callback: CallbackQuery) -> Union[bool, Dict[str, Any]]:
+        """Фильтр роутера: передает найденный маршрут в dispatch"""
+        resolved = self.resolve(callback.data)
+        if resolved is None:
+            return False
+        return {"callback_route": resolved}
+
+    async def dispatch(self, callback: CallbackQuery, callback_route, **data):
+        handler, callback_data, names = callback_route
+        data["callback_data"] = callback_data
+        if names is not None:
+            data = {name: value for name, value in data.items() if name in names}
+        return await handler(callback, **data)
+
+    @property
+    def prefixes(self):
+        return list(self._routes)
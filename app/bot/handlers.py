@@ -1,21 +1,30 @@
 from aiogram import F
-from aiogram.types import Message, CallbackQuery, InputMediaPhoto, WebAppInfo
+from aiogram.types import Message, CallbackQuery, WebAppInfo
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-import calendar
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
 import json
 import logging
 
 from app.bot.singleton_router import get_router
-from app.bot.keyboards import main_keyboard, rooms_keyboard, room_detail_keyboard, support_keyboard
+from app.cache import get_or_load, ROOMS_CACHE_KEY
+from app.bot.keyboards import main_keyboard, room_detail_keyboard, support_keyboard, keyboard_registry
+from app.bot.media import media_cache
+from app.bot.booking_calendar import month_skeleton, room_calendar
+from app.bot.callbacks import (
+    CallbackDispatcher, IgnoreCB, BackToMainCB, BackToRoomsCB, PhoneNumberCB, CallSupportCB,
+    RoomTypeCB, RoomCB, ReviewsCB, VideoTourCB, PhotosCB, QuickBookCB, ExpressBookCB,
+    CalendarBookCB, CalendarCB, SelectDateCB, BusyDateCB, UnselectDateCB
+)
 from app.database.crud import (
     get_user_by_telegram_id, create_user, get_all_rooms,
-    get_room, get_room_reviews, get_or_create_user, check_room_availability
+    get_room, get_room_reviews, get_or_create_user, upsert_user, check_room_availability
 )
 from app.database.models import User
+from app.database.pricing import quote_room
 from app.config import RESORT_PHONE, RESORT_ADMIN_USERNAME, RESORT_NAME, RESORT_LOCATION, RESORT_ALTITUDE, WEBAPP_URL
 
 # Настройка логирования
@@ -24,14 +33,18 @@ logger = logging.getLogger(__name__)
 # Get the singleton router instance
 router = get_router()
 
+# Все кнопки обрабатываются одним хендлером: префикс callback_data -> хендлер
+callbacks = CallbackDispatcher()
+router.callback_query.register(callbacks.dispatch, callbacks.filter)
+
 
 # Handler for /start command
 @router.message(Command("start"))
 async def cmd_start(message: Message, session: AsyncSession):
     logger.info(f"Start command from user {message.from_user.id}")
 
-    # Check if user exists in the database or create a new one
-    user = await get_or_create_user(
+    # Create the user or refresh their profile (cached for repeat users)
+    await upsert_user(
         session,
         telegram_id=message.from_user.id,
         username=message.from_user.username,
@@ -70,27 +83,46 @@ async def about_resort(message: Message):
     )
 
 
+async def get_rooms_for_keyboard(session: AsyncSession):
+    """Список номеров для клавиатуры (через кеш, одна загрузка на все промахи)"""
+    async def load_rooms():
+        rooms = await get_all_rooms(session)
+        return json.dumps([
+            {
+                "id": r.id,
+                "name": r.name,
+                "room_type": r.room_type,
+                "price_per_night": r.price_per_night,
+                "weekend_price": getattr(r, "weekend_price", None)
+            }
+            for r in rooms
+        ])
+
+    data = await get_or_load(ROOMS_CACHE_KEY, load_rooms, ttl=300)
+    return [SimpleNamespace(**room) for room in json.loads(data)]
+
+
 # Handler for "Rooms" button
 @router.message(F.text == "🛏️ Номера")
 async def show_rooms(message: Message, session: AsyncSession):
     logger.info(f"Show rooms from user {message.from_user.id}")
 
-    # Get rooms with await
-    rooms = await get_all_rooms(session)
+    # Номера загружаются только при пересборке клавиатуры
+    reply_markup = await keyboard_registry.rooms(lambda: get_rooms_for_keyboard(session))
 
     await message.answer(
         "🛏️ Выберите категорию номера для подробной информации:",
-        reply_markup=rooms_keyboard(rooms),
+        reply_markup=reply_markup,
         parse_mode=None
     )
 
 
 # Handler для групп номеров
-@router.callback_query(lambda c: c.data and c.data.startswith("room_type_"))
-async def room_type_info(callback: CallbackQuery, session: AsyncSession):
+@callbacks.register(RoomTypeCB)
+async def room_type_info(callback: CallbackQuery, callback_data: RoomTypeCB):
     logger.info(f"Room type info: {callback.data}")
 
-    room_type = callback.data.split("_")[2]
+    room_type = callback_data.room_type
 
     # Описания для разных типов номеров
     type_descriptions = {
@@ -115,16 +147,11 @@ async def room_type_info(callback: CallbackQuery, session: AsyncSession):
 
 
 # Handler for room selection - ИСПРАВЛЕННЫЙ
-@router.callback_query(lambda c: c.data and c.data.startswith("room_") and len(c.data.split("_")) == 2)
-async def room_details(callback: CallbackQuery, session: AsyncSession):
+@callbacks.register(RoomCB)
+async def room_details(callback: CallbackQuery, callback_data: RoomCB, session: AsyncSession):
     logger.info(f"Room details: {callback.data}")
 
-    try:
-        room_id = int(callback.data.split("_")[1])
-    except (ValueError, IndexError):
-        await callback.answer("Ошибка обработки запроса")
-        return
-
+    room_id = callback_data.room_id
     room = await get_room(session, room_id)
 
     if not room:
@@ -176,10 +203,11 @@ async def room_details(callback: CallbackQuery, session: AsyncSession):
         f"Для бронирования нажмите кнопку ниже."
     )
 
-    # Отправляем фото с описанием
+    # Отправляем фото с описанием (по file_id, если фото уже загружалось)
     if room.image_url:
-        await callback.message.answer_photo(
-            photo=room.image_url,
+        await media_cache.answer_photo(
+            callback.message,
+            room.image_url,
             caption=text,
             reply_markup=room_detail_keyboard(room.id, has_video=has_video),
             parse_mode=None
@@ -210,12 +238,12 @@ async def contact_support(message: Message):
 
 
 # Handler for phone number display
-@router.callback_query(F.data == "phone_number")
+@callbacks.register(PhoneNumberCB)
 async def show_phone_number(callback: CallbackQuery):
     await callback.answer(f"Телефон администратора: {RESORT_PHONE}")
 
 
-@router.callback_query(F.data == "call_support")
+@callbacks.register(CallSupportCB)
 async def call_support(callback: CallbackQuery):
     await callback.message.answer(
         "📞 Позвонить администратору\n\n"
@@ -241,7 +269,7 @@ async def show_reviews(message: Message, session: AsyncSession):
 
 
 # Handler for returning to main menu
-@router.callback_query(F.data == "back_to_main")
+@callbacks.register(BackToMainCB)
 async def back_to_main(callback: CallbackQuery):
     await callback.message.answer(
         "Вы вернулись в главное меню.",
@@ -252,12 +280,12 @@ async def back_to_main(callback: CallbackQuery):
 
 
 # Handler for returning to rooms list
-@router.callback_query(F.data == "back_to_rooms")
+@callbacks.register(BackToRoomsCB)
 async def back_to_rooms(callback: CallbackQuery, session: AsyncSession):
-    rooms = await get_all_rooms(session)
+    reply_markup = await keyboard_registry.rooms(lambda: get_rooms_for_keyboard(session))
     await callback.message.answer(
         "🛏️ Выберите категорию номера для подробной информации:",
-        reply_markup=rooms_keyboard(rooms),
+        reply_markup=reply_markup,
         parse_mode=None
     )
     await callback.message.delete()
@@ -265,9 +293,9 @@ async def back_to_rooms(callback: CallbackQuery, session: AsyncSession):
 
 
 # Handler for room reviews
-@router.callback_query(lambda c: c.data and c.data.startswith("reviews_"))
-async def room_reviews(callback: CallbackQuery, session: AsyncSession):
-    room_id = int(callback.data.split("_")[1])
+@callbacks.register(ReviewsCB)
+async def room_reviews(callback: CallbackQuery, callback_data: ReviewsCB, session: AsyncSession):
+    room_id = callback_data.room_id
     reviews = await get_room_reviews(session, room_id)
     room = await get_room(session, room_id)
 
@@ -290,11 +318,11 @@ async def room_reviews(callback: CallbackQuery, session: AsyncSession):
 # =================== ВИДЕО ФУНКЦИИ ===================
 
 # Handler для видео-туров - ИСПРАВЛЕННАЯ ВЕРСИЯ
-@router.callback_query(lambda c: c.data and c.data.startswith("video_tour_"))
-async def show_video_tour(callback: CallbackQuery, session: AsyncSession):
+@callbacks.register(VideoTourCB)
+async def show_video_tour(callback: CallbackQuery, callback_data: VideoTourCB, session: AsyncSession):
     logger.info(f"Video tour: {callback.data}")
 
-    room_id = int(callback.data.split("_")[2])
+    room_id = callback_data.room_id
     room = await get_room(session, room_id)
 
     if not room:
@@ -308,9 +336,9 @@ async def show_video_tour(callback: CallbackQuery, session: AsyncSession):
             f"🎥 Видео-тур для номера \"{room.name}\" временно недоступен.\n\n"
             f"Вы можете посмотреть фотографии номера или связаться с нами для виртуальной экскурсии.",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="📸 Смотреть фото", callback_data=f"all_photos_{room_id}")],
-                [InlineKeyboardButton(text="📞 Связаться", callback_data="call_support")],
-                [InlineKeyboardButton(text="🔙 Назад", callback_data=f"room_{room_id}")]
+                [InlineKeyboardButton(text="📸 Смотреть фото", callback_data=PhotosCB(room_id=room_id).pack())],
+                [InlineKeyboardButton(text="📞 Связаться", callback_data=CallSupportCB().pack())],
+                [InlineKeyboardButton(text="🔙 Назад", callback_data=RoomCB(room_id=room_id).pack())]
             ])
         )
         await callback.answer("Видео временно недоступно")
@@ -319,7 +347,7 @@ async def show_video_tour(callback: CallbackQuery, session: AsyncSession):
     # Если видео есть - отправляем ссылку
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="▶️ Смотреть видео", url=room.video_url)],
-        [InlineKeyboardButton(text="🔙 Назад к номеру", callback_data=f"room_{room_id}")]
+        [InlineKeyboardButton(text="🔙 Назад к номеру", callback_data=RoomCB(room_id=room_id).pack())]
     ])
 
     await callback.message.answer(
@@ -354,7 +382,7 @@ async def virtual_tours_menu(message: Message):
             url="https://www.google.com/maps/@41.2995,69.2401,3a,75y,90t/data=!3m6!1e1!3m4!1s0x0:0x0!2e0!7i13312!8i6656"
             # Пример
         )],
-        [InlineKeyboardButton(text="🔙 Главное меню", callback_data="back_to_main")]
+        [InlineKeyboardButton(text="🔙 Главное меню", callback_data=BackToMainCB().pack())]
     ])
 
     await message.answer(
@@ -367,11 +395,11 @@ async def virtual_tours_menu(message: Message):
 
 
 # Handler для показа всех фото номера
-@router.callback_query(lambda c: c.data and c.data.startswith("all_photos_"))
-async def show_all_photos(callback: CallbackQuery, session: AsyncSession):
+@callbacks.register(PhotosCB)
+async def show_all_photos(callback: CallbackQuery, callback_data: PhotosCB, session: AsyncSession):
     logger.info(f"All photos: {callback.data}")
 
-    room_id = int(callback.data.split("_")[2])
+    room_id = callback_data.room_id
     room = await get_room(session, room_id)
 
     if not room:
@@ -387,17 +415,8 @@ async def show_all_photos(callback: CallbackQuery, session: AsyncSession):
             photos = []
 
     if photos:
-        # Отправляем альбом фотографий
-        media_group = []
-        for i, photo_url in enumerate(photos[:10]):  # Максимум 10 фото в альбоме
-            media_group.append(
-                InputMediaPhoto(
-                    media=photo_url,
-                    caption=f"{room.name} - фото {i + 1}" if i == 0 else None
-                )
-            )
-
-        await callback.message.answer_media_group(media_group)
+        # Отправляем альбом фотографий (максимум 10), уже загруженные - по file_id
+        await media_cache.answer_media_group(callback.message, photos, caption=f"{room.name} - фото 1")
 
         # Если фото больше 10, сообщаем об этом
         if len(photos) > 10:
@@ -409,7 +428,7 @@ async def show_all_photos(callback: CallbackQuery, session: AsyncSession):
                         text="📸 Смотреть все фото",
                         web_app=WebAppInfo(url=f"{WEBAPP_URL}?room_id={room_id}&tab=photos")
                     )],
-                    [InlineKeyboardButton(text="🔙 Назад", callback_data=f"room_{room_id}")]
+                    [InlineKeyboardButton(text="🔙 Назад", callback_data=RoomCB(room_id=room_id).pack())]
                 ])
             )
     else:
@@ -423,91 +442,18 @@ async def show_all_photos(callback: CallbackQuery, session: AsyncSession):
 
 # =================== БЫСТРОЕ БРОНИРОВАНИЕ ===================
 
-# Генератор календаря для выбора дат
+# Генератор календаря для выбора дат (без занятости номера)
 def generate_calendar_keyboard(year: int, month: int, selected_dates: list = None):
-    if selected_dates is None:
-        selected_dates = []
-
-    keyboard = []
-
-    # Заголовок с месяцем и годом
-    month_name = calendar.month_name[month]
-    header = [InlineKeyboardButton(
-        text=f"{month_name} {year}",
-        callback_data="ignore"
-    )]
-    keyboard.append(header)
-
-    # Дни недели
-    week_days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-    keyboard.append([
-        InlineKeyboardButton(text=day, callback_data="ignore")
-        for day in week_days
-    ])
-
-    # Календарь
-    cal = calendar.monthcalendar(year, month)
-    today = datetime.now().date()
-
-    for week in cal:
-        row = []
-        for day in week:
-            if day == 0:
-                row.append(InlineKeyboardButton(text=" ", callback_data="ignore"))
-            else:
-                date = datetime(year, month, day).date()
-
-                # Проверяем, не прошедшая ли это дата
-                if date < today:
-                    row.append(InlineKeyboardButton(
-                        text=f"·{day}·",
-                        callback_data="ignore"
-                    ))
-                # Проверяем, выбрана ли дата
-                elif date in selected_dates:
-                    row.append(InlineKeyboardButton(
-                        text=f"✅ {day}",
-                        callback_data=f"unselect_date_{date.isoformat()}"
-                    ))
-                # Выходные дни подсвечиваем
-                elif date.weekday() in [4, 5, 6]:  # Пт, Сб, Вс
-                    row.append(InlineKeyboardButton(
-                        text=f"🔴 {day}",
-                        callback_data=f"select_date_{date.isoformat()}"
-                    ))
-                else:
-                    row.append(InlineKeyboardButton(
-                        text=str(day),
-                        callback_data=f"select_date_{date.isoformat()}"
-                    ))
-        keyboard.append(row)
-
-    # Навигация
-    nav_row = []
-    if month > 1 or year > datetime.now().year:
-        nav_row.append(InlineKeyboardButton(
-            text="◀️",
-            callback_data=f"calendar_{year}_{month - 1 if month > 1 else 12}_{year if month > 1 else year - 1}"
-        ))
-    nav_row.append(InlineKeyboardButton(
-        text="📅 Сегодня",
-        callback_data=f"calendar_{datetime.now().year}_{datetime.now().month}_current"
-    ))
-    nav_row.append(InlineKeyboardButton(
-        text="▶️",
-        callback_data=f"calendar_{year}_{month + 1 if month < 12 else 1}_{year if month < 12 else year + 1}"
-    ))
-    keyboard.append(nav_row)
-
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    return month_skeleton(year, month, date.today()).render(selected=selected_dates or ())
 
 
 # Быстрое бронирование
-@router.callback_query(lambda c: c.data and c.data.startswith("quick_book_"))
-async def quick_booking(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
+@callbacks.register(QuickBookCB)
+async def quick_booking(callback: CallbackQuery, callback_data: QuickBookCB, session: AsyncSession,
+                        state: FSMContext):
     logger.info(f"Quick booking: {callback.data}")
 
-    room_id = int(callback.data.split("_")[2])
+    room_id = callback_data.room_id
     room = await get_room(session, room_id)
 
     if not room:
@@ -524,19 +470,19 @@ async def quick_booking(callback: CallbackQuery, session: AsyncSession, state: F
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
             text="🚀 Сегодня-Завтра",
-            callback_data=f"express_book_{room_id}_{today}_{today + timedelta(days=1)}"
+            callback_data=ExpressBookCB.for_dates(room_id, today, today + timedelta(days=1)).pack()
         )],
         [InlineKeyboardButton(
             text="🎉 Ближайшие выходные",
-            callback_data=f"express_book_{room_id}_{weekend}_{weekend + timedelta(days=2)}"
+            callback_data=ExpressBookCB.for_dates(room_id, weekend, weekend + timedelta(days=2)).pack()
         )],
         [InlineKeyboardButton(
             text="📅 Выбрать даты в календаре",
-            callback_data=f"calendar_book_{room_id}"
+            callback_data=CalendarBookCB(room_id=room_id).pack()
         )],
         [InlineKeyboardButton(
             text="🔙 Назад",
-            callback_data=f"room_{room_id}"
+            callback_data=RoomCB(room_id=room_id).pack()
         )]
     ])
 
@@ -551,15 +497,104 @@ async def quick_booking(callback: CallbackQuery, session: AsyncSession, state: F
     await callback.answer()
 
 
+# Календарь выбора дат с занятостью номера
+@callbacks.register(CalendarBookCB)
+async def calendar_booking(callback: CallbackQuery, callback_data: CalendarBookCB, session: AsyncSession,
+                           state: FSMContext):
+    room_id = callback_data.room_id
+    await state.update_data(room_id=room_id, check_in=None)
+
+    today = date.today()
+    await callback.message.answer(
+        "📅 Выберите дату заезда.\n✖️ - номер занят, 🔴 - выходные дни",
+        reply_markup=await room_calendar(session, room_id, today.year, today.month)
+    )
+    await callback.answer()
+
+
+@callbacks.register(CalendarCB)
+async def calendar_navigation(callback: CallbackQuery, callback_data: CalendarCB, session: AsyncSession,
+                              state: FSMContext):
+    year, month = callback_data.year, callback_data.month
+    if not 1 <= month <= 12:
+        await callback.answer()
+        return
+
+    data = await state.get_data()
+    room_id = data.get("room_id")
+    selected = [date.fromisoformat(data["check_in"])] if data.get("check_in") else []
+    if room_id:
+        reply_markup = await room_calendar(session, room_id, year, month, selected)
+    else:
+        reply_markup = generate_calendar_keyboard(year, month, selected)
+
+    await callback.message.edit_reply_markup(reply_markup=reply_markup)
+    await callback.answer()
+
+
+@callbacks.register(SelectDateCB, BusyDateCB)
+async def select_date(callback: CallbackQuery, callback_data: SelectDateCB, session: AsyncSession,
+                      state: FSMContext):
+    day = callback_data.date
+    data = await state.get_data()
+    room_id = data.get("room_id")
+    if not room_id:
+        await callback.answer("Сначала выберите номер", show_alert=True)
+        return
+
+    check_in = date.fromisoformat(data["check_in"]) if data.get("check_in") else None
+    if check_in is not None and day > check_in:
+        # Вторая дата - выезд; занятой может быть ночь после выезда, поэтому
+        # доступность периода проверяет _offer_booking
+        await state.update_data(check_in=None)
+        await _offer_booking(callback, session, room_id, check_in, day)
+        return
+
+    if isinstance(callback_data, BusyDateCB):
+        await callback.answer("❌ Номер занят в эту ночь", show_alert=True)
+        return
+
+    await state.update_data(check_in=day.isoformat())
+    await callback.message.edit_reply_markup(
+        reply_markup=await room_calendar(session, room_id, day.year, day.month, [day])
+    )
+    await callback.answer("Теперь выберите дату выезда")
+
+
+@callbacks.register(UnselectDateCB)
+async def unselect_date(callback: CallbackQuery, callback_data: UnselectDateCB, session: AsyncSession,
+                        state: FSMContext):
+    day = callback_data.date
+    await state.update_data(check_in=None)
+    room_id = (await state.get_data()).get("room_id")
+    if room_id:
+        reply_markup = await room_calendar(session, room_id, day.year, day.month)
+    else:
+        reply_markup = generate_calendar_keyboard(day.year, day.month)
+    await callback.message.edit_reply_markup(reply_markup=reply_markup)
+    await callback.answer()
+
+
+@callbacks.register(IgnoreCB)
+async def ignore_callback(callback: CallbackQuery):
+    await callback.answer()
+
+
 # Экспресс-бронирование
-@router.callback_query(lambda c: c.data and c.data.startswith("express_book_"))
-async def express_booking(callback: CallbackQuery, session: AsyncSession):
+@callbacks.register(ExpressBookCB)
+async def express_booking(callback: CallbackQuery, callback_data: ExpressBookCB, session: AsyncSession):
     logger.info(f"Express booking: {callback.data}")
 
-    parts = callback.data.split("_")
-    room_id = int(parts[2])
-    check_in = datetime.fromisoformat(parts[3]).date()
-    check_out = datetime.fromisoformat(parts[4]).date()
+    await _offer_booking(callback, session, callback_data.room_id, callback_data.check_in, callback_data.check_out)
+
+
+async def _offer_booking(callback: CallbackQuery, session: AsyncSession, room_id: int,
+                         check_in: date, check_out: date):
+    """Проверить даты и предложить завершить бронирование в веб-приложении"""
+    room = await get_room(session, room_id)
+    if not room:
+        await callback.answer("Номер не найден")
+        return
 
     # Проверяем доступность
     is_available = await check_room_availability(
@@ -572,23 +607,13 @@ async def express_booking(callback: CallbackQuery, session: AsyncSession):
         await callback.answer("❌ К сожалению, номер занят на эти даты", show_alert=True)
         return
 
-    # Рассчитываем стоимость
-    room = await get_room(session, room_id)
-    nights = (check_out - check_in).days
-
-    # Считаем выходные дни
-    weekend_nights = 0
-    current = check_in
-    while current < check_out:
-        if current.weekday() in [4, 5, 6]:  # Пт, Сб, Вс
-            weekend_nights += 1
-        current += timedelta(days=1)
-
-    weekday_nights = nights - weekend_nights
+    # Рассчитываем стоимость (будни/выходные)
+    quote = quote_room(room, check_in, check_out)
 
-    # Используем getattr для безопасного доступа к weekend_price
-    weekend_price = getattr(room, 'weekend_price', room.price_per_night)
-    total_price = (weekday_nights * room.price_per_night) + (weekend_nights * weekend_price)
+    nights = quote["nights"]
+    weekday_nights = quote["weekday_nights"]
+    weekend_nights = quote["weekend_nights"]
+    total_price = quote["total_price"]
 
     # Отправляем в веб-приложение для завершения бронирования
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -598,7 +623,7 @@ async def express_booking(callback: CallbackQuery, session: AsyncSession):
         )],
         [InlineKeyboardButton(
             text="❌ Отмена",
-            callback_data=f"room_{room_id}"
+            callback_data=RoomCB(room_id=room_id).pack()
         )]
     ])
 
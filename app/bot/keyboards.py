@@ -1,9 +1,29 @@
+"""
+Клавиатуры бота.
+
+Статические клавиатуры (главное меню, поддержка, помощник, акции) строятся
+один раз при импорте, функции возвращают готовые объекты - их нельзя
+изменять. Клавиатура списка номеров строится один раз на версию каталога
+номеров (KeyboardRegistry): повторные показы не обращаются ни к базе, ни к
+кешу номеров, а invalidate() при изменении номеров сбрасывает ее.
+"""
+import time
+from functools import lru_cache
+from typing import Awaitable, Callable, Optional, Sequence
+
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
+from app.bot.callbacks import (
+    BackToMainCB, BackToRoomsCB, CallSupportCB, PhotosCB, ReviewsCB, RoomCB, RoomTypeCB, VideoTourCB
+)
 from app.config import WEBAPP_URL, RESORT_PHONE, RESORT_ADMIN_USERNAME
 
+# Сколько секунд клавиатура номеров считается актуальной без invalidate()
+# (номера могут меняться и в обход приложения)
+ROOMS_KEYBOARD_TTL = 300
+
 
 # Главная клавиатура с новыми функциями
-def main_keyboard():
+def _build_main_keyboard():
     kb = [
         [KeyboardButton(text="🏨 О курорте"), KeyboardButton(text="🛏️ Номера")],
         [KeyboardButton(text="📝 Бронирование", web_app=WebAppInfo(url=WEBAPP_URL))],
@@ -35,7 +55,7 @@ def rooms_keyboard(rooms):
 
         if type_rooms:
             # Добавляем заголовок типа
-            kb.append([InlineKeyboardButton(text=f"🏠 {type_name}", callback_data=f"room_type_{room_type}")])
+            kb.append([InlineKeyboardButton(text=f"🏠 {type_name}", callback_data=RoomTypeCB(room_type=room_type).pack())])
 
             # Добавляем кнопки для каждого номера этого типа
             for room in type_rooms:
@@ -47,41 +67,42 @@ def rooms_keyboard(rooms):
                 kb.append([
                     InlineKeyboardButton(
                         text=f"{room.name} - {price_text}",
-                        callback_data=f"room_{room.id}"
+                        callback_data=RoomCB(room_id=room.id).pack()
                     )
                 ])
 
-    kb.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_main")])
+    kb.append([InlineKeyboardButton(text="🔙 Назад", callback_data=BackToMainCB().pack())])
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
 
 # Клавиатура для детального просмотра номера с видео
+@lru_cache(maxsize=512)
 def room_detail_keyboard(room_id, has_video=False):
     kb = [
         [
             InlineKeyboardButton(text="📝 Забронировать", web_app=WebAppInfo(url=f"{WEBAPP_URL}?room_id={room_id}")),
-            InlineKeyboardButton(text="⭐ Отзывы", callback_data=f"reviews_{room_id}")
+            InlineKeyboardButton(text="⭐ Отзывы", callback_data=ReviewsCB(room_id=room_id).pack())
         ]
     ]
 
     # Добавляем кнопки для медиа
     media_buttons = []
     if has_video:
-        media_buttons.append(InlineKeyboardButton(text="🎥 Видео-тур", callback_data=f"video_tour_{room_id}"))
-    media_buttons.append(InlineKeyboardButton(text="📸 Все фото", callback_data=f"all_photos_{room_id}"))
+        media_buttons.append(InlineKeyboardButton(text="🎥 Видео-тур", callback_data=VideoTourCB(room_id=room_id).pack()))
+    media_buttons.append(InlineKeyboardButton(text="📸 Все фото", callback_data=PhotosCB(room_id=room_id).pack()))
 
     if media_buttons:
         kb.append(media_buttons)
 
     kb.extend([
-        [InlineKeyboardButton(text="⭐ Отзывы", callback_data=f"reviews_{room_id}")],
-        [InlineKeyboardButton(text="🔙 Назад к списку", callback_data="back_to_rooms")]
+        [InlineKeyboardButton(text="⭐ Отзывы", callback_data=ReviewsCB(room_id=room_id).pack())],
+        [InlineKeyboardButton(text="🔙 Назад к списку", callback_data=BackToRoomsCB().pack())]
     ])
 
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
 # Клавиатура умного помощника
-def assistant_keyboard():
+def _build_assistant_keyboard():
     kb = [
         [
             InlineKeyboardButton(text="🏠 Подобрать номер", callback_data="assist_room_selection"),
@@ -131,8 +152,10 @@ def my_bookings_keyboard(bookings):
     )])
 
     return InlineKeyboardMarkup(inline_keyboard=kb)
+
+
 # Клавиатура для акций и спецпредложений
-def promotions_keyboard():
+def _build_promotions_keyboard():
     kb = [
         [InlineKeyboardButton(text="🎁 Скидка выходного дня", callback_data="promo_weekend")],
         [InlineKeyboardButton(text="👨‍👩‍👧‍👦 Семейный пакет", callback_data="promo_family")],
@@ -144,12 +167,74 @@ def promotions_keyboard():
 
 
 # Support keyboard с обновленной контактной информацией
-def support_keyboard():
+def _build_support_keyboard():
     kb = [
         [
-            InlineKeyboardButton(text="📱 Позвонить", callback_data="call_support"),
+            InlineKeyboardButton(text="📱 Позвонить", callback_data=CallSupportCB().pack()),
             InlineKeyboardButton(text="✉️ Написать администратору", url=f"https://t.me/{RESORT_ADMIN_USERNAME}")
         ],
-        [InlineKeyboardButton(text="🔙 Главное меню", callback_data="back_to_main")]
+        [InlineKeyboardButton(text="🔙 Главное меню", callback_data=BackToMainCB().pack())]
     ]
-    return InlineKeyboardMarkup(inline_keyboard=kb)
\ No newline at end of file
+    return InlineKeyboardMarkup(inline_keyboard=kb)
+
+
+# Статические клавиатуры - один экземпляр на процесс
+MAIN_KEYBOARD = _build_main_keyboard()
+ASSISTANT_KEYBOARD = _build_assistant_keyboard()
+PROMOTIONS_KEYBOARD = _build_promotions_keyboard()
+SUPPORT_KEYBOARD = _build_support_keyboard()
+
+
+def main_keyboard():
+    return MAIN_KEYBOARD
+
+
+def assistant_keyboard():
+    return ASSISTANT_KEYBOARD
+
+
+def promotions_keyboard():
+    return PROMOTIONS_KEYBOARD
+
+
+def support_keyboard():
+    return SUPPORT_KEYBOARD
+
+
+class KeyboardRegistry:
+    """Клавиатуры, зависящие от каталога номеров; строятся один раз на версию каталога"""
+
+    def __init__(self, ttl: float = ROOMS_KEYBOARD_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._rooms: Optional[InlineKeyboardMarkup] = None
+        self._rooms_expires = 0.0
+        self.builds = 0
+        self.hits = 0
+
+    async def rooms(self, load_rooms: Callable[[], Awaitable[Sequence]]) -> InlineKeyboardMarkup:
+        """Клавиатура списка номеров; load_rooms вызывается только при ее пересборке"""
+        if self._rooms is not None and time.monotonic() < self._rooms_expires:
+            self.hits += 1
+            return self._rooms
+
+        version = self.version
+        markup = rooms_keyboard(await load_rooms())
+        self.builds += 1
+        # Если во время загрузки номера изменились, не сохраняем устаревшую клавиатуру
+        if version == self.version:
+            self._rooms = markup
+            self._rooms_expires = time.monotonic() + self.ttl
+        return markup
+
+    def invalidate(self):
+        """Номера изменились: пересобрать клавиатуры при следующем показе"""
+        self.version += 1
+        self._rooms = None
+        room_detail_keyboard.cache_clear()
+
+    def stats(self):
+        return {"version": self.version, "builds": self.builds, "hits": self.hits}
+
+
+keyboard_registry = KeyboardRegistry()
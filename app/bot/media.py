@@ -0,0 +1,221 @@
+"""
+Кеш file_id Telegram для фотографий номеров.
+
+При первой отправке фото по URL Telegram сам скачивает файл (для imgur это
+секунды и иногда ошибка). file_id из ответа (Message.photo) сохраняется в
+таблице media_files, и следующие отправки того же URL используют file_id -
+без повторной загрузки.
+
+Кеш загружается из базы при первом обращении. При загрузке удаляются записи
+для URL, которые больше не встречаются в rooms.image_url / rooms.photos;
+invalidate() (изменение номеров) сбрасывает кеш до следующего обращения.
+Скрипт warm_media.py заранее загружает все фото номеров в чат администратора.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputMediaPhoto, Message
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.database.crud import delete_media_files, get_media_file_ids, save_media_file_ids
+from app.database.models import Room
+
+logger = logging.getLogger(__name__)
+
+# Максимум фото в альбоме Telegram
+MEDIA_GROUP_LIMIT = 10
+
+
+def room_media_urls(image_url: Optional[str], photos: Optional[str]) -> List[str]:
+    """URL главного фото и галереи номера (photos - JSON-массив)"""
+    urls = [image_url] if image_url else []
+    if photos:
+        try:
+            urls.extend(url for url in json.loads(photos) if isinstance(url, str))
+        except (TypeError, ValueError):
+            pass
+    return list(dict.fromkeys(urls))
+
+
+async def all_room_media_urls() -> List[str]:
+    async with SessionLocal() as session:
+        rows = (await session.execute(select(Room.image_url, Room.photos).order_by(Room.id))).all()
+    urls: List[str] = []
+    for row in rows:
+        urls.extend(room_media_urls(row.image_url, row.photos))
+    return list(dict.fromkeys(urls))
+
+
+def _photo_file_id(message: Message) -> Optional[str]:
+    # Самый большой размер - последний
+    return message.photo[-1].file_id if message and message.photo else None
+
+
+class MediaCache:
+    """URL -> file_id с хранением в базе"""
+
+    def __init__(self):
+        self._file_ids: Optional[Dict[str, str]] = None
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.uploads = 0
+        self.stale = 0
+
+    async def _load(self) -> Dict[str, str]:
+        if self._file_ids is not None:
+            return self._file_ids
+        async with self._lock:
+            if self._file_ids is None:
+                async with SessionLocal() as session:
+                    file_ids = await get_media_file_ids(session)
+                unused = set(file_ids) - set(await all_room_media_urls())
+                if unused:
+                    await delete_media_files(None, list(unused))
+                    logger.info(f"Removed {len(unused)} file_ids of media no longer used by rooms")
+                self._file_ids = {url: file_id for url, file_id in file_ids.items() if url not in unused}
+        return self._file_ids
+
+    def invalidate(self):
+        """Перечитать кеш из базы при следующем обращении"""
+        self._file_ids = None
+
+    async def get(self, url: str) -> Optional[str]:
+        file_id = (await self._load()).get(url)
+        if file_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return file_id
+
+    async def remember(self, file_ids: Dict[str, str]):
+        """Сохранить file_id, полученные при загрузке"""
+        file_ids = {url: file_id for url, file_id in file_ids.items() if file_id}
+        if not file_ids:
+            return
+        try:
+            await save_media_file_ids(None, file_ids)
+        except Exception as e:
+            logger.error(f"Error saving file_ids: {e}")
+        (await self._load()).update(file_ids)
+        self.uploads += len(file_ids)
+
+    async def forget(self, urls: Iterable[str]):
+        urls = list(urls)
+        file_ids = await self._load()
+        for url in urls:
+            file_ids.pop(url, None)
+        await delete_media_files(None, urls)
+
+    async def answer_photo(self, message: Message, url: str, **kwargs) -> Message:
+        """message.answer_photo по URL, с file_id вместо URL, если он известен"""
+        file_id = await self.get(url)
+        if file_id is not None:
+            try:
+                return await message.answer_photo(photo=file_id, **kwargs)
+            except TelegramBadRequest as e:
+                # file_id больше не действителен - загружаем заново по URL
+                logger.warning(f"Cached file_id for {url} rejected: {e}")
+                self.stale += 1
+                await self.forget([url])
+
+        sent = await message.answer_photo(photo=url, **kwargs)
+        await self.remember({url: _photo_file_id(sent)})
+        return sent
+
+    async def _media_group(self, urls: List[str], caption: Optional[str]) -> List[InputMediaPhoto]:
+        file_ids = await self._load()
+        media = []
+        for i, url in enumerate(urls):
+            file_id = file_ids.get(url)
+            if file_id is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            media.append(InputMediaPhoto(media=file_id or url, caption=caption if i == 0 else None))
+        return media
+
+    async def answer_media_group(self, message: Message, urls: List[str],
+                                 caption: Optional[str] = None) -> List[Message]:
+        """Альбом из фото по URL (не больше MEDIA_GROUP_LIMIT), с file_id для известных"""
+        urls = urls[:MEDIA_GROUP_LIMIT]
+        media = await self._media_group(urls, caption)
+        try:
+            sent = await message.answer_media_group(media)
+        except TelegramBadRequest as e:
+            if all(item.media == url for item, url in zip(media, urls)):
+                raise
+            logger.warning(f"Media group with cached file_ids rejected: {e}")
+            self.stale += 1
+            await self.forget(urls)
+            sent = await message.answer_media_group(await self._media_group(urls, caption))
+
+        await self.remember({
+            url: _photo_file_id(msg)
+            for url, item, msg in zip(urls, media, sent)
+            if item.media == url
+        })
+        return sent
+
+    async def warm_up(self, bot: Bot, chat_id: int, urls: Optional[List[str]] = None) -> Dict[str, int]:
+        """Загрузить в чат все фото номеров без file_id, сохранить file_id и удалить сообщения"""
+        if urls is None:
+            urls = await all_room_media_urls()
+        file_ids = await self._load()
+        pending = [url for url in urls if url not in file_ids]
+        failed: Set[str] = set()
+
+        for start in range(0, len(pending), MEDIA_GROUP_LIMIT):
+            chunk = pending[start:start + MEDIA_GROUP_LIMIT]
+            try:
+                if len(chunk) > 1:
+                    sent = await bot.send_media_group(
+                        chat_id, [InputMediaPhoto(media=url) for url in chunk], disable_notification=True
+                    )
+                else:
+                    sent = [await bot.send_photo(chat_id, chunk[0], disable_notification=True)]
+            except TelegramBadRequest as e:
+                # Одно плохое фото ломает весь альбом - загружаем по одному
+                logger.warning(f"Media group upload failed ({e}), uploading one by one")
+                sent = []
+                for url in chunk:
+                    try:
+                        sent.append(await bot.send_photo(chat_id, url, disable_notification=True))
+                    except TelegramBadRequest as photo_error:
+                        logger.error(f"Failed to upload {url}: {photo_error}")
+                        failed.add(url)
+                        sent.append(None)
+
+            await self.remember({url: _photo_file_id(msg) for url, msg in zip(chunk, sent) if msg})
+            message_ids = [msg.message_id for msg in sent if msg]
+            if message_ids:
+                try:
+                    await bot.delete_messages(chat_id, message_ids)
+                except Exception as e:
+                    logger.warning(f"Could not delete warm-up messages: {e}")
+
+        result = {
+            "total": len(urls),
+            "cached": len(urls) - len(pending),
+            "uploaded": len(pending) - len(failed),
+            "failed": len(failed),
+        }
+        logger.info(f"Media warm-up: {result}")
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._file_ids) if self._file_ids is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "uploads": self.uploads,
+            "stale": self.stale,
+        }
+
+
+media_cache = MediaCache()
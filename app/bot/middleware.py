@@ -1,25 +1,59 @@
+import inspect
 from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery
-from app.database import SessionLocal, USE_ASYNC
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+
+# Флаг в session.info: сессия брала соединение из пула
+DB_USED = "db_used"
+
+
+@event.listens_for(Session, "after_begin")
+def _mark_db_used(session, transaction, connection):
+    session.info[DB_USED] = True
+
 
 class DatabaseMiddleware(BaseMiddleware):
+    """Сессия БД на каждое обновление.
+
+    Сессия берет соединение из пула только при первом запросе, поэтому
+    обновления без обращения к базе соединение не занимают. Статистика
+    считает обновления, сессия которых действительно получила соединение
+    (событие after_begin).
+    """
+
+    def __init__(self):
+        self.updates_with_db = 0
+        self.updates_without_db = 0
+
     async def __call__(
             self,
             handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
             event: Message | CallbackQuery,
             data: Dict[str, Any]
     ) -> Any:
-        if USE_ASYNC:
-            # Use async session
-            async with SessionLocal() as session:
-                data["session"] = session
-                return await handler(event, data)
-        else:
-            # Use sync session
-            session = SessionLocal()
-            data["session"] = session
-            try:
-                return await handler(event, data)
-            finally:
-                session.close()
\ No newline at end of file
+        session = SessionLocal()
+        data["session"] = session
+        try:
+            return await handler(event, data)
+        finally:
+            # AsyncSession хранит info в sync_session
+            if getattr(session, "sync_session", session).info.get(DB_USED):
+                self.updates_with_db += 1
+            else:
+                self.updates_without_db += 1
+            # Закрываем и async, и sync сессии
+            result = session.close()
+            if inspect.isawaitable(result):
+                await result
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.updates_with_db + self.updates_without_db
+        return {
+            "updates": total,
+            "with_db": self.updates_with_db,
+            "without_db": self.updates_without_db,
+            "db_ratio": round(self.updates_with_db / total, 3) if total else 0,
+        }
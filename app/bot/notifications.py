@@ -1,94 +1,200 @@
-# app/bot/notifications.py
+"""
+Автоматические уведомления гостям и администратору.
+
+Задачи напоминаний выбирают только нужные колонки (telegram_id, username,
+название номера, даты) запросом с JOIN, без загрузки объектов Booking и
+ленивых обращений к booking.user / booking.room. Строки читаются порциями по
+FETCH_CHUNK (по id), и транзакция чтения завершается до отправки порции:
+отправка ждет лимитов Telegram, а открытое чтение держало бы соединение из
+пула и снимок WAL (SQLite не смог бы сделать checkpoint). Количество
+запросов задачи зависит только от числа порций.
+"""
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Any, AsyncIterator, List, Tuple
 
-import asyncio
-from datetime import datetime, timedelta
 from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from sqlalchemy import select, and_, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
-from app.database.models import Booking, User
-from app.config import BOT_TOKEN, ADMIN_TELEGRAM_ID
-import logging
-# 5. Обновите app/bot/notifications.py - используйте BatchMessageSender:
+
 from app.bot.batch_sender import BatchMessageSender
+from app.bot.broadcast import broadcast
+from app.bot.scheduler import Scheduler
+from app.config import ADMIN_TELEGRAM_ID, RESORT_LOCATION
+from app.database import SessionLocal
+from app.database.models import Booking, User, Room
 
+logger = logging.getLogger(__name__)
 
-async def send_reminder_24h(self, session: AsyncSession):
-    """Отправка напоминаний за 24 часа до заезда"""
-    tomorrow = datetime.now() + timedelta(days=1)
-    tomorrow_start = tomorrow.replace(hour=0, minute=0, second=0)
-    tomorrow_end = tomorrow.replace(hour=23, minute=59, second=59)
+# Сколько бронирований читать одним запросом
+FETCH_CHUNK = 200
 
-    # Получаем все данные одним запросом
-    result = await session.execute(
-        select(Booking)
-        .options(
-            selectinload(Booking.user),
-            selectinload(Booking.room)
-        )
-        .where(
-            and_(
-                Booking.check_in >= tomorrow_start,
-                Booking.check_in <= tomorrow_end,
-                Booking.status == "confirmed"
-            )
+
+def _day_range(day: date) -> Tuple[datetime, datetime]:
+    """Начало дня и начало следующего дня - для сравнения с DateTime колонками"""
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def _guest_bookings(*conditions):
+    """Колонки бронирования, гостя и номера одним запросом с JOIN"""
+    return (
+        select(
+            Booking.id,
+            Booking.check_in,
+            Booking.check_out,
+            User.telegram_id,
+            User.username,
+            Room.name.label("room_name"),
         )
+        .join(User, Booking.user_id == User.id)
+        .join(Room, Booking.room_id == Room.id)
+        .where(and_(*conditions))
+        .order_by(Booking.id)
     )
-    bookings = result.scalars().all()
-
-    # Используем батч-отправку
-    sender = BatchMessageSender(self.bot, batch_size=25, delay=0.1)
-
-    for booking in bookings:
-        text = (
-            f"🔔 Напоминание о бронировании!\n\n"
-            f"Завтра ваш заезд в курорт Oqtoshsoy:\n"
-            f"🛏 Номер: {booking.room.name}\n"
-            f"📅 Заезд: {booking.check_in.strftime('%d.%m.%Y')} в 14:00\n"
-            f"📅 Выезд: {booking.check_out.strftime('%d.%m.%Y')} до 12:00\n\n"
-            f"📍 Адрес: Ташкентская область, Бостанлыкский район\n"
-            f"📞 Контакт: +998 90 096 50 55\n\n"
-            f"Ждем вас с нетерпением! 🌟"
-        )
 
-        await sender.add_message(booking.user.telegram_id, text)
 
-logger = logging.getLogger(__name__)
+async def _guest_booking_chunks(session: AsyncSession, *conditions) -> AsyncIterator[List[Any]]:
+    """Строки _guest_bookings порциями по FETCH_CHUNK по возрастанию id.
+
+    После чтения каждой порции транзакция завершается, соединение
+    возвращается в пул на время отправки сообщений.
+    """
+    last_id = 0
+    while True:
+        rows = (await session.execute(
+            _guest_bookings(Booking.id > last_id, *conditions).limit(FETCH_CHUNK)
+        )).all()
+        await session.commit()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < FETCH_CHUNK:
+            return
+        last_id = rows[-1].id
+
+
+def _review_keyboard(booking_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="⭐" * rating, callback_data=f"rate_{booking_id}_{rating}")
+            for rating in range(1, 6)
+        ]
+    ])
 
 
 class NotificationService:
     """Сервис для автоматических уведомлений"""
 
-    def __init__(self, bot: Bot):
-        for booking in bookings:
-            try:
-                await self.bot.send_message(
-                    booking.user.telegram_id,
+    def __init__(self, bot: Bot, send_delay: float = 0):
+        self.bot = bot
+        # Частоту отправки ограничивает BatchMessageSender (лимиты Telegram);
+        # send_delay - дополнительная пауза после каждого сообщения
+        self.send_delay = send_delay
+
+    def _sender(self) -> BatchMessageSender:
+        return BatchMessageSender(self.bot, batch_size=25, delay=self.send_delay)
+
+    async def send_reminder_24h(self, session: AsyncSession) -> int:
+        """Отправка напоминаний за 24 часа до заезда"""
+        tomorrow_start, tomorrow_end = _day_range(date.today() + timedelta(days=1))
+        chunks = _guest_booking_chunks(
+            session,
+            Booking.check_in >= tomorrow_start,
+            Booking.check_in < tomorrow_end,
+            Booking.status == "confirmed"
+        )
+
+        sender = self._sender()
+        count = 0
+        async for chunk in chunks:
+            for row in chunk:
+                await sender.add_message(
+                    row.telegram_id,
+                    f"🔔 Напоминание о бронировании!\n\n"
+                    f"Завтра ваш заезд в курорт Oqtoshsoy:\n"
+                    f"🛏 Номер: {row.room_name}\n"
+                    f"📅 Заезд: {row.check_in.strftime('%d.%m.%Y')} в 14:00\n"
+                    f"📅 Выезд: {row.check_out.strftime('%d.%m.%Y')} до 12:00\n\n"
+                    f"📍 Адрес: {RESORT_LOCATION}\n"
+                    f"📞 Контакт: +998 90 096 50 55\n\n"
+                    f"Ждем вас с нетерпением! 🌟"
+                )
+                if ADMIN_TELEGRAM_ID:
+                    await sender.add_message(
+                        ADMIN_TELEGRAM_ID,
+                        f"📋 Завтра заезд:\n"
+                        f"Бронирование #{row.id}\n"
+                        f"Гость: @{row.username or row.telegram_id}\n"
+                        f"Номер: {row.room_name}"
+                    )
+                count += 1
+
+        await sender.flush()
+        logger.info(f"24h reminders: {count} bookings")
+        return count
+
+    async def send_checkout_reminder(self, session: AsyncSession) -> int:
+        """Напоминание о выезде в день выезда"""
+        today_start, today_end = _day_range(date.today())
+        chunks = _guest_booking_chunks(
+            session,
+            Booking.check_out >= today_start,
+            Booking.check_out < today_end,
+            Booking.status == "confirmed"
+        )
+
+        sender = self._sender()
+        count = 0
+        async for chunk in chunks:
+            for row in chunk:
+                await sender.add_message(
+                    row.telegram_id,
+                    f"☀️ Доброе утро!\n\n"
+                    f"Напоминаем, что сегодня день вашего выезда.\n"
+                    f"Выезд до 12:00\n\n"
+                    f"Надеемся, вам понравилось у нас! 💚\n"
+                    f"Будем рады видеть вас снова!\n\n"
+                    f"Оставьте отзыв: /review_{row.id}"
+                )
+                count += 1
+
+        await sender.flush()
+        logger.info(f"Checkout reminders: {count} bookings")
+        return count
+
+    async def send_review_request(self, session: AsyncSession) -> int:
+        """Запрос отзыва через день после выезда"""
+        yesterday_start, yesterday_end = _day_range(date.today() - timedelta(days=1))
+        chunks = _guest_booking_chunks(
+            session,
+            Booking.check_out >= yesterday_start,
+            Booking.check_out < yesterday_end,
+            Booking.status == "confirmed"
+        )
+
+        sender = self._sender()
+        count = 0
+        async for chunk in chunks:
+            for row in chunk:
+                await sender.add_message(
+                    row.telegram_id,
                     f"🌟 Как прошел ваш отдых?\n\n"
                     f"Надеемся, вам понравилось в курорте Oqtoshsoy!\n"
                     f"Поделитесь впечатлениями - ваш отзыв поможет нам стать лучше.\n\n"
-                    f"Нажмите /review_{booking.id} чтобы оставить отзыв\n\n"
+                    f"Нажмите /review_{row.id} чтобы оставить отзыв\n\n"
                     f"Или просто оцените от 1 до 5 ⭐",
-                    reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                        [
-                            InlineKeyboardButton(text="⭐", callback_data=f"rate_{booking.id}_1"),
-                            InlineKeyboardButton(text="⭐⭐", callback_data=f"rate_{booking.id}_2"),
-                            InlineKeyboardButton(text="⭐⭐⭐", callback_data=f"rate_{booking.id}_3"),
-                            InlineKeyboardButton(text="⭐⭐⭐⭐", callback_data=f"rate_{booking.id}_4"),
-                            InlineKeyboardButton(text="⭐⭐⭐⭐⭐", callback_data=f"rate_{booking.id}_5")
-                        ]
-                    ])
+                    reply_markup=_review_keyboard(row.id)
                 )
-            except Exception as e:
-                logger.error(f"Error sending review request for booking {booking.id}: {e}")
+                count += 1
+
+        await sender.flush()
+        logger.info(f"Review requests: {count} bookings")
+        return count
 
     async def send_special_offers(self, session: AsyncSession, offer_type: str):
         """Отправка специальных предложений подписчикам"""
-        # Получаем всех пользователей с подпиской на акции
-        result = await session.execute(
-            select(User).where(User.subscribed_to_offers == True)
-        )
-        users = result.scalars().all()
-
         offers = {
             "weekend": {
                 "title": "🎉 Скидка выходного дня!",
@@ -121,98 +227,122 @@ class NotificationService:
         if not offer:
             return
 
-        success_count = 0
-        for user in users:
-            try:
-                await self.bot.send_message(
-                    user.telegram_id,
-                    f"{offer['title']}\n\n{offer['text']}\n\n"
-                    f"Забронировать: /book",
-                    reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                        [InlineKeyboardButton(
-                            text="📅 Забронировать со скидкой",
-                            callback_data=f"promo_book_{offer_type}"
-                        )],
-                        [InlineKeyboardButton(
-                            text="❌ Отписаться от рассылки",
-                            callback_data="unsubscribe_offers"
-                        )]
-                    ])
-                )
-                success_count += 1
-                await asyncio.sleep(0.1)  # Защита от флуда
-            except Exception as e:
-                logger.error(f"Error sending offer to user {user.telegram_id}: {e}")
+        # Рассылка сохраняется в базе и продолжается после перезапуска;
+        # отправка - параллельно в пределах лимитов Telegram
+        result = await broadcast(
+            self.bot,
+            f"{offer['title']}\n\n{offer['text']}\n\n"
+            f"Забронировать: /book",
+            name=f"offer_{offer_type}",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(
+                    text="📅 Забронировать со скидкой",
+                    callback_data=f"promo_book_{offer_type}"
+                )],
+                [InlineKeyboardButton(
+                    text="❌ Отписаться от рассылки",
+                    callback_data="unsubscribe_offers"
+                )]
+            ])
+        )
 
         # Отчет админу
-        await self.bot.send_message(
-            ADMIN_TELEGRAM_ID,
-            f"📊 Рассылка '{offer['title']}' завершена\n"
-            f"Отправлено: {success_count}/{len(users)}"
-        )
+        if result and ADMIN_TELEGRAM_ID:
+            await self.bot.send_message(
+                ADMIN_TELEGRAM_ID,
+                f"📊 Рассылка '{offer['title']}' завершена\n"
+                f"Отправлено: {result['sent']}/{result['recipients']}"
+                f" (недоступны и отписаны: {result['blocked']})\n"
+                f"Время: {result['duration_s']:.0f} с ({result['rate_per_s']} сообщ./с)"
+            )
+        return result
 
     async def daily_statistics(self, session: AsyncSession):
         """Ежедневная статистика для администратора"""
-        today = datetime.now().date()
-        yesterday = today - timedelta(days=1)
+        today_start, today_end = _day_range(date.today())
+        yesterday_start = today_start - timedelta(days=1)
 
-        # Статистика за вчера
+        # Статистика за вчера: количество и выручка одним запросом
         result = await session.execute(
-            select(Booking).where(
+            select(
+                func.count(Booking.id),
+                func.coalesce(func.sum(Booking.total_price).filter(Booking.status != "cancelled"), 0)
+            ).where(
                 and_(
-                    Booking.created_at >= yesterday,
-                    Booking.created_at < today
+                    Booking.created_at >= yesterday_start,
+                    Booking.created_at < today_start
                 )
             )
         )
-        yesterday_bookings = result.scalars().all()
+        yesterday_count, yesterday_revenue = result.one()
 
         # Текущие гости
-        result = await session.execute(
-            select(Booking).where(
+        current_guests = (await session.execute(
+            select(func.count(Booking.id)).where(
                 and_(
-                    Booking.check_in <= today,
-                    Booking.check_out > today,
+                    Booking.check_in <= today_start,
+                    Booking.check_out > today_start,
                     Booking.status == "confirmed"
                 )
             )
-        )
-        current_guests = result.scalars().all()
+        )).scalar()
 
         # Заезды сегодня
-        result = await session.execute(
-            select(Booking).where(
+        today_checkins = (await session.execute(
+            select(func.count(Booking.id)).where(
                 and_(
-                    Booking.check_in == today,
+                    Booking.check_in >= today_start,
+                    Booking.check_in < today_end,
                     Booking.status.in_(["confirmed", "pending"])
                 )
             )
-        )
-        today_checkins = result.scalars().all()
+        )).scalar()
 
         # Выезды сегодня
-        result = await session.execute(
-            select(Booking).where(
+        today_checkouts = (await session.execute(
+            select(func.count(Booking.id)).where(
                 and_(
-                    Booking.check_out == today,
+                    Booking.check_out >= today_start,
+                    Booking.check_out < today_end,
                     Booking.status == "confirmed"
                 )
             )
-        )
-        today_checkouts = result.scalars().all()
+        )).scalar()
 
-        # Расчет выручки
-        yesterday_revenue = sum(b.total_price for b in yesterday_bookings if b.status != "cancelled")
+        if not ADMIN_TELEGRAM_ID:
+            return
 
         # Отправка отчета
         await self.bot.send_message(
             ADMIN_TELEGRAM_ID,
-            f"📊 Ежедневный отчет за {yesterday.strftime('%d.%m.%Y')}\n\n"
+            f"📊 Ежедневный отчет за {yesterday_start.strftime('%d.%m.%Y')}\n\n"
             f"💰 Выручка: {yesterday_revenue:,.0f} сум\n"
-            f"📝 Новых бронирований: {len(yesterday_bookings)}\n"
-            f"🏠 Текущих гостей: {len(current_guests)}\n\n"
-            f"Сегодня {today.strftime('%d.%m.%Y')}:\n"
-            f"➡️ Заезды: {len(today_checkins)}\n"
-            f"⬅️ Выезды: {len(today_checkouts)}\n\n"
+            f"📝 Новых бронирований: {yesterday_count}\n"
+            f"🏠 Текущих гостей: {current_guests}\n\n"
+            f"Сегодня {today_start.strftime('%d.%m.%Y')}:\n"
+            f"➡️ Заезды: {today_checkins}\n"
+            f"⬅️ Выезды: {today_checkouts}\n\n"
             f"Детальный отчет: /admin_report"
-        )
\ No newline at end of file
+        )
+
+
+def notification_scheduler(bot: Bot) -> Scheduler:
+    """Планировщик с задачами уведомлений (время - локальное время сервера)"""
+    notification_service = NotificationService(bot)
+    scheduler = Scheduler()
+
+    def job(method_name: str, *args):
+        async def run():
+            async with SessionLocal() as session:
+                await getattr(notification_service, method_name)(session, *args)
+        return run
+
+    # Ежедневные задачи в 9:00
+    scheduler.add_job("reminder_24h", "0 9 * * *", job("send_reminder_24h"))
+    scheduler.add_job("checkout_reminder", "0 9 * * *", job("send_checkout_reminder"))
+    scheduler.add_job("daily_statistics", "0 9 * * *", job("daily_statistics"))
+    # Запрос отзывов в 18:00
+    scheduler.add_job("review_request", "0 18 * * *", job("send_review_request"))
+    # Пятничные акции
+    scheduler.add_job("weekend_offers", "0 12 * * 5", job("send_special_offers", "weekend"))
+    return scheduler
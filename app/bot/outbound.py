@@ -0,0 +1,166 @@
+"""
+Исходящие запросы бота: очередь на чат, лимиты Telegram и повтор после 429.
+
+OutboundMiddleware подключается к сессии бота (bot.session.middleware), поэтому
+хендлеры продолжают вызывать обычные message.answer*, bot.send_* и т.д.
+Запросы, адресованные чату (у метода есть chat_id), выстраиваются в очередь
+этого чата и выполняются по одному в порядке вызова; перед каждым запросом
+берется токен из общего лимитера (app.bot.rate_limit). На TelegramRetryAfter
+лимитер ставится на паузу на время, указанное сервером, и запрос повторяется.
+Остальные методы (answer_callback_query, get_webhook_info, ...) проходят без
+очереди.
+
+Лимит чата тратят только новые сообщения, альбом - один запрос; ответы
+пользователю пользуются запасом корзины чата. Редактирование, удаление и
+действия в чате берут только общий токен. Массовые отправки (рассылки через
+BatchMessageSender) выполняются внутри bulk_requests() и берут токен чата
+строго, без всплеска.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendChatAction, TelegramMethod
+
+from app.bot.rate_limit import TelegramRateLimiter, telegram_limiter
+from app.config import OUTBOUND_MAX_RETRIES, OUTBOUND_MAX_RETRY_AFTER
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних задержек хранить для перцентилей
+LATENCY_WINDOW = 1000
+
+# Методы, создающие новое сообщение в чате: только они тратят лимит чата
+NEW_MESSAGE_PREFIXES = ("Send", "Forward", "Copy")
+
+# Запросы текущей задачи - массовая отправка (строгий лимит чата)
+_bulk: ContextVar[bool] = ContextVar("outbound_bulk", default=False)
+
+
+@contextmanager
+def bulk_requests():
+    """Запросы внутри блока считаются массовой отправкой"""
+    token = _bulk.set(True)
+    try:
+        yield
+    finally:
+        _bulk.reset(token)
+
+
+def _new_message(method: TelegramMethod) -> bool:
+    return type(method).__name__.startswith(NEW_MESSAGE_PREFIXES) and not isinstance(method, SendChatAction)
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class OutboundMiddleware(BaseRequestMiddleware):
+    """Очередь исходящих запросов на чат с лимитами и повтором после RetryAfter"""
+
+    def __init__(self, limiter: Optional[TelegramRateLimiter] = None,
+                 max_retries: int = OUTBOUND_MAX_RETRIES,
+                 max_retry_after: float = OUTBOUND_MAX_RETRY_AFTER):
+        self.limiter = limiter or telegram_limiter
+        self.max_retries = max_retries
+        # RetryAfter длиннее этого не ждем: хендлер получит исключение
+        self.max_retry_after = max_retry_after
+        # chat_id -> (замок очереди, число запросов в очереди и в работе)
+        self._chats: Dict[Any, list] = {}
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._waits: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = self._chats[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            # asyncio.Lock будит ожидающих по порядку - запросы чата идут в порядке вызова
+            async with entry[0]:
+                self._waits.append(time.monotonic() - started)
+                return await self._send(make_request, bot, method, chat_id)
+        finally:
+            self._latencies.append(time.monotonic() - started)
+            self.queued -= 1
+            entry[1] -= 1
+            if not entry[1]:
+                self._chats.pop(chat_id, None)
+
+    async def _send(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod, chat_id):
+        chat_limit = _new_message(method)
+        burst = not _bulk.get()
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(chat_id, burst=burst, chat_limit=chat_limit)
+            try:
+                result = await make_request(bot, method)
+                self.sent += 1
+                return result
+            except TelegramRetryAfter as e:
+                self.limiter.pause(e.retry_after)
+                if attempt == self.max_retries or e.retry_after > self.max_retry_after:
+                    self.failed += 1
+                    raise
+                self.retries += 1
+                logger.warning(f"Flood control on {type(method).__name__} to {chat_id}, "
+                               f"retry after {e.retry_after}s")
+            except Exception:
+                self.failed += 1
+                raise
+
+    def depth(self) -> int:
+        """Запросов в очередях и в работе"""
+        return self.queued
+
+    def stats(self) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            "queued": self.queued,
+            "chats": len(self._chats),
+            "max_chat_depth": max((entry[1] for entry in self._chats.values()), default=0),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "latency_p50_ms": ms(_percentile(self._latencies, 0.5)),
+            "latency_p99_ms": ms(_percentile(self._latencies, 0.99)),
+            "queue_wait_p99_ms": ms(_percentile(self._waits, 0.99)),
+            "limiter": self.limiter.stats(),
+        }
+
+
+def install_outbound(bot: Bot, **kwargs) -> OutboundMiddleware:
+    """Подключить очередь исходящих запросов к сессии бота"""
+    middleware = OutboundMiddleware(**kwargs)
+    bot.session.middleware(middleware)
+    return middleware
+
+
+def find_outbound(bot: Bot) -> Optional[OutboundMiddleware]:
+    """Очередь исходящих запросов бота, если она подключена"""
+    session = getattr(bot, "session", None)
+    for middleware in getattr(session, "middleware", ()):
+        if isinstance(middleware, OutboundMiddleware):
+            return middleware
+    return None
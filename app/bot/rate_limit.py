@@ -0,0 +1,117 @@
+"""
+Ограничение частоты отправки сообщений в Telegram.
+
+Token bucket на весь бот (~30 сообщений в секунду) и отдельные корзины на
+каждый чат (1 сообщение в секунду в личный чат, 20 в минуту в группу).
+Корзина чата вмещает TELEGRAM_CHAT_BURST токенов: ответы пользователю
+(фото, альбом и клавиатура подряд) уходят без ожидания. Массовые отправки
+берут токен строго (acquire(..., burst=False)): только из полной корзины, т.е.
+не чаще rate и не съедая запас для ответов. TelegramRetryAfter ставит общую
+корзину на паузу на время, указанное сервером.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict
+
+from app.config import TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_GROUP_RATE, TELEGRAM_CHAT_BURST
+
+# Сколько корзин чатов хранить (неактивные вытесняются)
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, strict: bool = False):
+        """Дождаться токена (ожидающие обслуживаются по очереди).
+
+        strict: брать токен только из полной корзины - без всплеска.
+        """
+        level = self.capacity if strict else 1
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= level:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((level - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Не выдавать токены seconds секунд (RetryAfter)"""
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+        self.updated = max(self.updated, self.paused_until)
+
+
+class TelegramRateLimiter:
+    """Общий лимит бота и лимиты отдельных чатов"""
+
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE, chat_rate: float = TELEGRAM_CHAT_RATE,
+                 group_rate: float = TELEGRAM_GROUP_RATE, chat_burst: float = TELEGRAM_CHAT_BURST):
+        # Емкость 1: равномерный поток без всплеска в начале
+        self.global_bucket = TokenBucket(global_rate, capacity=1)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = max(1.0, chat_burst)
+        self._chats: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self.pauses = 0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Отрицательный id - группа или канал
+            rate = self.group_rate if str(chat_id).startswith("-") else self.chat_rate
+            bucket = TokenBucket(rate, capacity=self.chat_burst)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > MAX_CHAT_BUCKETS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def acquire(self, chat_id: int, burst: bool = False, chat_limit: bool = True):
+        """Токен на отправку в чат.
+
+        burst: разрешить всплеск до chat_burst сообщений (ответы пользователю);
+        по умолчанию - строгий лимит для массовых отправок.
+        chat_limit=False: только общий лимит (редактирование, удаление).
+        """
+        # Сначала лимит чата, чтобы ожидание одного чата не занимало общий токен
+        if chat_limit:
+            await self._chat_bucket(chat_id).acquire(strict=not burst)
+        await self.global_bucket.acquire()
+
+    def pause(self, seconds: float):
+        self.pauses += 1
+        self.global_bucket.pause(seconds)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "global_rate": self.global_bucket.rate,
+            "chat_burst": self.chat_burst,
+            "tracked_chats": len(self._chats),
+            "pauses": self.pauses,
+            "paused_for": round(max(0.0, self.global_bucket.paused_until - time.monotonic()), 2),
+        }
+
+
+# Общий лимитер процесса: его используют все рассылки и отправки
+telegram_limiter = TelegramRateLimiter()
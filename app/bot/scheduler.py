@@ -0,0 +1,285 @@
+"""
+Планировщик периодических задач.
+
+Задачи задаются cron-выражениями (минута час день месяц день_недели).
+Планировщик вычисляет время следующего срабатывания и спит до него, а не
+опрашивает часы каждую минуту. Срабатывание, опоздавшее больше чем на
+misfire_grace секунд, пропускается; после перезапуска запуск, пропущенный в
+пределах misfire_grace, выполняется сразу.
+
+Чтобы при нескольких воркерах задача выполнялась ровно один раз, перед
+запуском воркер вставляет строку job_runs с уникальной парой (job_name,
+scheduled_for). Вставка удается только у одного воркера, остальные
+пропускают срабатывание. Та же строка хранит историю: статус, время и
+длительность выполнения.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import desc, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import JobRun
+from app.database.writer import db_writer
+
+logger = logging.getLogger(__name__)
+
+# Максимальный сон: после него время следующего запуска пересчитывается
+# (перевод часов, NTP)
+MAX_SLEEP = 300
+
+# Насколько далеко вперед искать срабатывание cron-выражения
+SEARCH_DAYS = 366 * 5
+
+
+def _parse_field(value: str, low: int, high: int) -> frozenset:
+    """Разобрать поле cron: *, 5, 1-5, */15, 1-10/2, 1,15,30"""
+    result = set()
+    for part in value.split(","):
+        part, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(x) for x in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Invalid cron field '{value}'")
+        result.update(range(start, end + 1, step))
+    return frozenset(result)
+
+
+class CronTrigger:
+    """Cron-выражение из пяти полей; день недели 0 (или 7) - воскресенье"""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: '{expression}'")
+        self.expression = expression
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        self.weekdays = frozenset(day % 7 for day in _parse_field(fields[4], 0, 7))
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        in_days = day.day in self.days
+        in_weekdays = (day.weekday() + 1) % 7 in self.weekdays
+        # Как в cron: если заданы оба поля, достаточно совпадения одного
+        if self._any_day:
+            return in_weekdays
+        if self._any_weekday:
+            return in_days
+        return in_days or in_weekdays
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Первое срабатывание строго после moment (с точностью до минуты)"""
+        start = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(SEARCH_DAYS):
+            if self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"Cron expression '{self.expression}' never fires")
+
+
+class Job:
+    """Задача планировщика и ее счетчики в этом воркере"""
+
+    def __init__(self, name: str, trigger: CronTrigger, func: Callable[[], Awaitable[None]],
+                 misfire_grace: float = 300):
+        self.name = name
+        self.trigger = trigger
+        self.func = func
+        self.misfire_grace = misfire_grace
+        self.next_run: Optional[datetime] = None
+        self.last_status: Optional[str] = None
+        self.last_duration_ms: Optional[float] = None
+        self.runs = 0
+        self.skipped = 0
+        self.missed = 0
+
+
+class Scheduler:
+    """Cron-планировщик с блокировкой запусков через таблицу job_runs"""
+
+    def __init__(self):
+        self.jobs: List[Job] = []
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+        self._running: Dict[str, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def add_job(self, name: str, cron: str, func: Callable[[], Awaitable[None]],
+                misfire_grace: float = 300) -> Job:
+        job = Job(name, CronTrigger(cron), func, misfire_grace)
+        self.jobs.append(job)
+        if self._wakeup is not None:
+            self._schedule(job, datetime.now())
+            self._wakeup.set()
+        return job
+
+    def _schedule(self, job: Job, now: datetime):
+        # Начинаем с now - misfire_grace: запуск, пропущенный во время рестарта,
+        # выполнится сразу (если его еще не выполнил другой воркер)
+        job.next_run = job.trigger.next_after(now - timedelta(seconds=job.misfire_grace))
+
+    def start(self):
+        if self._task is not None:
+            return
+        now = datetime.now()
+        for job in self.jobs:
+            self._schedule(job, now)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"Scheduler started with {len(self.jobs)} jobs")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        tasks = [self._task, *self._running.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._running.clear()
+
+    async def _loop(self):
+        while True:
+            now = datetime.now()
+            for job in self.jobs:
+                if job.next_run is not None and job.next_run <= now:
+                    self._fire(job, job.next_run, now)
+                    job.next_run = job.trigger.next_after(max(job.next_run, now))
+
+            upcoming = min((job.next_run for job in self.jobs if job.next_run), default=None)
+            delay = MAX_SLEEP if upcoming is None else (upcoming - datetime.now()).total_seconds()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), min(max(delay, 0), MAX_SLEEP))
+            except asyncio.TimeoutError:
+                pass
+
+    def _fire(self, job: Job, scheduled_for: datetime, now: datetime):
+        lateness = (now - scheduled_for).total_seconds()
+        if lateness > job.misfire_grace:
+            job.missed += 1
+            logger.warning(f"Job {job.name} missed run at {scheduled_for} ({lateness:.0f}s late)")
+            return
+        if job.name in self._running:
+            job.skipped += 1
+            logger.warning(f"Job {job.name} is still running, skipping run at {scheduled_for}")
+            return
+        task = asyncio.create_task(self._execute(job, scheduled_for))
+        self._running[job.name] = task
+        task.add_done_callback(lambda _: self._running.pop(job.name, None))
+
+    async def _claim(self, job: Job, scheduled_for: datetime) -> Optional[int]:
+        """Занять срабатывание; None - его уже выполняет/выполнил другой воркер"""
+
+        async def write(session: AsyncSession) -> int:
+            run = JobRun(
+                job_name=job.name,
+                scheduled_for=scheduled_for,
+                started_at=datetime.now(),
+                status="running",
+                worker=self.worker
+            )
+            session.add(run)
+            await session.flush()
+            return run.id
+
+        try:
+            return await db_writer.run(write)
+        except IntegrityError:
+            return None
+
+    async def _finish(self, run_id: int, status: str, duration_ms: float, error: Optional[str]):
+        async def write(session: AsyncSession):
+            run = await session.get(JobRun, run_id)
+            if run:
+                run.status = status
+                run.finished_at = datetime.now()
+                run.duration_ms = duration_ms
+                run.error = error
+                await session.flush()
+
+        await db_writer.run(write)
+
+    async def _execute(self, job: Job, scheduled_for: datetime):
+        run_id = await self._claim(job, scheduled_for)
+        if run_id is None:
+            job.skipped += 1
+            logger.info(f"Job {job.name} at {scheduled_for} is handled by another worker")
+            return
+
+        started = time.monotonic()
+        status, error = "success", None
+        try:
+            await job.func()
+        except Exception as e:
+            status, error = "failed", f"{type(e).__name__}: {e}"
+            logger.error(f"Job {job.name} failed: {e}")
+        duration_ms = round((time.monotonic() - started) * 1000, 1)
+
+        job.runs += 1
+        job.last_status = status
+        job.last_duration_ms = duration_ms
+        logger.info(f"Job {job.name} finished: {status} in {duration_ms} ms")
+        try:
+            await self._finish(run_id, status, duration_ms, error)
+        except Exception as e:
+            logger.error(f"Error saving run of job {job.name}: {e}")
+
+    def stats(self) -> List[Dict[str, object]]:
+        return [
+            {
+                "name": job.name,
+                "cron": job.trigger.expression,
+                "next_run": job.next_run.isoformat() if job.next_run else None,
+                "running": job.name in self._running,
+                "runs": job.runs,
+                "skipped": job.skipped,
+                "missed": job.missed,
+                "last_status": job.last_status,
+                "last_duration_ms": job.last_duration_ms,
+            }
+            for job in self.jobs
+        ]
+
+
+async def recent_runs(session: AsyncSession, limit: int = 50) -> List[Dict[str, object]]:
+    """История запусков задач из базы"""
+    result = await session.execute(
+        select(JobRun).order_by(desc(JobRun.scheduled_for), desc(JobRun.id)).limit(limit)
+    )
+    return [
+        {
+            "job": run.job_name,
+            "scheduled_for": run.scheduled_for.isoformat(),
+            "started_at": run.started_at.isoformat() if run.started_at else None,
+            "duration_ms": run.duration_ms,
+            "status": run.status,
+            "error": run.error,
+            "worker": run.worker,
+        }
+        for run in result.scalars()
+    ]
@@ -0,0 +1,144 @@
+"""
+Очередь обработки webhook-обновлений.
+
+Webhook кладет обновление в очередь и сразу отвечает Telegram 200, а пул
+воркеров обрабатывает обновления через dp.feed_update. Очередь разбита на
+шарды по пользователю/чату: обновления одного чата всегда попадают к одному
+воркеру и обрабатываются строго по порядку.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiogram.types.update import UpdateTypeLookupError
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update: Update) -> int:
+    """Ключ упорядочивания: пользователь, иначе чат, иначе само обновление"""
+    try:
+        event = update.event
+    except UpdateTypeLookupError:
+        # Неизвестный aiogram тип обновления
+        return update.update_id
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    return update.update_id
+
+
+class UpdateQueue:
+    """Ограниченная очередь обновлений с пулом воркеров"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, workers: int = 4,
+                 maxsize: int = 1000, enqueue_timeout: float = 5):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.workers = max(1, workers)
+        self.enqueue_timeout = enqueue_timeout
+        # Один шард на воркера; общий лимит делится между шардами
+        shard_size = max(1, maxsize // self.workers)
+        self._shards: List[asyncio.Queue] = [asyncio.Queue(maxsize=shard_size) for _ in range(self.workers)]
+        self._tasks: List[asyncio.Task] = []
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.backpressure_waits = 0
+        self.max_depth = 0
+        self._wait_total = 0.0
+        self._processing_total = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def depth(self) -> int:
+        return sum(shard.qsize() for shard in self._shards)
+
+    async def put(self, update: Update) -> bool:
+        """Поставить обновление в очередь.
+
+        Если шард переполнен, ждет до enqueue_timeout секунд (обратное давление
+        на Telegram); при неудаче возвращает False.
+        """
+        shard = self._shards[chat_key(update) % self.workers]
+        item = (update, time.monotonic())
+        try:
+            shard.put_nowait(item)
+        except asyncio.QueueFull:
+            self.backpressure_waits += 1
+            try:
+                await asyncio.wait_for(shard.put(item), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                logger.warning(f"Update queue is full, rejecting update {update.update_id}")
+                return False
+
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.depth())
+        return True
+
+    async def _worker(self, shard: asyncio.Queue):
+        while True:
+            update, enqueued_at = await shard.get()
+            started = time.monotonic()
+            self._wait_total += started - enqueued_at
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error processing update {update.update_id}: {e}")
+            finally:
+                self._processing_total += time.monotonic() - started
+                shard.task_done()
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker(shard)) for shard in self._shards]
+        logger.info(f"Update queue started with {self.workers} workers")
+
+    async def stop(self, drain_timeout: float = 10):
+        """Дождаться обработки оставшихся обновлений и остановить воркеров"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(shard.join() for shard in self._shards)),
+                drain_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queue stopped with {self.depth()} unprocessed updates")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики очереди и обратного давления"""
+        done = self.processed + self.failed
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "depth": self.depth(),
+            "shard_depths": [shard.qsize() for shard in self._shards],
+            "capacity": sum(shard.maxsize for shard in self._shards),
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "backpressure_waits": self.backpressure_waits,
+            "avg_wait_ms": round(self._wait_total / done * 1000, 2) if done else 0,
+            "avg_processing_ms": round(self._processing_total / done * 1000, 2) if done else 0,
+        }
@@ -0,0 +1,512 @@
+"""
+Модуль для кеширования данных
+
+Два уровня: локальный LRU-кеш процесса перед Redis. При изменении номеров,
+цен и бронирований публикуется сообщение об инвалидации, и все воркеры
+gunicorn удаляют устаревшие локальные записи.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+from app.config import (
+    REDIS_URL, REDIS_SOCKET_TIMEOUT, REDIS_BREAKER_THRESHOLD, REDIS_BREAKER_PROBE_INTERVAL,
+    CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_LOCAL_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+# Ключ кеша списка номеров
+ROOMS_CACHE_KEY = "rooms_list"
+
+# Канал сообщений об инвалидации
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Сколько сообщений об инвалидации хранить, пока Redis недоступен
+MAX_PENDING_INVALIDATIONS = 1000
+
+# Инициализация Redis (опционально)
+try:
+    redis_client = redis.from_url(
+        REDIS_URL or "redis://localhost:6379",
+        decode_responses=True,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT
+    )
+except Exception:
+    redis_client = None  # Работаем без Redis если недоступен
+
+
+async def _noop():
+    return None
+
+
+def _size_of(value: Any) -> int:
+    """Примерный размер значения в байтах"""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class LocalCache:
+    """In-process LRU кеш с TTL и ограничением по числу записей и байтам"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (value, expires_at, size)
+        self._data: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Получить значение; просроченные записи удаляются при чтении"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: int = 300):
+        """Сохранить значение на ttl секунд"""
+        size = _size_of(value)
+        if size > self.max_bytes:
+            # Значение больше всего кеша - не кешируем
+            self.delete(key)
+            return
+
+        self._remove(key)
+        self._data[key] = (value, time.monotonic() + ttl, size)
+        self._bytes += size
+
+        # Вытесняем самые давно использованные записи
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        self._remove(key)
+
+    def clear(self):
+        self._data.clear()
+        self._bytes = 0
+
+    def _remove(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики для мониторинга"""
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class InProcessBroker:
+    """Брокер сообщений внутри одного процесса (без Redis и для тестов)"""
+
+    def __init__(self):
+        self._queues: Dict[str, List[asyncio.Queue]] = {}
+
+    async def publish(self, channel: str, message: str):
+        for queue in self._queues.get(channel, []):
+            queue.put_nowait(message)
+
+    async def listen(self, channel: str) -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._queues.setdefault(channel, []).append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues[channel].remove(queue)
+
+
+class RedisBroker:
+    """Брокер сообщений через Redis pub/sub"""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def publish(self, channel: str, message: str) -> int:
+        return await self.client.publish(channel, message)
+
+    async def listen(self, channel: str) -> AsyncIterator[str]:
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["data"]
+        finally:
+            await pubsub.aclose()
+
+
+class CircuitBreaker:
+    """Предохранитель для Redis.
+
+    После failure_threshold ошибок подряд размыкается: запросы сразу идут
+    в локальный кеш, а фоновая задача раз в probe_interval секунд проверяет
+    Redis (probe) и замыкает цепь после успешной проверки, затем вызывает
+    on_close.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+
+    def __init__(self, probe: Callable[[], Awaitable[Any]], failure_threshold: int = 3,
+                 probe_interval: float = 30, probe_timeout: float = 1):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.short_circuited = 0
+        self.opened_at: Optional[float] = None
+        self.on_close: Optional[Callable[[], Awaitable[Any]]] = None
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def allow(self) -> bool:
+        """Можно ли сейчас обращаться к Redis"""
+        if self.state == self.OPEN:
+            self.short_circuited += 1
+            return False
+        return True
+
+    def record_success(self):
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._trip()
+
+    def _trip(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        logger.warning(
+            f"Redis circuit breaker opened after {self.consecutive_failures} failures, "
+            f"using local cache only"
+        )
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.create_task(self._probe_until_healthy())
+
+    async def _probe_until_healthy(self):
+        while self.state == self.OPEN:
+            await asyncio.sleep(self.probe_interval)
+            try:
+                await asyncio.wait_for(self.probe(), self.probe_timeout)
+            except Exception as e:
+                logger.debug(f"Redis probe failed: {e}")
+                continue
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            logger.info("Redis circuit breaker closed, Redis is reachable again")
+            if self.on_close is not None:
+                try:
+                    await self.on_close()
+                except Exception as e:
+                    logger.error(f"Error after Redis circuit breaker closed: {e}")
+
+    async def stop(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние предохранителя для мониторинга"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "trips": self.trips,
+            "short_circuited": self.short_circuited,
+            "open_for_seconds": round(time.monotonic() - self.opened_at, 1) if self.opened_at else 0,
+        }
+
+
+class TwoTierCache:
+    """Локальный LRU-кеш перед Redis с инвалидацией через pub/sub.
+
+    Инвалидации, которые не дошли до Redis (предохранитель разомкнут или
+    запрос упал), запоминаются и повторяются (DEL и publish), когда
+    предохранитель снова замыкается: иначе остальные воркеры читали бы
+    устаревшее значение из Redis до конца его TTL.
+    """
+
+    def __init__(self, local: LocalCache, client=None, broker=None, local_ttl: int = 60,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.local = local
+        self.client = client
+        self.broker = broker or (RedisBroker(client) if client else InProcessBroker())
+        self.breaker = breaker or CircuitBreaker(probe=client.ping if client else _noop)
+        # Сколько секунд локальная копия может жить без сообщения об инвалидации
+        self.local_ttl = local_ttl
+        # Идентификатор воркера, чтобы не обрабатывать свои же сообщения
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handlers: List[Callable[[Dict[str, Any]], Any]] = []
+        self._listener: Optional[asyncio.Task] = None
+        # Инвалидации, не дошедшие до Redis: ключи для DEL и сообщения для publish
+        self._pending_keys: set = set()
+        self._pending_messages: List[str] = []
+        self.replayed = 0
+        self.breaker.on_close = self.replay_invalidations
+
+    async def _redis_call(self, method: Callable[..., Awaitable[Any]], *args) -> Any:
+        """Вызвать Redis через предохранитель; при ошибке вернуть None"""
+        if not self.client or not self.breaker.allow():
+            return None
+        try:
+            result = await method(*args)
+        except Exception as e:
+            logger.debug(f"Redis call failed: {e}")
+            self.breaker.record_failure()
+            return None
+        self.breaker.record_success()
+        return result
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        if self.client:
+            value = await self._redis_call(self.client.get, key)
+            if value is not None:
+                self.local.set(key, value, self.local_ttl)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int = 300):
+        self.local.set(key, value, min(ttl, self.local_ttl) if self.client else ttl)
+        if self.client:
+            await self._redis_call(self.client.setex, key, ttl, value)
+
+    async def invalidate(self, *keys: str, **event: Any):
+        """Удалить ключи везде и оповестить остальные воркеры.
+
+        Дополнительные поля event передаются обработчикам в других воркерах
+        (например, данные измененного бронирования).
+        """
+        for key in keys:
+            self.local.delete(key)
+        if self.client and keys:
+            # delete возвращает число ключей, None - запрос не выполнен
+            if await self._redis_call(self.client.delete, *keys) is None:
+                self._pending_keys.update(keys)
+
+        message = json.dumps({"origin": self.origin, "keys": list(keys), **event}, default=str)
+        if isinstance(self.broker, RedisBroker):
+            if await self._redis_call(self.broker.publish, INVALIDATION_CHANNEL, message) is None:
+                self._defer_message(message)
+            return
+        try:
+            await self.broker.publish(INVALIDATION_CHANNEL, message)
+        except Exception as e:
+            logger.warning(f"Failed to publish cache invalidation: {e}")
+
+    def _defer_message(self, message: str):
+        self._pending_messages.append(message)
+        if len(self._pending_messages) > MAX_PENDING_INVALIDATIONS:
+            # Старые сообщения теряем: их локальные копии все равно истекут через local_ttl
+            del self._pending_messages[0]
+            logger.warning("Too many pending cache invalidations, dropping the oldest one")
+
+    async def replay_invalidations(self):
+        """Повторить инвалидации, сделанные, пока Redis был недоступен"""
+        keys, self._pending_keys = self._pending_keys, set()
+        messages, self._pending_messages = self._pending_messages, []
+        if not keys and not messages:
+            return
+
+        if keys and await self._redis_call(self.client.delete, *keys) is None:
+            self._pending_keys.update(keys)
+        published = 0
+        for message in messages:
+            if await self._redis_call(self.broker.publish, INVALIDATION_CHANNEL, message) is None:
+                # Redis снова недоступен - оставшееся повторим при следующем замыкании
+                self._pending_messages[:0] = messages[published:]
+                break
+            published += 1
+        self.replayed += published
+        logger.info(f"Replayed cache invalidations: {len(keys)} keys, {published}/{len(messages)} messages")
+
+    @property
+    def pending_invalidations(self) -> int:
+        return len(self._pending_keys) + len(self._pending_messages)
+
+    @property
+    def delivers_invalidations(self) -> bool:
+        """Доходят ли инвалидации до других воркеров прямо сейчас"""
+        return (
+            self.client is not None
+            and isinstance(self.broker, RedisBroker)
+            and self.breaker.state == CircuitBreaker.CLOSED
+            and self._listener is not None
+            and not self._listener.done()
+        )
+
+    def on_invalidation(self, handler: Callable[[Dict[str, Any]], Any]):
+        """Зарегистрировать обработчик сообщений от других воркеров"""
+        self._handlers.append(handler)
+
+    async def _handle(self, raw: str):
+        message = json.loads(raw)
+        if message.get("origin") == self.origin:
+            return
+        for key in message.get("keys", []):
+            self.local.delete(key)
+        for handler in self._handlers:
+            try:
+                result = handler(message)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Error in cache invalidation handler: {e}")
+
+    async def listen(self):
+        """Слушать сообщения об инвалидации, переподключаясь при ошибках.
+
+        Пропущенные за время переподключения сообщения не восстанавливаются:
+        устаревшая локальная копия живет не дольше local_ttl.
+        """
+        delay = 1
+        while True:
+            # Пока Redis недоступен, не пытаемся подписаться
+            if isinstance(self.broker, RedisBroker) and self.breaker.state == CircuitBreaker.OPEN:
+                await asyncio.sleep(self.breaker.probe_interval)
+                continue
+            try:
+                async for raw in self.broker.listen(INVALIDATION_CHANNEL):
+                    delay = 1
+                    await self._handle(raw)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener error: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def start(self):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        await self.breaker.stop()
+
+
+# Локальный уровень кеша
+memory_cache = LocalCache(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES)
+
+# Общий двухуровневый кеш процесса
+shared_cache = TwoTierCache(
+    memory_cache,
+    redis_client,
+    local_ttl=CACHE_LOCAL_TTL,
+    breaker=CircuitBreaker(
+        probe=redis_client.ping if redis_client else _noop,
+        failure_threshold=REDIS_BREAKER_THRESHOLD,
+        probe_interval=REDIS_BREAKER_PROBE_INTERVAL,
+        probe_timeout=REDIS_SOCKET_TIMEOUT
+    )
+)
+
+
+
+def cross_worker_invalidation() -> bool:
+    """Изменения, сделанные в одном воркере, видны остальным (REDIS_URL задан и Redis доступен)"""
+    return bool(REDIS_URL) and shared_cache.delivers_invalidations
+
+
+# Загрузки, которые уже выполняются (single-flight)
+_inflight: Dict[str, "asyncio.Future[Any]"] = {}
+
+
+async def get_cached(key: str, ttl: int = 300) -> Optional[str]:
+    """Получить данные из кеша"""
+    return await shared_cache.get(key)
+
+
+async def set_cached(key: str, value: str, ttl: int = 300):
+    """Сохранить данные в кеш"""
+    await shared_cache.set(key, value, ttl)
+
+
+async def delete_cached(*keys: str, **event: Any):
+    """Удалить данные из кеша во всех воркерах"""
+    await shared_cache.invalidate(*keys, **event)
+
+
+async def get_or_load(key: str, loader: Callable[[], Awaitable[str]], ttl: int = 300) -> str:
+    """Получить данные из кеша или загрузить их.
+
+    Одновременные промахи по одному ключу выполняют loader только один раз,
+    остальные вызовы ждут его результат.
+    """
+    cached = await get_cached(key, ttl)
+    if cached is not None:
+        return cached
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        value = await loader()
+        await set_cached(key, value, ttl)
+        future.set_result(value)
+        return value
+    except BaseException as e:
+        future.set_exception(e)
+        # Исключение уже передано ожидающим - не логируем его повторно
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
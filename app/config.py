@@ -9,11 +9,66 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 WEBAPP_URL = os.getenv("WEBAPP_URL", "https://web-production-1c8d.up.railway.app/webapp")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://web-production-1c8d.up.railway.app/webhook")
 ADMIN_TELEGRAM_ID = os.getenv("ADMIN_TELEGRAM_ID", "")  # ID администратора для уведомлений
+
+# Планировщик уведомлений (напоминания, отзывы, статистика, акции).
+# Выключен по умолчанию: включение запускает рассылку акций по пятницам и
+# ежедневные напоминания гостям, поэтому его включают явно (SCHEDULER_ENABLED=true)
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Лимиты отправки Telegram: общий на бота и на один чат
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))  # сообщений в секунду
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))  # в секунду на личный чат
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", 20 / 60))  # в секунду на группу
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", 5))  # Ответов пользователю подряд без ожидания
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 30))  # Одновременных запросов
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", 1000))  # Подписчиков за один запрос
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", 100))  # Сообщений между сохранениями прогресса
+BROADCAST_LEASE = int(os.getenv("BROADCAST_LEASE", 120))  # Секунд без heartbeat до перехвата рассылки
+
+# Очередь исходящих запросов бота: лимиты на чат и повтор после 429
+OUTBOUND_ENABLED = os.getenv("OUTBOUND_ENABLED", "true").lower() in ("1", "true", "yes")
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 3))
+OUTBOUND_MAX_RETRY_AFTER = float(os.getenv("OUTBOUND_MAX_RETRY_AFTER", 60))  # Дольше не ждем
+
+# Асинхронная обработка webhook: ответ 200 сразу, обработка в очереди
+WEBHOOK_ASYNC = os.getenv("WEBHOOK_ASYNC", "false").lower() in ("1", "true", "yes")
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 4))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+UPDATE_ENQUEUE_TIMEOUT = float(os.getenv("UPDATE_ENQUEUE_TIMEOUT", 5))
 REDIS_URL = os.getenv("REDIS_URL", None)  # Опционально
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.5))
+REDIS_BREAKER_THRESHOLD = int(os.getenv("REDIS_BREAKER_THRESHOLD", 3))  # Ошибок подряд до размыкания
+REDIS_BREAKER_PROBE_INTERVAL = float(os.getenv("REDIS_BREAKER_PROBE_INTERVAL", 30))
+
+# In-process cache limits
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 16 * 1024 * 1024))
+CACHE_LOCAL_TTL = int(os.getenv("CACHE_LOCAL_TTL", 60))  # Срок жизни локальной копии при работе с Redis
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))  # telegram_id -> user_id
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 24 * 3600))
+# Индекс занятости: периодическая перезагрузка и возраст, после которого он не используется
+OCCUPANCY_RELOAD_INTERVAL = float(os.getenv("OCCUPANCY_RELOAD_INTERVAL", 60))
+OCCUPANCY_INDEX_MAX_AGE = float(os.getenv("OCCUPANCY_INDEX_MAX_AGE", 180))
 
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///oqtoshsoy.db")
 
+# Пул соединений PostgreSQL (для SQLite не используется)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # Секунды; меньше idle-таймаута сервера/прокси
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Кеш подготовленных выражений asyncpg; 0 - для pgbouncer в режиме transaction
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 500))
+
+# SQLite: прагмы соединений, пул чтения и пакетная запись
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # мс
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -64000))  # отрицательное - в КиБ (64 МБ)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", 5))
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", 50))  # Операций записи на один commit
+
 # Web App
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", 8080))
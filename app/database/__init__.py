@@ -1,18 +1,51 @@
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.orm import sessionmaker
 import logging
 import os
 
 # Import custom database URL handler
-from db_config import get_safe_database_url
+from db_config import get_safe_database_url, get_async_database_url
+from app.config import (
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_STATEMENT_CACHE_SIZE, SQLITE_READ_POOL_SIZE
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Get safe database URL
 DATABASE_URL = get_safe_database_url()
-
-# Create base class for models
-Base = declarative_base()
+IS_POSTGRES = DATABASE_URL.startswith("postgresql")
+
+
+def engine_options(async_driver: bool) -> dict:
+    """Параметры create_engine: пул и кеш выражений для PostgreSQL"""
+    if not IS_POSTGRES:
+        return {}
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if async_driver:
+        # Кеш подготовленных выражений: SQLAlchemy (prepared_statement_cache_size)
+        # и самого asyncpg (statement_cache_size)
+        options["connect_args"] = {
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
+
+# Base class shared with the models, so create_all sees their tables
+from app.database.models import Base
+from app.database.migrations import apply_migrations
+from app.database.sqlite import configure_sqlite
+
+# Все записи идут через один сериализованный writer (см. app.database.writer);
+# включается для файловой базы SQLite
+SERIALIZED_WRITES = False
 
 # Check if we can use async SQLAlchemy
 try:
@@ -30,24 +63,54 @@ try:
     if USE_ASYNC:
         # Try to use async engine if possible
         try:
-            import aiosqlite
+            if IS_POSTGRES:
+                import asyncpg
+            else:
+                import aiosqlite
 
             # Convert URL for async use
-            async_url = DATABASE_URL
-            if async_url.startswith("sqlite"):
-                async_url = async_url.replace("sqlite:", "sqlite+aiosqlite:")
-            elif async_url.startswith("postgresql"):
-                async_url = async_url.replace("postgresql:", "postgresql+asyncpg:")
-
-            # Create async engine
-            engine = create_async_engine(
-                async_url,
-                echo=False,
-                future=True
-            )
+            async_url = get_async_database_url(DATABASE_URL)
+
+            if not IS_POSTGRES and ":memory:" not in async_url:
+                # SQLite: единственное соединение записи (WAL, BEGIN IMMEDIATE)
+                # и отдельный пул соединений только для чтения
+                engine = create_async_engine(
+                    async_url,
+                    echo=False,
+                    future=True,
+                    pool_size=1,
+                    max_overflow=0
+                )
+                configure_sqlite(engine.sync_engine)
+
+                read_engine = create_async_engine(
+                    async_url,
+                    echo=False,
+                    future=True,
+                    pool_size=SQLITE_READ_POOL_SIZE,
+                    max_overflow=SQLITE_READ_POOL_SIZE
+                )
+                configure_sqlite(read_engine.sync_engine, read_only=True)
+                SERIALIZED_WRITES = True
+            else:
+                # Create async engine
+                engine = create_async_engine(
+                    async_url,
+                    echo=False,
+                    future=True,
+                    **engine_options(async_driver=True)
+                )
+                read_engine = engine
 
             # Create async session factory
             AsyncSessionLocal = sessionmaker(
+                read_engine,
+                class_=AsyncSession,
+                expire_on_commit=False
+            )
+
+            # Sessions for writes (the writer task, sample data)
+            WriteSessionLocal = sessionmaker(
                 engine,
                 class_=AsyncSession,
                 expire_on_commit=False
@@ -85,6 +148,9 @@ try:
                         # Create all tables
                         await conn.run_sync(Base.metadata.create_all)
 
+                        # Bring existing databases up to date (columns, indexes)
+                        await conn.run_sync(apply_migrations)
+
                     logger.info("Database tables created successfully")
 
                     # Add sample data when initializing a fresh database
@@ -104,7 +170,7 @@ try:
                     from sqlalchemy import select
 
                     # Create a session
-                    async with AsyncSessionLocal() as session:
+                    async with WriteSessionLocal() as session:
                         # Check if there are already rooms
                         result = await session.execute(select(Room))
                         if result.scalars().first() is not None:
@@ -159,9 +225,9 @@ try:
                     raise
 
         except ImportError:
-            # Fall back to sync mode if aiosqlite not available
+            # Fall back to sync mode if aiosqlite/asyncpg not available
             USE_ASYNC = False
-            logger.warning("aiosqlite not available, falling back to sync SQLite")
+            logger.warning("Async database driver not available, falling back to sync engine")
 
     # Use synchronous engine if async not available
     if not USE_ASYNC:
@@ -170,7 +236,8 @@ try:
         # Create synchronous engine
         engine = create_engine(
             DATABASE_URL,
-            connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+            connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
+            **engine_options(async_driver=False)
         )
 
         # Create sync session factory
@@ -178,6 +245,8 @@ try:
 
         # Export session factory as SessionLocal
         SessionLocal = SyncSessionLocal
+        WriteSessionLocal = SessionLocal
+        read_engine = engine
 
         logger.info("Synchronous database engine initialized successfully")
 
@@ -205,6 +274,10 @@ try:
                 # Create all tables
                 Base.metadata.create_all(bind=engine)
 
+                # Bring existing databases up to date (columns, indexes)
+                with engine.begin() as conn:
+                    apply_migrations(conn)
+
                 logger.info("Database tables created successfully")
 
                 # Add sample data
@@ -286,6 +359,9 @@ except Exception as e:
 
     engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    WriteSessionLocal = SessionLocal
+    read_engine = engine
+    SERIALIZED_WRITES = False
 
 
     def get_db():
@@ -302,6 +378,8 @@ except Exception as e:
         from app.database.models import User, Room, Booking, Review
 
         Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            apply_migrations(conn)
         logger.info("Fallback database tables created successfully")
 
         # Add sample data
@@ -1,13 +1,19 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import or_, and_, func, desc
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Any, Tuple
+from sqlalchemy import or_, and_, func, desc, bindparam, delete, update
+from datetime import date, datetime, timedelta
+from typing import List, Dict, NamedTuple, Optional, Any, Sequence, Set, Tuple
 import sqlite3
 import os
 import json
 
-from app.database.models import User, Room, Booking, Review
+from app.config import USER_CACHE_SIZE, USER_CACHE_TTL
+from app.database import IS_POSTGRES
+from app.database.models import User, Room, Booking, Review, MediaFile
+from app.database.occupancy import occupancy_index
+from app.database.pricing import quote_room
+from app.database.writer import db_writer
+from app.cache import LocalCache, cross_worker_invalidation, shared_cache
 
 
 # User-related functions
@@ -20,16 +26,24 @@ async def get_user_by_telegram_id(db: AsyncSession, telegram_id: int) -> Optiona
 async def create_user(db: AsyncSession, telegram_id: int, username: Optional[str] = None,
                       first_name: Optional[str] = None, last_name: Optional[str] = None) -> User:
     """Create a new user"""
-    user = User(
-        telegram_id=telegram_id,
-        username=username,
-        first_name=first_name,
-        last_name=last_name
-    )
-    db.add(user)
-    await db.commit()
-    await db.refresh(user)
-    return user
+
+    async def write(session: AsyncSession) -> User:
+        # Пользователь мог быть создан параллельным обновлением
+        user = await get_user_by_telegram_id(session, telegram_id)
+        if user:
+            return user
+        user = User(
+            telegram_id=telegram_id,
+            username=username,
+            first_name=first_name,
+            last_name=last_name
+        )
+        session.add(user)
+        await session.flush()
+        await session.refresh(user)
+        return user
+
+    return await db_writer.run(write, db)
 
 
 async def get_or_create_user(db: AsyncSession, telegram_id: int, username: Optional[str] = None,
@@ -41,6 +55,103 @@ async def get_or_create_user(db: AsyncSession, telegram_id: int, username: Optio
     return user
 
 
+class UserIdentity(NamedTuple):
+    """Минимальные данные пользователя, достаточные для хендлеров и API"""
+    id: int
+    telegram_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+
+
+# telegram_id -> UserIdentity; повторный /start не обращается к базе
+user_cache = LocalCache(max_entries=USER_CACHE_SIZE)
+
+
+def _dialect_insert():
+    """insert() с поддержкой ON CONFLICT для текущей базы"""
+    if IS_POSTGRES:
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+async def upsert_user(db: AsyncSession, telegram_id: int, username: Optional[str] = None,
+                      first_name: Optional[str] = None, last_name: Optional[str] = None,
+                      update_profile: bool = True) -> UserIdentity:
+    """Create the user or refresh their profile with one INSERT ... ON CONFLICT statement.
+
+    Known users with an unchanged profile are served from user_cache without
+    any query. With update_profile=False (profile unknown, e.g. the WebApp)
+    existing names are left untouched.
+    """
+    key = str(telegram_id)
+    cached = user_cache.get(key)
+    if cached is not None and (
+            not update_profile
+            or (cached.username, cached.first_name, cached.last_name) == (username, first_name, last_name)
+    ):
+        return cached
+
+    async def write(session: AsyncSession) -> UserIdentity:
+        stmt = _dialect_insert()(User).values(
+            telegram_id=telegram_id,
+            username=username,
+            first_name=first_name,
+            last_name=last_name
+        )
+        if update_profile:
+            set_ = {
+                "username": stmt.excluded.username,
+                "first_name": stmt.excluded.first_name,
+                "last_name": stmt.excluded.last_name,
+                # Пользователь пишет боту - значит, больше не блокирует его
+                "bot_blocked": False,
+            }
+        else:
+            # Пустое обновление нужно, чтобы RETURNING вернул существующую строку
+            set_ = {"telegram_id": stmt.excluded.telegram_id}
+        stmt = stmt.on_conflict_do_update(index_elements=[User.telegram_id], set_=set_).returning(
+            User.id, User.telegram_id, User.username, User.first_name, User.last_name
+        )
+        row = (await session.execute(stmt)).one()
+        return UserIdentity(*row)
+
+    identity = await db_writer.run(write, db)
+    user_cache.set(key, identity, ttl=USER_CACHE_TTL)
+    return identity
+
+
+async def write_undeliverable_chats(session: AsyncSession, failures: Sequence[Tuple[int, str]]) -> None:
+    """Unsubscribe chats with permanent delivery errors, one executemany for all of them.
+
+    Must run inside a writer job (see mark_chats_undeliverable).
+    """
+    if not failures:
+        return
+    users = User.__table__
+    await session.execute(
+        update(users)
+        .where(users.c.telegram_id == bindparam("chat_id"))
+        .values(subscribed_to_offers=False, last_delivery_error=bindparam("error")),
+        [{"chat_id": chat_id, "error": error} for chat_id, error in failures]
+    )
+
+
+async def mark_chats_undeliverable(db: Optional[AsyncSession],
+                                   failures: Sequence[Tuple[int, str]]) -> int:
+    """Unsubscribe chats that can no longer receive messages (blocked bot, chat not found)"""
+    if not failures:
+        return 0
+
+    async def write(session: AsyncSession) -> int:
+        await write_undeliverable_chats(session, failures)
+        return len(failures)
+
+    return await db_writer.run(write, db)
+
+
 # Room-related functions
 async def get_all_rooms(db: AsyncSession) -> List[Room]:
     """Get all available rooms"""
@@ -60,6 +171,9 @@ async def get_all_rooms(db: AsyncSession) -> List[Room]:
             # Extract file path from SQLite URL
             if DATABASE_URL.startswith('sqlite:///'):
                 db_path = DATABASE_URL[10:]
+            elif DATABASE_URL.startswith(('postgres', 'postgresql')):
+                # Прямой доступ через sqlite3 возможен только для SQLite
+                return []
             else:
                 db_path = DATABASE_URL
 
@@ -128,24 +242,89 @@ async def get_room_reviews(db: AsyncSession, room_id: int) -> List[Review]:
 async def add_room_review(db: AsyncSession, user_id: int, room_id: int,
                           rating: int, comment: Optional[str] = None) -> Review:
     """Add a review for a room"""
-    review = Review(
-        user_id=user_id,
-        room_id=room_id,
-        rating=rating,
-        comment=comment,
-        created_at=datetime.now()
-    )
-    db.add(review)
-    await db.commit()
-    await db.refresh(review)
-    return review
+
+    async def write(session: AsyncSession) -> Review:
+        review = Review(
+            user_id=user_id,
+            room_id=room_id,
+            rating=rating,
+            comment=comment,
+            created_at=datetime.now()
+        )
+        session.add(review)
+        await session.flush()
+        await session.refresh(review)
+        return review
+
+    return await db_writer.run(write, db)
+
+
+# Media file_id functions
+async def get_media_file_ids(db: AsyncSession) -> Dict[str, str]:
+    """All known Telegram file_ids by media URL"""
+    result = await db.execute(select(MediaFile.url, MediaFile.file_id))
+    return {url: file_id for url, file_id in result.all()}
+
+
+async def save_media_file_ids(db: Optional[AsyncSession], file_ids: Dict[str, str], kind: str = "photo") -> None:
+    """Insert or replace file_ids for media URLs in one statement"""
+    if not file_ids:
+        return
+
+    async def write(session: AsyncSession) -> None:
+        stmt = _dialect_insert()(MediaFile).values([
+            {"url": url, "file_id": file_id, "kind": kind} for url, file_id in file_ids.items()
+        ])
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[MediaFile.url],
+            set_={"file_id": stmt.excluded.file_id, "kind": stmt.excluded.kind}
+        ))
+
+    await db_writer.run(write, db)
+
+
+async def delete_media_files(db: Optional[AsyncSession], urls: Sequence[str]) -> None:
+    """Forget file_ids of media URLs"""
+    if not urls:
+        return
+
+    async def write(session: AsyncSession) -> None:
+        await session.execute(delete(MediaFile).where(MediaFile.url.in_(list(urls))))
+
+    await db_writer.run(write, db)
 
 
 # Booking-related functions
+async def _publish_booking_change(booking: Booking):
+    """Notify other workers about a created or cancelled booking"""
+    await shared_cache.invalidate(topic="bookings", booking={
+        "id": booking.id,
+        "room_id": booking.room_id,
+        "check_in": booking.check_in,
+        "check_out": booking.check_out,
+        "status": booking.status
+    })
+
+
+class BookingConflictError(ValueError):
+    """The room is already booked for (part of) the requested dates"""
+
+    def __init__(self, room_id: int, check_in, check_out, conflicting_booking_id: Optional[int] = None):
+        super().__init__("Room is not available for selected dates")
+        self.room_id = room_id
+        self.check_in = check_in
+        self.check_out = check_out
+        self.conflicting_booking_id = conflicting_booking_id
+
+
 async def create_booking(db: AsyncSession, user_id: int, room_id: int,
                          check_in: str, check_out: str, guests: int,
                          phone: Optional[str] = None) -> Booking:
-    """Create a new booking"""
+    """Create a new booking.
+
+    The overlap check and the INSERT run atomically in one write transaction;
+    raises BookingConflictError if the dates are already taken.
+    """
     # Convert date strings to date objects
     check_in_date = datetime.strptime(check_in, "%Y-%m-%d").date()
     check_out_date = datetime.strptime(check_out, "%Y-%m-%d").date()
@@ -154,36 +333,47 @@ async def create_booking(db: AsyncSession, user_id: int, room_id: int,
     if check_out_date <= check_in_date:
         raise ValueError("Check-out date must be after check-in date")
 
-    # Check if room is available for these dates
-    is_available = await check_room_availability(db, room_id, check_in, check_out)
-    if not is_available:
-        raise ValueError("Room is not available for selected dates")
-
-    # Get room to calculate price
-    room = await get_room(db, room_id)
-    if not room:
-        raise ValueError("Room not found")
-
-    # Calculate nights and total price
-    nights = (check_out_date - check_in_date).days
-    total_price = room.price_per_night * nights
-
-    # Create booking
-    booking = Booking(
-        user_id=user_id,
-        room_id=room_id,
-        check_in=check_in_date,
-        check_out=check_out_date,
-        guests=guests,
-        phone=phone,
-        total_price=total_price,
-        status="pending",
-        created_at=datetime.now()
-    )
-
-    db.add(booking)
-    await db.commit()
-    await db.refresh(booking)
+    async def write(session: AsyncSession) -> Booking:
+        # Lock the room for the rest of the transaction: SELECT ... FOR UPDATE on
+        # PostgreSQL; on SQLite the writer transaction is already BEGIN IMMEDIATE
+        room = (await session.execute(
+            select(Room).where(Room.id == room_id).with_for_update()
+        )).scalars().first()
+        if not room:
+            raise ValueError("Room not found")
+
+        # Overlap check and insert happen under the same lock
+        conflict_id = (await session.execute(
+            select(Booking.id)
+            .where(Booking.room_id == room_id, _overlapping_bookings(check_in_date, check_out_date))
+            .limit(1)
+        )).scalar()
+        if conflict_id is not None:
+            raise BookingConflictError(room_id, check_in_date, check_out_date, conflict_id)
+
+        # Calculate total price (weekday/weekend rates, extra guests)
+        quote = quote_room(room, check_in_date, check_out_date, guests)
+
+        # Create booking
+        booking = Booking(
+            user_id=user_id,
+            room_id=room_id,
+            check_in=_day_start(check_in_date),
+            check_out=_day_start(check_out_date),
+            guests=guests,
+            phone=phone,
+            total_price=quote["total_price"],
+            status="pending",
+            created_at=datetime.now()
+        )
+        session.add(booking)
+        await session.flush()
+        await session.refresh(booking)
+        return booking
+
+    booking = await db_writer.run(write, db)
+    occupancy_index.add(booking.id, booking.room_id, booking.check_in, booking.check_out)
+    await _publish_booking_change(booking)
     return booking
 
 
@@ -205,45 +395,55 @@ async def get_booking(db: AsyncSession, booking_id: int) -> Optional[Booking]:
 
 async def cancel_booking(db: AsyncSession, booking_id: int) -> Optional[Booking]:
     """Cancel a booking"""
-    booking = await get_booking(db, booking_id)
+
+    async def write(session: AsyncSession) -> Optional[Booking]:
+        booking = await get_booking(session, booking_id)
+        if booking:
+            booking.status = "cancelled"
+            await session.flush()
+        return booking
+
+    booking = await db_writer.run(write, db)
     if not booking:
         return None
 
-    booking.status = "cancelled"
-    await db.commit()
-    await db.refresh(booking)
+    occupancy_index.remove(booking.id)
+    await _publish_booking_change(booking)
     return booking
 
 
+async def mark_admin_notified(db: AsyncSession, booking_id: int) -> None:
+    """Mark that the administrator was notified about a booking"""
+
+    async def write(session: AsyncSession) -> None:
+        booking = await get_booking(session, booking_id)
+        if booking:
+            booking.admin_notified = True
+            await session.flush()
+
+    await db_writer.run(write, db)
+
+
 async def calculate_booking_price(db: AsyncSession, room_id: int,
-                                  check_in: str, check_out: str) -> Dict[str, Any]:
+                                  check_in: str, check_out: str,
+                                  guests: Optional[int] = None) -> Dict[str, Any]:
     """Calculate the total price for a booking"""
     room = await get_room(db, room_id)
     if not room:
         raise ValueError("Room not found")
 
-    check_in_date = datetime.strptime(check_in, "%Y-%m-%d").date()
-    check_out_date = datetime.strptime(check_out, "%Y-%m-%d").date()
+    return quote_room(room, check_in, check_out, guests)
 
-    nights = (check_out_date - check_in_date).days
-    if nights <= 0:
-        raise ValueError("Check-out date must be after check-in date")
 
-    total_price = room.price_per_night * nights
+def _day_start(value) -> datetime:
+    """Convert a date to midnight datetime so it compares correctly with DateTime columns"""
+    return datetime.combine(value, datetime.min.time())
 
-    return {
-        "total_price": total_price,
-        "nights": nights,
-        "room_price": room.price_per_night,
-        "room_name": room.name
-    }
 
-
-async def check_room_availability(db: AsyncSession, room_id: int,
-                                  check_in: str, check_out: str) -> bool:
-    """Check if a room is available for the given dates"""
-    check_in_date = datetime.strptime(check_in, "%Y-%m-%d").date()
-    check_out_date = datetime.strptime(check_out, "%Y-%m-%d").date()
+async def _check_room_availability_db(db: AsyncSession, room_id: int, check_in_date, check_out_date) -> bool:
+    """Check room availability with a database query"""
+    check_in_date = _day_start(check_in_date)
+    check_out_date = _day_start(check_out_date)
 
     # Check for overlapping bookings
     result = await db.execute(
@@ -276,22 +476,78 @@ async def check_room_availability(db: AsyncSession, room_id: int,
     return result.scalars().first() is None
 
 
-async def get_available_rooms(db: AsyncSession, check_in: str, check_out: str) -> List[Room]:
-    """Get rooms available for the given dates"""
+def _use_occupancy_index() -> bool:
+    """Whether the in-memory occupancy index can answer availability checks"""
+    # О бронированиях других воркеров индекс узнает только через инвалидации кеша
+    return occupancy_index.is_fresh and cross_worker_invalidation()
+
+
+async def check_room_availability(db: AsyncSession, room_id: int,
+                                  check_in: str, check_out: str) -> bool:
+    """Check if a room is available for the given dates"""
     check_in_date = datetime.strptime(check_in, "%Y-%m-%d").date()
     check_out_date = datetime.strptime(check_out, "%Y-%m-%d").date()
 
-    # Get all rooms
-    all_rooms = await get_all_rooms(db)
+    # Быстрый путь через in-memory индекс, если ему можно верить
+    if _use_occupancy_index():
+        return occupancy_index.is_free(room_id, check_in_date, check_out_date)
+
+    return await _check_room_availability_db(db, room_id, check_in_date, check_out_date)
 
-    # Filter out rooms that have overlapping bookings
-    available_rooms = []
-    for room in all_rooms:
-        is_available = await check_room_availability(db, room.id, check_in, check_out)
-        if is_available:
-            available_rooms.append(room)
 
-    return available_rooms
+def _overlapping_bookings(check_in_date, check_out_date):
+    """Condition for non-cancelled bookings that overlap the given dates"""
+    return and_(
+        Booking.status != "cancelled",
+        Booking.check_in < _day_start(check_out_date),
+        Booking.check_out > _day_start(check_in_date)
+    )
+
+
+async def get_booked_nights(db: AsyncSession, room_id: int, start: date, end: date) -> Set[date]:
+    """Nights in [start, end) taken by non-cancelled bookings of the room, from one range query"""
+    result = await db.execute(
+        select(Booking.check_in, Booking.check_out)
+        .where(Booking.room_id == room_id, _overlapping_bookings(start, end))
+    )
+    nights = set()
+    for check_in, check_out in result.all():
+        night = max(_day_start(check_in).date(), start)
+        last = min(_day_start(check_out).date(), end)
+        while night < last:
+            nights.add(night)
+            night += timedelta(days=1)
+    return nights
+
+
+async def get_available_rooms(db: AsyncSession, check_in: str, check_out: str,
+                              capacity: Optional[int] = None, room_type: Optional[str] = None,
+                              season_type: Optional[str] = None) -> List[Room]:
+    """Get rooms available for the given dates in a single query"""
+    check_in_date = datetime.strptime(check_in, "%Y-%m-%d").date()
+    check_out_date = datetime.strptime(check_out, "%Y-%m-%d").date()
+
+    query = select(Room)
+
+    # Дополнительные фильтры поиска
+    if capacity is not None:
+        query = query.where(Room.capacity >= capacity)
+    if room_type is not None:
+        query = query.where(Room.room_type == room_type)
+    if season_type is not None:
+        query = query.where(Room.season_type.in_([season_type, "all"]))
+
+    # Занятость берем из in-memory индекса, если ему можно верить
+    if _use_occupancy_index():
+        result = await db.execute(query.order_by(Room.price_per_night))
+        rooms = result.scalars().all()
+        free_ids = set(occupancy_index.free_rooms([room.id for room in rooms], check_in_date, check_out_date))
+        return [room for room in rooms if room.id in free_ids]
+
+    # Anti-join: комнаты без пересекающихся активных бронирований
+    busy_rooms = select(Booking.room_id).where(_overlapping_bookings(check_in_date, check_out_date))
+    result = await db.execute(query.where(Room.id.not_in(busy_rooms)).order_by(Room.price_per_night))
+    return result.scalars().all()
 
 
 # Statistics and dashboard functions
@@ -0,0 +1,101 @@
+"""
+Простые миграции схемы базы данных.
+
+Каждая миграция - это версия, описание и функция, принимающая синхронное
+соединение SQLAlchemy. Примененные версии записываются в таблицу
+schema_migrations, поэтому apply_migrations можно вызывать при каждом старте.
+Для async-движка вызывается через conn.run_sync(apply_migrations).
+"""
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+from app.database.models import User, Booking, Review
+
+logger = logging.getLogger(__name__)
+
+
+def _add_missing_columns(conn: Connection, table, columns: List[str]):
+    """Добавить колонки модели, которых нет в существующей таблице"""
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    for name in columns:
+        if name in existing:
+            continue
+        column = table.c[name]
+        ddl = f"ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(dialect=conn.dialect)}"
+        if column.default is not None and column.default.is_scalar:
+            default = column.default.arg
+            if isinstance(default, bool):
+                # PostgreSQL не приводит 1/0 к BOOLEAN
+                if conn.dialect.name == "postgresql":
+                    default = "TRUE" if default else "FALSE"
+                else:
+                    default = int(default)
+            elif isinstance(default, str):
+                default = f"'{default}'"
+            ddl += f" DEFAULT {default}"
+        conn.execute(text(ddl))
+        logger.info(f"Added column {table.name}.{name}")
+
+
+def _create_model_indexes(conn: Connection, *models):
+    """Создать индексы, объявленные в __table_args__ моделей"""
+    for model in models:
+        for index in model.__table__.indexes:
+            index.create(conn, checkfirst=True)
+            logger.info(f"Ensured index {index.name}")
+
+
+def _users_offer_columns(conn: Connection):
+    _add_missing_columns(conn, User.__table__, ["subscribed_to_offers", "language"])
+
+
+def _bookings_reviews_indexes(conn: Connection):
+    _create_model_indexes(conn, Booking, Review)
+
+
+def _users_bot_blocked_column(conn: Connection):
+    _add_missing_columns(conn, User.__table__, ["bot_blocked"])
+
+
+def _users_last_delivery_error_column(conn: Connection):
+    _add_missing_columns(conn, User.__table__, ["last_delivery_error"])
+
+
+# (версия, описание, функция)
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "users: subscribed_to_offers and language columns", _users_offer_columns),
+    (2, "bookings/reviews: indexes for availability, user and review queries", _bookings_reviews_indexes),
+    (3, "users: bot_blocked column", _users_bot_blocked_column),
+    (4, "users: last_delivery_error column", _users_last_delivery_error_column),
+]
+
+
+def apply_migrations(conn: Connection) -> List[int]:
+    """Применить все еще не примененные миграции, вернуть их версии"""
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(255), "
+        "applied_at TIMESTAMP)"
+    ))
+    applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+    newly_applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        migrate(conn)
+        conn.execute(
+            text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+            {"v": version, "d": description, "t": datetime.utcnow()}
+        )
+        newly_applied.append(version)
+
+    if newly_applied:
+        logger.info(f"Applied migrations: {newly_applied}")
+    return newly_applied
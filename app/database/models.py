@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import datetime
@@ -19,6 +19,8 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     subscribed_to_offers = Column(Boolean, default=True)
     language = Column(String(10), default='ru')
+    bot_blocked = Column(Boolean, default=False)  # Пользователь заблокировал бота
+    last_delivery_error = Column(Text, nullable=True)  # Постоянная ошибка отправки (чат недоступен)
 
     bookings = relationship("Booking", back_populates="user")
 
@@ -71,6 +73,19 @@ class Booking(Base):
     user = relationship("User", back_populates="bookings")
     room = relationship("Room", back_populates="bookings")
 
+    __table_args__ = (
+        # Проверка доступности номера
+        Index("ix_bookings_room_status_dates", "room_id", "status", "check_in", "check_out"),
+        # Поиск свободных номеров и напоминания о заезде
+        Index("ix_bookings_check_in_status", "check_in", "status"),
+        # Напоминания о выезде и запросы отзывов
+        Index("ix_bookings_check_out_status", "check_out", "status"),
+        # Бронирования пользователя
+        Index("ix_bookings_user_created", "user_id", "created_at"),
+        # Ежедневная статистика
+        Index("ix_bookings_created_at", "created_at"),
+    )
+
     def __repr__(self):
         return f"<Booking {self.id} - {self.status}>"
 
@@ -88,5 +103,87 @@ class Review(Base):
     user = relationship("User")
     room = relationship("Room", back_populates="reviews")
 
+    __table_args__ = (
+        Index("ix_reviews_room_created", "room_id", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<Review {self.id} - {self.rating}>"
+
+
+class JobRun(Base):
+    """Запуск задачи планировщика; строка с (job_name, scheduled_for) - блокировка запуска"""
+    __tablename__ = "job_runs"
+
+    id = Column(Integer, primary_key=True)
+    job_name = Column(String(100), nullable=False)
+    scheduled_for = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    duration_ms = Column(Float, nullable=True)
+    status = Column(String(20), default="running")  # running, success, failed
+    error = Column(Text, nullable=True)
+    worker = Column(String(100), nullable=True)
+
+    __table_args__ = (
+        # Один запуск на время срабатывания во всех воркерах
+        UniqueConstraint("job_name", "scheduled_for", name="uq_job_runs_job_scheduled"),
+    )
+
+    def __repr__(self):
+        return f"<JobRun {self.job_name} {self.scheduled_for} - {self.status}>"
+
+
+class Broadcast(Base):
+    """Рассылка; last_user_id - точка продолжения после перезапуска"""
+    __tablename__ = "broadcasts"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    text = Column(Text, nullable=False)
+    reply_markup = Column(Text, nullable=True)  # JSON InlineKeyboardMarkup
+    status = Column(String(20), default="pending")  # pending, running, completed, failed
+    recipients = Column(Integer, default=0)  # Подписчиков на момент запуска
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    blocked = Column(Integer, default=0)  # Постоянные ошибки: бот заблокирован, чат не найден
+    last_user_id = Column(Integer, default=0)
+    worker = Column(String(100), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<Broadcast {self.id} {self.name} - {self.status}>"
+
+
+class BroadcastDelivery(Base):
+    """Результат доставки рассылки одному пользователю"""
+    __tablename__ = "broadcast_deliveries"
+
+    id = Column(Integer, primary_key=True)
+    broadcast_id = Column(Integer, ForeignKey("broadcasts.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    status = Column(String(20), nullable=False)  # sent, failed (временная ошибка), blocked (чат недоступен)
+    error = Column(Text, nullable=True)
+    sent_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("broadcast_id", "user_id", name="uq_broadcast_deliveries_user"),
+        Index("ix_broadcast_deliveries_status", "broadcast_id", "status"),
+    )
+
+
+class MediaFile(Base):
+    """file_id Telegram для медиа по URL: повторная отправка без загрузки файла"""
+    __tablename__ = "media_files"
+
+    id = Column(Integer, primary_key=True)
+    url = Column(String(1000), unique=True, nullable=False)
+    file_id = Column(String(255), nullable=False)
+    kind = Column(String(20), default="photo")
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
     def __repr__(self):
-        return f"<Review {self.id} - {self.rating}>"
\ No newline at end of file
+        return f"<MediaFile {self.url}>"
@@ -0,0 +1,186 @@
+"""
+In-memory индекс занятости номеров.
+
+Хранит для каждого номера отсортированный список активных (не отмененных)
+бронирований и отвечает на вопросы "свободен ли номер" и "какие номера
+свободны" без обращения к базе данных.
+
+Индекс каждого воркера узнает о бронированиях других воркеров только через
+инвалидации кеша (Redis pub/sub), поэтому crud использует его, лишь пока они
+доставляются, а main перезагружает его раз в OCCUPANCY_RELOAD_INTERVAL
+секунд; индекс старше max_age считается устаревшим.
+"""
+import logging
+import time
+from bisect import bisect_left, insort
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.config import OCCUPANCY_INDEX_MAX_AGE
+from app.database.models import Booking
+
+logger = logging.getLogger(__name__)
+
+
+def _as_date(value) -> date:
+    """Привести datetime/date/строку ISO к date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)).date()
+
+
+class OccupancyIndex:
+    """Индекс занятых интервалов [check_in, check_out) по номерам"""
+
+    def __init__(self, max_age: float = OCCUPANCY_INDEX_MAX_AGE):
+        self.max_age = max_age
+        # Когда индекс последний раз сверялся с базой (time.monotonic)
+        self.loaded_at = 0.0
+        # room_id -> отсортированный список (check_in, check_out, booking_id)
+        self._rooms: Dict[int, List[Tuple[date, date, int]]] = {}
+        # room_id -> максимальная длительность бронирования (ограничивает поиск)
+        self._max_nights: Dict[int, int] = {}
+        # booking_id -> (room_id, check_in, check_out)
+        self._bookings: Dict[int, Tuple[int, date, date]] = {}
+        self.is_warm = False
+
+    def _build(self, rows: Iterable[Tuple[int, int, object, object]]):
+        """Построить индекс из строк (booking_id, room_id, check_in, check_out)"""
+        self._rooms = {}
+        self._max_nights = {}
+        self._bookings = {}
+        for booking_id, room_id, check_in, check_out in rows:
+            self.add(booking_id, room_id, check_in, check_out)
+
+    async def _fetch(self, db: AsyncSession) -> List[Tuple[int, int, object, object]]:
+        result = await db.execute(
+            select(Booking.id, Booking.room_id, Booking.check_in, Booking.check_out)
+            .where(Booking.status != "cancelled")
+        )
+        return result.all()
+
+    async def load(self, db: AsyncSession):
+        """Загрузить все активные бронирования из базы"""
+        try:
+            self._build(await self._fetch(db))
+            self.is_warm = True
+            self.loaded_at = time.monotonic()
+            logger.info(f"Occupancy index loaded: {len(self._bookings)} bookings in {len(self._rooms)} rooms")
+        except Exception as e:
+            self.is_warm = False
+            logger.error(f"Error loading occupancy index: {e}")
+
+    @property
+    def is_fresh(self) -> bool:
+        """Загружен и сверялся с базой не раньше max_age секунд назад"""
+        return self.is_warm and time.monotonic() - self.loaded_at <= self.max_age
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "warm": self.is_warm,
+            "fresh": self.is_fresh,
+            "age": round(time.monotonic() - self.loaded_at, 1) if self.is_warm else None,
+            "bookings": len(self._bookings),
+        }
+
+    def invalidate(self):
+        """Пометить индекс как холодный - запросы пойдут в базу"""
+        self.is_warm = False
+
+    def add(self, booking_id: int, room_id: int, check_in, check_out):
+        """Добавить (или обновить) активное бронирование"""
+        if booking_id in self._bookings:
+            self.remove(booking_id)
+
+        check_in = _as_date(check_in)
+        check_out = _as_date(check_out)
+
+        insort(self._rooms.setdefault(room_id, []), (check_in, check_out, booking_id))
+        nights = (check_out - check_in).days
+        if nights > self._max_nights.get(room_id, 0):
+            self._max_nights[room_id] = nights
+        self._bookings[booking_id] = (room_id, check_in, check_out)
+
+    def remove(self, booking_id: int):
+        """Удалить бронирование (например, при отмене)"""
+        entry = self._bookings.pop(booking_id, None)
+        if entry is None:
+            return
+        room_id, check_in, check_out = entry
+        intervals = self._rooms.get(room_id, [])
+        position = bisect_left(intervals, (check_in, check_out, booking_id))
+        if position < len(intervals) and intervals[position][2] == booking_id:
+            del intervals[position]
+
+    def apply_booking_event(self, booking: Dict[str, object]):
+        """Применить изменение бронирования, сделанное в другом воркере"""
+        if booking.get("status") == "cancelled":
+            self.remove(booking["id"])
+        else:
+            self.add(booking["id"], booking["room_id"], booking["check_in"], booking["check_out"])
+
+    def is_free(self, room_id: int, check_in, check_out) -> bool:
+        """Свободен ли номер в интервале [check_in, check_out)"""
+        check_in = _as_date(check_in)
+        check_out = _as_date(check_out)
+        intervals = self._rooms.get(room_id)
+        if not intervals:
+            return True
+
+        # Пересекаться могут только бронирования, начавшиеся не раньше чем
+        # check_in - max_nights и до check_out
+        earliest = check_in - timedelta(days=self._max_nights.get(room_id, 0))
+        start = bisect_left(intervals, (earliest,))
+        end = bisect_left(intervals, (check_out,))
+        for position in range(start, end):
+            if intervals[position][1] > check_in:
+                return False
+        return True
+
+    def free_rooms(self, room_ids: Iterable[int], check_in, check_out) -> List[int]:
+        """Отфильтровать номера, свободные в интервале [check_in, check_out)"""
+        check_in = _as_date(check_in)
+        check_out = _as_date(check_out)
+        return [room_id for room_id in room_ids if self.is_free(room_id, check_in, check_out)]
+
+    async def check_consistency(self, db: AsyncSession) -> Dict[str, object]:
+        """Сравнить индекс с базой и перестроить его при расхождении"""
+        rows = await self._fetch(db)
+        expected = {
+            booking_id: (room_id, _as_date(check_in), _as_date(check_out))
+            for booking_id, room_id, check_in, check_out in rows
+        }
+
+        missing: Set[int] = set(expected) - set(self._bookings)
+        stale: Set[int] = set(self._bookings) - set(expected)
+        changed: Set[int] = {
+            booking_id for booking_id in set(expected) & set(self._bookings)
+            if expected[booking_id] != self._bookings[booking_id]
+        }
+        consistent = not (missing or stale or changed)
+
+        if not consistent:
+            logger.warning(
+                f"Occupancy index out of sync: {len(missing)} missing, "
+                f"{len(stale)} stale, {len(changed)} changed - rebuilding"
+            )
+            self._build(rows)
+        self.is_warm = True
+        self.loaded_at = time.monotonic()
+
+        return {
+            "consistent": consistent,
+            "bookings": len(expected),
+            "missing": sorted(missing),
+            "stale": sorted(stale),
+            "changed": sorted(changed),
+        }
+
+
+# Общий индекс процесса
+occupancy_index = OccupancyIndex()
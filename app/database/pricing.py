@@ -0,0 +1,96 @@
+"""
+Расчет стоимости проживания.
+
+Цена ночи зависит от дня недели (ПН-ЧТ - price_per_night, ПТ-ВС -
+weekend_price), за гостей сверх вместимости берется доплата. Количество
+ночей по дням недели считается арифметикой по диапазону дат, без цикла
+по дням, поэтому один диапазон дат можно оценить сразу для многих номеров.
+
+season_type номера на цену и на возможность бронирования не влияет: это
+только фильтр поиска (crud.get_available_rooms).
+"""
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+# Пятница, суббота, воскресенье
+WEEKEND_DAYS = (4, 5, 6)
+
+# Доплата за каждого гостя сверх вместимости - 30% от цены ночи
+EXTRA_GUEST_RATE = 0.3
+
+
+def _as_date(value) -> date:
+    """Привести datetime/date/строку YYYY-MM-DD к date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value), "%Y-%m-%d").date()
+
+
+@lru_cache(maxsize=1024)
+def rate_calendar(price_per_night: float, weekend_price: Optional[float]) -> Tuple[float, ...]:
+    """Цена ночи для каждого дня недели (0 - понедельник)"""
+    weekend = weekend_price or price_per_night
+    return tuple(weekend if day in WEEKEND_DAYS else price_per_night for day in range(7))
+
+
+def nights_by_weekday(check_in: date, check_out: date) -> Tuple[int, ...]:
+    """Сколько ночей диапазона приходится на каждый день недели"""
+    nights = (check_out - check_in).days
+    full_weeks, rest = divmod(max(nights, 0), 7)
+    start = check_in.weekday()
+    return tuple(
+        full_weeks + (1 if (day - start) % 7 < rest else 0)
+        for day in range(7)
+    )
+
+
+def quote_room(room, check_in, check_out, guests: Optional[int] = None,
+               weekday_nights: Optional[Tuple[int, ...]] = None) -> Dict[str, object]:
+    """Рассчитать стоимость проживания в номере.
+
+    weekday_nights можно передать заранее, чтобы не считать его для каждого номера.
+    """
+    check_in = _as_date(check_in)
+    check_out = _as_date(check_out)
+    nights = (check_out - check_in).days
+    if nights <= 0:
+        raise ValueError("Check-out date must be after check-in date")
+
+    if weekday_nights is None:
+        weekday_nights = nights_by_weekday(check_in, check_out)
+
+    rates = rate_calendar(room.price_per_night, getattr(room, "weekend_price", None))
+    base_price = sum(count * rate for count, rate in zip(weekday_nights, rates))
+    weekend_nights = sum(weekday_nights[day] for day in WEEKEND_DAYS)
+
+    extra_guests = max(0, (guests or 0) - room.capacity)
+    extra_fee = extra_guests * base_price * EXTRA_GUEST_RATE
+
+    return {
+        "room_id": room.id,
+        "room_name": room.name,
+        "room_price": room.price_per_night,
+        "weekend_price": rates[WEEKEND_DAYS[0]],
+        "nights": nights,
+        "weekday_nights": nights - weekend_nights,
+        "weekend_nights": weekend_nights,
+        "extra_guests": extra_guests,
+        "extra_fee": extra_fee,
+        "total_price": base_price + extra_fee,
+    }
+
+
+def quote_rooms(rooms: Iterable, check_in, check_out,
+                guests: Optional[int] = None) -> Dict[int, Dict[str, object]]:
+    """Рассчитать стоимость одного диапазона дат сразу для многих номеров"""
+    check_in = _as_date(check_in)
+    check_out = _as_date(check_out)
+    weekday_nights = nights_by_weekday(check_in, check_out)
+
+    return {
+        room.id: quote_room(room, check_in, check_out, guests, weekday_nights)
+        for room in rooms
+    }
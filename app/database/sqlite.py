@@ -0,0 +1,55 @@
+"""
+Настройка соединений SQLite.
+
+На каждом новом соединении включаются WAL и прагмы производительности.
+Соединения записи открывают транзакцию через BEGIN IMMEDIATE (блокировка
+записи берется сразу, а не при первом INSERT, поэтому конкурирующие
+процессы ждут busy_timeout, а не получают "database is locked" посреди
+транзакции) и поддерживают SAVEPOINT. Соединения чтения работают с
+query_only и никогда не берут блокировку записи.
+"""
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import SQLITE_BUSY_TIMEOUT, SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def _pragmas(read_only: bool):
+    pragmas = [
+        f"busy_timeout={SQLITE_BUSY_TIMEOUT}",
+        "synchronous=NORMAL",
+        f"cache_size={SQLITE_CACHE_SIZE}",
+        f"mmap_size={SQLITE_MMAP_SIZE}",
+        "temp_store=MEMORY",
+    ]
+    if read_only:
+        pragmas.append("query_only=ON")
+    else:
+        # Режим журнала хранится в файле базы, достаточно соединения записи
+        pragmas.insert(0, "journal_mode=WAL")
+    return pragmas
+
+
+def configure_sqlite(engine: Engine, read_only: bool = False):
+    """Подключить обработчики событий к (синхронному) движку SQLite"""
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        if not read_only:
+            # Транзакциями управляет SQLAlchemy (см. on_begin), а не драйвер
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in _pragmas(read_only):
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+    if not read_only:
+        @event.listens_for(engine, "begin")
+        def on_begin(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    logger.info(f"SQLite {'read' if read_only else 'write'} engine configured: {', '.join(_pragmas(read_only))}")
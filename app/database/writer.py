@@ -0,0 +1,153 @@
+"""
+Сериализованная запись в базу.
+
+SQLite допускает только одного писателя: параллельные commit из разных
+сессий упираются в "database is locked". Поэтому все операции записи
+(create_user, create_booking, add_room_review, ...) ставятся в очередь и
+выполняются одной задачей на единственном соединении записи. Операции,
+накопившиеся в очереди, выполняются пачкой в одной транзакции, каждая в своем
+SAVEPOINT, и фиксируются одним commit.
+
+Операция - это корутина job(session), которая меняет данные и делает flush,
+но не commit. Для PostgreSQL очередь не нужна: job выполняется сразу в сессии
+вызывающего кода и фиксируется обычным commit.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import DB_WRITE_BATCH_SIZE
+from app.database import WriteSessionLocal, SERIALIZED_WRITES
+
+logger = logging.getLogger(__name__)
+
+WriteJob = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class DatabaseWriter:
+    """Очередь операций записи с пакетным commit"""
+
+    def __init__(self, session_factory=WriteSessionLocal, serialized: bool = SERIALIZED_WRITES,
+                 max_batch: int = DB_WRITE_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.serialized = serialized
+        self.max_batch = max(1, max_batch)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.jobs = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+        self._commit_total = 0.0
+
+    async def run(self, job: WriteJob, session: Optional[AsyncSession] = None) -> Any:
+        """Выполнить операцию записи и дождаться commit, вернуть результат job"""
+        if not self.serialized:
+            if session is not None:
+                return await self._run_single(job, session)
+            async with self.session_factory() as own_session:
+                return await self._run_single(job, own_session)
+
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((job, future))
+        return await future
+
+    async def _run_single(self, job: WriteJob, session: AsyncSession) -> Any:
+        try:
+            result = await job(session)
+            await session.commit()
+        except Exception:
+            self.failed += 1
+            await session.rollback()
+            raise
+        self.jobs += 1
+        return result
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._worker())
+            logger.info("Database writer started")
+
+    async def _worker(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._commit_batch(batch)
+            except Exception as e:
+                logger.error(f"Database writer batch failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit_batch(self, batch: List[Tuple[WriteJob, asyncio.Future]]):
+        """Выполнить пачку операций в одной транзакции, каждую в своем SAVEPOINT"""
+        started = time.monotonic()
+        outcomes = []
+        async with self.session_factory() as session:
+            for job, future in batch:
+                if future.cancelled():
+                    continue
+                try:
+                    async with session.begin_nested():
+                        result = await job(session)
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    outcomes.append((future, None, e))
+
+            await session.commit()
+
+        self.batches += 1
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self._commit_total += time.monotonic() - started
+
+        # Результаты отдаются только после commit
+        for future, result, error in outcomes:
+            if error is not None:
+                self.failed += 1
+            else:
+                self.jobs += 1
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def stop(self, drain_timeout: float = 10):
+        """Дописать операции из очереди и остановить задачу"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Database writer stopped with {self._queue.qsize()} pending writes")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def stats(self):
+        return {
+            "serialized": self.serialized,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": self.jobs,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch": round(self.jobs / self.batches, 2) if self.batches else 0,
+            "max_batch": self.max_batch_seen,
+            "avg_commit_ms": round(self._commit_total / self.batches * 1000, 2) if self.batches else 0,
+        }
+
+
+# Общий writer процесса
+db_writer = DatabaseWriter()
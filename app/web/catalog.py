@@ -0,0 +1,169 @@
+"""
+Кеш каталога номеров для API.
+
+Ответы /api/rooms и /api/rooms/{room_id} сериализуются orjson один раз и
+хранятся готовыми байтами вместе с ETag (хеш содержимого). Кеш
+перестраивается после invalidate(), то есть при изменении номеров через
+приложение, и не реже раза в CATALOG_TTL секунд - чтобы подхватить
+изменения, сделанные в обход него (update_images.py, db_reset.py, SQL).
+ETag зависит только от содержимого, поэтому перестройка без изменений не
+сбрасывает кеш клиентов.
+invalidate() увеличивает версию каталога: ответ, собранный по данным,
+прочитанным до сброса, возвращается запросу, но не сохраняется.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.crud import get_all_rooms, get_room
+
+logger = logging.getLogger(__name__)
+
+# Срок жизни каталога, как у клавиатуры номеров (app.bot.keyboards.ROOMS_KEYBOARD_TTL)
+CATALOG_TTL = 300
+
+
+def _parse_json_list(value) -> list:
+    """Разобрать JSON-массив из текстового поля, при ошибке - пустой список"""
+    if not value:
+        return []
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return []
+
+
+def _weekend_price(room):
+    return room.weekend_price if hasattr(room, "weekend_price") and room.weekend_price else None
+
+
+def _encode(payload) -> Tuple[bytes, str]:
+    """Сериализовать ответ и посчитать строгий ETag"""
+    body = orjson.dumps(payload)
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    return body, etag
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+def cached_json_response(request: Request, body: bytes, etag: str) -> Response:
+    """Ответ с ETag; 304 без тела, если у клиента актуальная версия"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class RoomCatalog:
+    """Готовые к отправке JSON-ответы по номерам"""
+
+    def __init__(self, ttl: float = CATALOG_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._list: Optional[Tuple[bytes, str]] = None
+        self._details: Dict[int, Tuple[bytes, str]] = {}
+        self._expires = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        """Сбросить кеш - следующий запрос перестроит его из базы"""
+        self.version += 1
+        self._list = None
+        self._details = {}
+
+    def _expire(self):
+        if (self._list is not None or self._details) and time.monotonic() >= self._expires:
+            self.invalidate()
+
+    def _stored(self):
+        """Первый ответ новой версии задает срок жизни всего каталога"""
+        if self._list is None and not self._details:
+            self._expires = time.monotonic() + self.ttl
+
+    async def rooms_list(self, db: AsyncSession) -> Tuple[bytes, str]:
+        """Список всех номеров (тело ответа и ETag)"""
+        self._expire()
+        if self._list is not None:
+            return self._list
+
+        async with self._lock:
+            if self._list is not None:
+                return self._list
+
+            version = self.version
+            rooms = await get_all_rooms(db)
+            cached = _encode({
+                "success": True,
+                "rooms": [
+                    {
+                        "id": room.id,
+                        "name": room.name,
+                        "description": room.description,
+                        "type": room.room_type,
+                        "price": room.price_per_night,
+                        "weekend_price": _weekend_price(room),
+                        "capacity": room.capacity,
+                        "available": room.is_available,
+                        "image_url": room.image_url
+                    }
+                    for room in rooms
+                ]
+            })
+            logger.info(f"Room catalogue serialized: {len(rooms)} rooms, {len(cached[0])} bytes")
+            # Если во время загрузки номера изменились, не сохраняем устаревший ответ
+            if version == self.version:
+                self._stored()
+                self._list = cached
+            return cached
+
+    async def room_details(self, db: AsyncSession, room_id: int) -> Optional[Tuple[bytes, str]]:
+        """Данные одного номера (тело ответа и ETag) или None, если номера нет"""
+        self._expire()
+        cached = self._details.get(room_id)
+        if cached is not None:
+            return cached
+
+        version = self.version
+        room = await get_room(db, room_id)
+        if not room:
+            return None
+
+        cached = _encode({
+            "success": True,
+            "room": {
+                "id": room.id,
+                "name": room.name,
+                "description": room.description,
+                "type": room.room_type,
+                "price": room.price_per_night,
+                "weekend_price": _weekend_price(room),
+                "capacity": room.capacity,
+                "available": room.is_available,
+                "image_url": room.image_url,
+                "photos": _parse_json_list(room.photos),
+                "video_url": room.video_url,
+                "amenities": _parse_json_list(room.amenities)
+            }
+        })
+        if version == self.version:
+            self._stored()
+            self._details[room_id] = cached
+        return cached
+
+
+# Общий каталог процесса
+room_catalog = RoomCatalog()
@@ -5,14 +5,16 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 import datetime
 import logging
-import json
 
 from app.database import get_db
 from app.database.crud import (
-    get_user_by_telegram_id, create_user, get_all_rooms, get_room,
-    get_available_rooms, create_booking, get_user_bookings
+    get_user_by_telegram_id, upsert_user, get_all_rooms, get_room,
+    get_available_rooms, create_booking, get_user_bookings, mark_admin_notified,
+    BookingConflictError
 )
 from app.bot.utils import calculate_booking_price
+from app.database.pricing import quote_rooms
+from app.web.catalog import room_catalog, cached_json_response
 from app.config import BOT_TOKEN, ADMIN_TELEGRAM_ID
 
 router = APIRouter()
@@ -41,78 +43,59 @@ async def webapp(request: Request, room_id: Optional[int] = None, db: AsyncSessi
 
 
 @router.get("/api/rooms")
-async def get_rooms(db: AsyncSession = Depends(get_db)):
+async def get_rooms(request: Request, db: AsyncSession = Depends(get_db)):
     """API-эндпоинт для получения всех номеров"""
     try:
-        # Используем await здесь
-        rooms = await get_all_rooms(db)
-
-        return {
-            "success": True,
-            "rooms": [
-                {
-                    "id": room.id,
-                    "name": room.name,
-                    "description": room.description,
-                    "type": room.room_type,
-                    "price": room.price_per_night,
-                    "weekend_price": room.weekend_price if hasattr(room,
-                                                                   "weekend_price") and room.weekend_price else None,
-                    "capacity": room.capacity,
-                    "available": room.is_available,
-                    "image_url": room.image_url
-                }
-                for room in rooms
-            ]
-        }
+        body, etag = await room_catalog.rooms_list(db)
+        return cached_json_response(request, body, etag)
     except Exception as e:
         logger.error(f"Error getting rooms: {e}")
         return {"success": False, "detail": str(e)}
 
 
-@router.get("/api/rooms/{room_id}")
-async def get_room_details(room_id: int, db: AsyncSession = Depends(get_db)):
-    """API-эндпоинт для получения данных о конкретном номере"""
-    room = await get_room(db, room_id)
-    if not room:
-        raise HTTPException(status_code=404, detail="Room not found")
-
-    # Парсим JSON-поля
-    amenities = []
-    photos = []
-
-    if room.amenities:
-        try:
-            amenities = json.loads(room.amenities)
-        except:
-            amenities = []
-
-    if room.photos:
-        try:
-            photos = json.loads(room.photos)
-        except:
-            photos = []
+@router.get("/api/available-rooms")
+async def get_free_rooms(
+        check_in: str,
+        check_out: str,
+        guests: Optional[int] = None,
+        room_type: Optional[str] = None,
+        db: AsyncSession = Depends(get_db)
+):
+    """API-эндпоинт для поиска свободных номеров на даты с ценами"""
+    try:
+        rooms = await get_available_rooms(db, check_in, check_out, capacity=guests, room_type=room_type)
+        quotes = quote_rooms(rooms, check_in, check_out, guests)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     return {
         "success": True,
-        "room": {
-            "id": room.id,
-            "name": room.name,
-            "description": room.description,
-            "type": room.room_type,
-            "price": room.price_per_night,
-            "weekend_price": room.weekend_price if hasattr(room, "weekend_price") and room.weekend_price else None,
-            "capacity": room.capacity,
-            "available": room.is_available,
-            "image_url": room.image_url,
-            "photos": photos,
-            "video_url": room.video_url,
-            "amenities": amenities
-            # Удалите строку "weekend_price REAL"
-        }
+        "rooms": [
+            {
+                "id": room.id,
+                "name": room.name,
+                "type": room.room_type,
+                "capacity": room.capacity,
+                "image_url": room.image_url,
+                "nights": quotes[room.id]["nights"],
+                "total_price": quotes[room.id]["total_price"]
+            }
+            for room in rooms
+        ]
     }
 
 
+@router.get("/api/rooms/{room_id}")
+async def get_room_details(room_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """API-эндпоинт для получения данных о конкретном номере"""
+    cached = await room_catalog.room_details(db, room_id)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+
+    body, etag = cached
+    return cached_json_response(request, body, etag)
+
+
 @router.post("/api/calculate-price")
 async def calculate_price(
         room_id: int = Form(...),
@@ -155,11 +138,8 @@ async def book_room(
 ):
     """API-эндпоинт для создания бронирования"""
     try:
-        # Проверяем и получаем пользователя
-        user = await get_user_by_telegram_id(db, telegram_id)
-        if not user:
-            # Создаем пользователя, если он не существует
-            user = await create_user(db, telegram_id)
+        # Получаем или создаем пользователя одним запросом (или из кеша)
+        user = await upsert_user(db, telegram_id, update_profile=False)
 
         # Проверяем и получаем номер
         room = await get_room(db, room_id)
@@ -210,8 +190,7 @@ async def book_room(
                 )
 
                 # Отмечаем что администратор уведомлен
-                booking.admin_notified = True
-                await db.commit()
+                await mark_admin_notified(db, booking.id)
                 logger.info(f"Admin notification for booking #{booking.id} sent successfully")
 
         except Exception as e:
@@ -223,6 +202,9 @@ async def book_room(
             "booking_id": booking.id,
             "message": "Бронирование успешно создано!"
         }
+    except BookingConflictError as e:
+        # Даты уже заняты (в том числе параллельным бронированием)
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         # Обработка ошибок валидации из функции create_booking
         raise HTTPException(status_code=400, detail=str(e))
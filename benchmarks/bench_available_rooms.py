@@ -0,0 +1,104 @@
+"""
+Бенчмарк поиска свободных номеров: старый цикл N+1 против одного запроса.
+
+Запуск: python benchmarks/bench_available_rooms.py
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.database.models import Base, User, Room, Booking
+from app.database.crud import get_all_rooms, check_room_availability, get_available_rooms
+
+ROOM_COUNTS = [10, 100, 1000]
+BOOKING_COUNT = 100_000
+REPEATS = 5
+START = date(2025, 1, 1)
+
+
+async def legacy_get_available_rooms(db, check_in, check_out):
+    """Прежняя реализация: отдельная проверка для каждого номера"""
+    available_rooms = []
+    for room in await get_all_rooms(db):
+        if await check_room_availability(db, room.id, check_in, check_out):
+            available_rooms.append(room)
+    return available_rooms
+
+
+async def seed(engine, room_count):
+    """Создать схему, номера и BOOKING_COUNT бронирований"""
+    rnd = random.Random(room_count)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User), [{"telegram_id": 1, "username": "bench"}])
+        await conn.execute(insert(Room), [
+            {
+                "name": f"Room {i}",
+                "room_type": rnd.choice(["standard", "luxury", "vip", "cottage"]),
+                "price_per_night": rnd.randint(3, 40) * 100000,
+                "capacity": rnd.choice([2, 4, 6, 8]),
+                "season_type": "all",
+            }
+            for i in range(room_count)
+        ])
+
+        bookings = []
+        for _ in range(BOOKING_COUNT):
+            check_in = START + timedelta(days=rnd.randint(0, 730))
+            bookings.append({
+                "user_id": 1,
+                "room_id": rnd.randint(1, room_count),
+                "check_in": check_in,
+                "check_out": check_in + timedelta(days=rnd.randint(1, 5)),
+                "guests": 2,
+                "total_price": 1000000,
+                "status": rnd.choice(["pending", "confirmed", "confirmed", "cancelled"]),
+            })
+        await conn.execute(insert(Booking), bookings)
+
+
+async def measure(session_factory, func, check_in, check_out):
+    """Среднее время вызова в миллисекундах"""
+    timings = []
+    for _ in range(REPEATS):
+        async with session_factory() as session:
+            started = time.perf_counter()
+            rooms = await func(session, check_in, check_out)
+            timings.append(time.perf_counter() - started)
+    return sum(timings) / len(timings) * 1000, len(rooms)
+
+
+async def run(room_count):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/bench.db")
+        session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        await seed(engine, room_count)
+
+        check_in, check_out = "2025-07-10", "2025-07-13"
+        legacy_ms, legacy_found = await measure(session_factory, legacy_get_available_rooms, check_in, check_out)
+        single_ms, single_found = await measure(session_factory, get_available_rooms, check_in, check_out)
+        await engine.dispose()
+
+    assert legacy_found == single_found, "results differ"
+    print(f"{room_count:>5} rooms | loop {legacy_ms:9.2f} ms | single query {single_ms:8.2f} ms | "
+          f"x{legacy_ms / single_ms:6.1f} | {single_found} free")
+
+
+async def main():
+    print(f"{BOOKING_COUNT} bookings, {REPEATS} runs each")
+    for room_count in ROOM_COUNTS:
+        await run(room_count)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,145 @@
+"""
+Бенчмарк маршрутизации callback_query.
+
+Сравнивает прежнюю схему (отдельный хендлер на каждую кнопку с
+lambda-фильтром по строке, aiogram проверяет фильтры по очереди) с
+CallbackDispatcher (один хендлер, префикс -> хендлер в словаре) для всех
+типов кнопок бота: время выбора хендлера роутером (observer.trigger, без
+middleware и разбора Update) при ничего не делающих хендлерах. Также
+печатается длина callback_data.
+
+Прежний роутер содержит только фильтры, которые были в исходном handlers.py.
+Кнопки календаря и "ignore" клавиатуры отправляли, но хендлеров для них не
+было: для них (отмечены *) прежнее время - проверка всех фильтров без
+совпадения. Среднее считается только по кнопкам, которые прежний код
+обрабатывал.
+
+Запуск: python benchmarks/bench_callbacks.py
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import F, Router
+from aiogram.types import CallbackQuery
+
+from app.bot.callbacks import (
+    CallbackDispatcher, IgnoreCB, BackToMainCB, BackToRoomsCB, PhoneNumberCB, CallSupportCB,
+    RoomTypeCB, RoomCB, ReviewsCB, VideoTourCB, PhotosCB, QuickBookCB, ExpressBookCB,
+    CalendarBookCB, CalendarCB, SelectDateCB, BusyDateCB, UnselectDateCB, day_code
+)
+
+NUMBER = 2000
+
+DAY = date(2026, 7, 10)
+
+# Тип кнопки -> (прежний payload, новый payload)
+PAYLOADS = {
+    "room_type": ("room_type_apartment", RoomTypeCB(room_type="apartment").pack()),
+    "room": ("room_12", RoomCB(room_id=12).pack()),
+    "phone_number": ("phone_number", PhoneNumberCB().pack()),
+    "call_support": ("call_support", CallSupportCB().pack()),
+    "back_to_main": ("back_to_main", BackToMainCB().pack()),
+    "back_to_rooms": ("back_to_rooms", BackToRoomsCB().pack()),
+    "reviews": ("reviews_12", ReviewsCB(room_id=12).pack()),
+    "video_tour": ("video_tour_12", VideoTourCB(room_id=12).pack()),
+    "all_photos": ("all_photos_12", PhotosCB(room_id=12).pack()),
+    "quick_book": ("quick_book_12", QuickBookCB(room_id=12).pack()),
+    "calendar_book": ("calendar_book_12", CalendarBookCB(room_id=12).pack()),
+    "calendar": ("calendar_2026_7", CalendarCB(year=2026, month=7).pack()),
+    "select_date": (f"select_date_{DAY}", SelectDateCB(day=day_code(DAY)).pack()),
+    "busy_date": (f"busy_date_{DAY}", BusyDateCB(day=day_code(DAY)).pack()),
+    "unselect_date": (f"unselect_date_{DAY}", UnselectDateCB(day=day_code(DAY)).pack()),
+    "ignore": ("ignore", IgnoreCB().pack()),
+    "express_book": (
+        f"express_book_12_{DAY}_{DAY + timedelta(days=3)}",
+        ExpressBookCB.for_dates(12, DAY, DAY + timedelta(days=3)).pack()
+    ),
+}
+
+# Кнопки без хендлера в исходном handlers.py
+UNHANDLED = {"calendar_book", "calendar", "select_date", "busy_date", "unselect_date", "ignore"}
+
+
+async def noop(*args, **kwargs):
+    pass
+
+
+def legacy_router() -> Router:
+    """Фильтры исходного handlers.py в порядке регистрации"""
+    router = Router()
+    filters = [
+        lambda c: c.data and c.data.startswith("room_type_"),
+        lambda c: c.data and c.data.startswith("room_") and len(c.data.split("_")) == 2,
+        F.data == "phone_number",
+        F.data == "call_support",
+        F.data == "back_to_main",
+        F.data == "back_to_rooms",
+        lambda c: c.data and c.data.startswith("reviews_"),
+        lambda c: c.data and c.data.startswith("video_tour_"),
+        lambda c: c.data and c.data.startswith("all_photos_"),
+        lambda c: c.data and c.data.startswith("quick_book_"),
+        lambda c: c.data and c.data.startswith("express_book_"),
+    ]
+    for callback_filter in filters:
+        router.callback_query.register(noop, callback_filter)
+    return router
+
+
+def dispatch_router() -> Router:
+    router = Router()
+    callbacks = CallbackDispatcher()
+    callbacks.register(
+        IgnoreCB, BackToMainCB, BackToRoomsCB, PhoneNumberCB, CallSupportCB, RoomTypeCB, RoomCB,
+        ReviewsCB, VideoTourCB, PhotosCB, QuickBookCB, ExpressBookCB, CalendarBookCB, CalendarCB,
+        SelectDateCB, BusyDateCB, UnselectDateCB
+    )(noop)
+    router.callback_query.register(callbacks.dispatch, callbacks.filter)
+    return router
+
+
+def callback_query(data: str) -> CallbackQuery:
+    user = {"id": 123456789, "is_bot": False, "first_name": "Азиз"}
+    chat = {"id": 123456789, "type": "private"}
+    return CallbackQuery.model_validate({
+        "id": "1", "from": user, "chat_instance": "-1", "data": data,
+        "message": {"message_id": 1, "date": 0, "chat": chat, "text": "x"},
+    })
+
+
+async def per_update_us(router: Router, callback: CallbackQuery) -> float:
+    trigger = router.callback_query.trigger
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(NUMBER):
+            await trigger(callback)
+        best = min(best, time.perf_counter() - started)
+    return best / NUMBER * 1_000_000
+
+
+async def main():
+    legacy, dispatch = legacy_router(), dispatch_router()
+
+    print(f"{NUMBER} callbacks per type, best of 3 (µs to route one callback)")
+    print(f"{'callback':<15} {'old µs':>8} {'new µs':>8} {'old bytes':>10} {'new bytes':>10}")
+    totals = [0.0, 0.0]
+    for name, (old_data, new_data) in PAYLOADS.items():
+        old = await per_update_us(legacy, callback_query(old_data))
+        new = await per_update_us(dispatch, callback_query(new_data))
+        if name not in UNHANDLED:
+            totals[0] += old
+            totals[1] += new
+        label = f"{name}*" if name in UNHANDLED else name
+        print(f"{label:<15} {old:8.1f} {new:8.1f} {len(old_data.encode()):10} {len(new_data.encode()):10}")
+    handled = len(PAYLOADS) - len(UNHANDLED)
+    print(f"{'average':<15} {totals[0] / handled:8.1f} {totals[1] / handled:8.1f}")
+    print("* no handler in the original handlers.py: old time is a miss through all filters")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+Бенчмарк построения клавиатур бота.
+
+Сравнивает сборку InlineKeyboardMarkup/ReplyKeyboardMarkup на каждое
+сообщение (прежний путь) с готовыми клавиатурами из app.bot.keyboards:
+время на вызов и память, выделяемая на одно обновление (объекты,
+созданные вызовом и удерживаемые до отправки ответа).
+
+Запуск: python benchmarks/bench_keyboards.py
+"""
+import asyncio
+import os
+import sys
+import timeit
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.bot import keyboards
+from app.bot.keyboards import KeyboardRegistry, rooms_keyboard
+
+NUMBER = 5000
+
+ROOM_TYPES = ["standard", "luxury", "vip", "apartment", "cottage", "president", "tapchan"]
+ROOMS = [
+    SimpleNamespace(
+        id=i,
+        name=f"Номер {i}",
+        room_type=ROOM_TYPES[i % len(ROOM_TYPES)],
+        price_per_night=700000 + i * 10000,
+        weekend_price=900000 if i % 2 else None
+    )
+    for i in range(1, 21)
+]
+
+
+async def load_rooms():
+    return ROOMS
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+def per_call_us(func) -> float:
+    return min(timeit.repeat(func, number=NUMBER, repeat=3)) / NUMBER * 1_000_000
+
+
+def bytes_per_call(func, calls: int = 500) -> float:
+    """Память, удерживаемая результатами calls вызовов, в пересчете на один вызов"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results = [func() for _ in range(calls)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del results
+    return size / calls
+
+
+def main():
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    registry = KeyboardRegistry()
+    run(registry.rooms(load_rooms))
+
+    cases = {
+        "main_keyboard": (keyboards._build_main_keyboard, keyboards.main_keyboard),
+        "support_keyboard": (keyboards._build_support_keyboard, keyboards.support_keyboard),
+        "assistant_keyboard": (keyboards._build_assistant_keyboard, keyboards.assistant_keyboard),
+        "promotions_keyboard": (keyboards._build_promotions_keyboard, keyboards.promotions_keyboard),
+        "rooms_keyboard (20)": (lambda: rooms_keyboard(ROOMS), lambda: run(registry.rooms(load_rooms))),
+        "room_detail_keyboard": (
+            lambda: keyboards.room_detail_keyboard.__wrapped__(7, has_video=True),
+            lambda: keyboards.room_detail_keyboard(7, has_video=True)
+        ),
+    }
+
+    print(f"{NUMBER} iterations, best of 3")
+    print(f"{'keyboard':<22} {'build µs':>9} {'cached µs':>10} {'build B/upd':>12} {'cached B/upd':>13}")
+    for name, (build, cached) in cases.items():
+        print(
+            f"{name:<22} {per_call_us(build):9.2f} {per_call_us(cached):10.2f} "
+            f"{bytes_per_call(build):12.0f} {bytes_per_call(cached):13.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Бенчмарк разбора webhook-обновлений Telegram и сериализации ответов API.
+
+Сравнивает прежний путь (json.loads -> dict -> Update.model_validate,
+stdlib JSONResponse) с новым (Update.model_validate_json из байтов,
+ORJSONResponse).
+
+Запуск: python benchmarks/bench_webhook_parse.py
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.types import Update
+from fastapi.responses import JSONResponse
+
+from app.web.responses import ORJSONResponse
+
+NUMBER = 20000
+
+USER = {"id": 123456789, "is_bot": False, "first_name": "Азиз", "username": "aziz", "language_code": "ru"}
+CHAT = {"id": 123456789, "first_name": "Азиз", "username": "aziz", "type": "private"}
+
+UPDATES = {
+    "message": {
+        "update_id": 100000001,
+        "message": {
+            "message_id": 42,
+            "from": USER,
+            "chat": CHAT,
+            "date": 1735689600,
+            "text": "🛏️ Номера"
+        }
+    },
+    "callback_query": {
+        "update_id": 100000002,
+        "callback_query": {
+            "id": "4382bfdwdsb323b2d9",
+            "from": USER,
+            "chat_instance": "-7281728172817281",
+            "data": "express_book_3_2025-07-10_2025-07-13",
+            "message": {
+                "message_id": 43,
+                "from": {"id": 987654321, "is_bot": True, "first_name": "Oqtoshsoy", "username": "oqtoshsoy_bot"},
+                "chat": CHAT,
+                "date": 1735689600,
+                "text": "⚡ Быстрое бронирование"
+            }
+        }
+    },
+}
+
+ROOMS_PAYLOAD = {
+    "success": True,
+    "rooms": [
+        {
+            "id": i,
+            "name": f"Стандарт {i}-х местный",
+            "description": "Уютный номер для двух человек с видом на горы.",
+            "type": "standard",
+            "price": 700000.0,
+            "weekend_price": 900000.0,
+            "capacity": 2,
+            "available": True,
+            "image_url": "https://i.imgur.com/ZXBtVw7.jpg"
+        }
+        for i in range(10)
+    ]
+}
+
+
+def per_call_us(stmt) -> float:
+    return min(timeit.repeat(stmt, number=NUMBER, repeat=3)) / NUMBER * 1_000_000
+
+
+def main():
+    print(f"{NUMBER} iterations, best of 3 (µs per call)")
+    for name, update in UPDATES.items():
+        body = json.dumps(update).encode()
+        before = per_call_us(lambda: Update.model_validate(json.loads(body)))
+        after = per_call_us(lambda: Update.model_validate_json(body))
+        print(f"parse {name:<15} dict path {before:7.2f} | bytes path {after:7.2f} | x{before / after:4.2f}")
+
+    before = per_call_us(lambda: JSONResponse(ROOMS_PAYLOAD))
+    after = per_call_us(lambda: ORJSONResponse(ROOMS_PAYLOAD))
+    print(f"render /api/rooms     JSONResponse {before:7.2f} | ORJSONResponse {after:7.2f} | x{before / after:4.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Проверка гонок при бронировании.
+
+Скрипт запускает несколько процессов, каждый из которых параллельно
+вызывает crud.create_booking для небольшого числа номеров со случайными
+пересекающимися датами. Затем проверяет в базе, что ни одна пара активных
+бронирований одного номера не пересекается. Завершается с кодом 1 при
+пересечениях или неожиданных ошибках.
+
+По умолчанию используется временная база SQLite; для PostgreSQL передайте
+--database-url (нужна отдельная пустая база - таблицы будут созданы).
+
+Запуск: python check_booking_race.py [--bookings 400] [--processes 4] [--rooms 3]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+START_DATE = date(2031, 7, 1)
+USERS = 50
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bookings", type=int, default=400, help="total booking attempts")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--rooms", type=int, default=3)
+    parser.add_argument("--days", type=int, default=30, help="range of check-in dates")
+    parser.add_argument("--database-url", default=None)
+    return parser.parse_args()
+
+
+async def setup(rooms: int):
+    from sqlalchemy import insert
+    from app.database import engine, read_engine, init_db
+    from app.database.models import User, Room
+
+    await init_db()
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), [{"telegram_id": 700000 + i} for i in range(USERS)])
+        await conn.execute(insert(Room), [
+            {"name": f"Race room {i}", "room_type": "standard", "price_per_night": 100000,
+             "capacity": 4, "is_available": True}
+            for i in range(rooms)
+        ])
+    await engine.dispose()
+    await read_engine.dispose()
+
+
+async def attempt_bookings(count: int, rooms: int, days: int, seed: int):
+    from app.database import engine, read_engine, SessionLocal
+    from app.database.crud import create_booking, BookingConflictError
+    from app.database.writer import db_writer
+
+    rnd = random.Random(seed)
+    results = {"created": 0, "conflicts": 0, "errors": []}
+
+    async def one():
+        check_in = START_DATE + timedelta(days=rnd.randrange(days))
+        check_out = check_in + timedelta(days=rnd.randint(1, 4))
+        async with SessionLocal() as db:
+            try:
+                await create_booking(
+                    db, user_id=rnd.randint(1, USERS), room_id=rnd.randint(1, rooms),
+                    check_in=check_in.isoformat(), check_out=check_out.isoformat(), guests=2
+                )
+                results["created"] += 1
+            except BookingConflictError:
+                results["conflicts"] += 1
+            except Exception as e:
+                results["errors"].append(f"{type(e).__name__}: {e}")
+
+    await asyncio.gather(*(one() for _ in range(count)))
+    await db_writer.stop()
+    await engine.dispose()
+    await read_engine.dispose()
+    return results
+
+
+def worker(count: int, rooms: int, days: int, seed: int, queue):
+    queue.put(asyncio.run(attempt_bookings(count, rooms, days, seed)))
+
+
+async def find_overlaps():
+    from sqlalchemy import text
+    from app.database import engine
+
+    async with engine.connect() as conn:
+        overlaps = (await conn.execute(text(
+            "SELECT a.id, b.id, a.room_id FROM bookings a JOIN bookings b "
+            "ON a.room_id = b.room_id AND a.id < b.id "
+            "AND a.status != 'cancelled' AND b.status != 'cancelled' "
+            "AND a.check_in < b.check_out AND b.check_in < a.check_out"
+        ))).all()
+        total = (await conn.execute(text("SELECT COUNT(*) FROM bookings"))).scalar()
+    await engine.dispose()
+    return overlaps, total
+
+
+def main():
+    args = parse_args()
+    tmp_dir = None
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        tmp_dir = tempfile.mkdtemp()
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/race.db"
+
+    # Процессы запускаются через spawn: у каждого свои движки и writer
+    context = multiprocessing.get_context("spawn")
+    asyncio.run(setup(args.rooms))
+
+    queue = context.Queue()
+    per_process = args.bookings // args.processes
+    started = time.perf_counter()
+    processes = [
+        context.Process(target=worker, args=(per_process, args.rooms, args.days, seed, queue))
+        for seed in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    overlaps, total = asyncio.run(find_overlaps())
+    created = sum(r["created"] for r in results)
+    conflicts = sum(r["conflicts"] for r in results)
+    errors = [error for r in results for error in r["errors"]]
+
+    print(f"{per_process * args.processes} attempts in {args.processes} processes, {elapsed:.2f}s")
+    print(f"created: {created}, conflicts: {conflicts}, errors: {len(errors)}, rows: {total}")
+    for error in errors[:10]:
+        print(f"  {error}")
+    for overlap in overlaps[:10]:
+        print(f"  overlap: bookings {overlap[0]} and {overlap[1]} in room {overlap[2]}")
+    print(f"overlapping pairs: {len(overlaps)}")
+
+    if tmp_dir:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return 1 if overlaps or errors or created != total else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
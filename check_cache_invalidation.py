@@ -0,0 +1,153 @@
+"""
+Проверка инвалидации двухуровневого кеша между воркерами.
+
+Скрипт создает два экземпляра TwoTierCache (два "воркера") с общим брокером
+и проверяет, что после invalidate() в одном из них второй удаляет свою
+локальную копию ключа и получает сообщение с дополнительными полями, а
+первый не обрабатывает собственное сообщение. Сценарий выполняется с
+InProcessBroker и, если установлен fakeredis, с Redis pub/sub поверх
+fakeredis (общий сервер для обоих воркеров). С fakeredis также проверяется,
+что инвалидация, сделанная при разомкнутом предохранителе, повторяется
+(DEL и publish) после его замыкания. Завершается с кодом 1 при ошибках.
+
+Запуск: python check_cache_invalidation.py
+"""
+import asyncio
+import sys
+
+from app.cache import CircuitBreaker, InProcessBroker, LocalCache, TwoTierCache
+
+KEY = "rooms_list"
+
+# Сколько ждать доставки сообщения
+DELIVERY_TIMEOUT = 2
+
+
+async def wait_for(condition, timeout: float = DELIVERY_TIMEOUT) -> bool:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        if loop.time() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+async def check_pair(name: str, first: TwoTierCache, second: TwoTierCache, client=None) -> list:
+    failures = []
+    received = {"first": [], "second": []}
+    first.on_invalidation(received["first"].append)
+    second.on_invalidation(received["second"].append)
+    first.start()
+    second.start()
+    # Даем слушателям подписаться
+    await asyncio.sleep(0.1)
+
+    try:
+        await first.set(KEY, "old")
+        # Второй воркер читает из Redis (или кеширует свое значение без Redis)
+        if client is None:
+            await second.set(KEY, "old")
+        if await second.get(KEY) != "old" or second.local.get(KEY) != "old":
+            failures.append("second worker did not cache the value locally")
+
+        await first.invalidate(KEY, topic="rooms")
+
+        if not await wait_for(lambda: second.local.get(KEY) is None):
+            failures.append("second worker kept its local copy after invalidate()")
+        if not await wait_for(lambda: received["second"]):
+            failures.append("second worker's handler was not called")
+        elif received["second"][0].get("topic") != "rooms":
+            failures.append(f"event fields were not delivered: {received['second'][0]}")
+        if first.local.get(KEY) is not None:
+            failures.append("first worker kept its local copy after invalidate()")
+        if received["first"]:
+            failures.append("first worker handled its own message")
+        if first.pending_invalidations:
+            failures.append("invalidation was deferred although Redis is reachable")
+        if client is not None and await client.get(KEY) is not None:
+            failures.append("key is still in Redis after invalidate()")
+        if await second.get(KEY) is not None:
+            failures.append("second worker still returns the old value")
+    finally:
+        await first.stop()
+        await second.stop()
+
+    print(f"{name}: {'ok' if not failures else 'FAILED'}")
+    for failure in failures:
+        print(f"  {failure}")
+    return failures
+
+
+async def check_breaker_replay(client_factory) -> list:
+    failures = []
+    client = client_factory()
+    first_client = client_factory()
+    breaker = CircuitBreaker(probe=first_client.ping, failure_threshold=1, probe_interval=0.3)
+    first = TwoTierCache(LocalCache(), first_client, breaker=breaker)
+    second = TwoTierCache(LocalCache(), client_factory())
+    first.start()
+    second.start()
+    await asyncio.sleep(0.1)
+
+    try:
+        await first.set(KEY, "old")
+        await second.get(KEY)
+
+        # Первый воркер потерял Redis: предохранитель разомкнут
+        breaker.record_failure()
+        await first.invalidate(KEY, topic="rooms")
+        if first.pending_invalidations != 2:
+            failures.append(f"invalidation was not recorded: {first.pending_invalidations} pending")
+        if await client.get(KEY) != "old":
+            failures.append("key was deleted while the breaker was open")
+
+        if not await wait_for(lambda: second.local.get(KEY) is None, timeout=3):
+            failures.append("second worker kept its local copy after the breaker closed")
+        if await client.get(KEY) is not None:
+            failures.append("key is still in Redis after the breaker closed")
+        if first.pending_invalidations:
+            failures.append(f"{first.pending_invalidations} invalidations were not replayed")
+    finally:
+        await first.stop()
+        await second.stop()
+
+    print(f"fakeredis breaker replay: {'ok' if not failures else 'FAILED'}")
+    for failure in failures:
+        print(f"  {failure}")
+    return failures
+
+
+async def main() -> int:
+    failures = []
+
+    broker = InProcessBroker()
+    failures += await check_pair(
+        "in-process broker",
+        TwoTierCache(LocalCache(), broker=broker),
+        TwoTierCache(LocalCache(), broker=broker),
+    )
+
+    try:
+        import fakeredis
+    except ImportError:
+        print("fakeredis: skipped (pip install fakeredis)")
+    else:
+        server = fakeredis.FakeServer()
+
+        def client():
+            return fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+        failures += await check_pair(
+            "fakeredis pub/sub",
+            TwoTierCache(LocalCache(), client()),
+            TwoTierCache(LocalCache(), client()),
+            client=client(),
+        )
+        failures += await check_breaker_replay(client)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
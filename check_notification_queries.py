@@ -0,0 +1,121 @@
+"""
+Проверка количества запросов задач NotificationService.
+
+Для каждой задачи (напоминание за 24 часа, напоминание о выезде, запрос
+отзыва) скрипт создает во временной базе сначала немного, затем много
+подходящих бронирований и считает выполненные SELECT. Число запросов должно
+зависеть только от числа порций по FETCH_CHUNK строк (без N+1), каждое
+бронирование - получить сообщение, а во время отправки ни одно соединение
+чтения не должно быть занято. Завершается с кодом 1 при расхождении.
+
+Запуск: python check_notification_queries.py
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date, datetime, time, timedelta
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{TMP_DIR}/notifications.db"
+
+from sqlalchemy import delete, event, insert
+
+from app.database import engine, read_engine, init_db, SessionLocal
+from app.database.models import User, Room, Booking
+from app.bot.notifications import FETCH_CHUNK, NotificationService
+
+SIZES = (5, 300)
+
+
+class FakeBot:
+    """Бот, который считает сообщения и отправки при занятом соединении чтения"""
+
+    def __init__(self):
+        self.sent = 0
+        self.sent_while_reading = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent += 1
+        if read_engine.sync_engine.pool.checkedout():
+            self.sent_while_reading += 1
+
+
+def _midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+# задача -> (check_in, check_out) подходящих бронирований
+today = date.today()
+JOBS = {
+    "send_reminder_24h": (today + timedelta(days=1), today + timedelta(days=3)),
+    "send_checkout_reminder": (today - timedelta(days=2), today),
+    "send_review_request": (today - timedelta(days=3), today - timedelta(days=1)),
+}
+
+
+async def seed(count: int, check_in: date, check_out: date):
+    async with engine.begin() as conn:
+        await conn.execute(delete(Booking))
+        await conn.execute(insert(Booking), [
+            {
+                "user_id": 1 + i % 50, "room_id": 1 + i % 5, "guests": 2, "total_price": 100000,
+                "status": "confirmed", "check_in": _midnight(check_in), "check_out": _midnight(check_out),
+            }
+            for i in range(count)
+        ])
+
+
+async def run_job(name: str):
+    """Выполнить задачу, вернуть (число SELECT, FakeBot)"""
+    selects = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            selects.append(statement)
+
+    bot = FakeBot()
+    service = NotificationService(bot, send_delay=0)
+    event.listen(read_engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        async with SessionLocal() as session:
+            await getattr(service, name)(session)
+    finally:
+        event.remove(read_engine.sync_engine, "before_cursor_execute", capture)
+    return len(selects), bot
+
+
+async def main():
+    await init_db()
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), [{"telegram_id": 5000 + i} for i in range(50)])
+        await conn.execute(insert(Room), [
+            {"name": f"Room {i}", "room_type": "standard", "price_per_night": 100000, "capacity": 2}
+            for i in range(5)
+        ])
+
+    failures = 0
+    for name, (check_in, check_out) in JOBS.items():
+        ok = True
+        for size in SIZES:
+            await seed(size, check_in, check_out)
+            queries, bot = await run_job(name)
+            # Порции по id: последний запрос возвращает неполную (или пустую) порцию
+            chunks = size // FETCH_CHUNK + 1
+            print(f"  {name}: {size} bookings -> {queries} queries ({chunks} chunks), "
+                  f"{bot.sent} messages, {bot.sent_while_reading} sent while reading")
+            # Напоминание за 24 часа дублируется администратору, если он настроен
+            ok &= bot.sent >= size and queries == chunks and not bot.sent_while_reading
+        failures += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] {name}")
+
+    await engine.dispose()
+    await read_engine.dispose()
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+    print(f"\n{failures} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,91 @@
+"""
+Проверка планов запросов CRUD: горячие запросы к bookings/reviews/users
+должны использовать индекс, а не полный просмотр таблицы.
+
+Скрипт создает временную базу через init_db (с миграциями), вызывает
+функции из app.database.crud, перехватывает выполненные SELECT и прогоняет
+их через EXPLAIN QUERY PLAN. Завершается с кодом 1, если найден SCAN таблицы.
+
+Запуск: python check_query_plans.py
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{TMP_DIR}/plans.db"
+
+from sqlalchemy import event, insert
+
+from app.database import engine, read_engine, init_db, SessionLocal
+from app.database import crud
+from app.database.models import User, Room, Booking, Review
+
+# Таблицы, для которых полный просмотр недопустим
+CHECKED_TABLES = ("bookings", "reviews", "users")
+
+
+async def seed():
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), [{"telegram_id": 1000 + i} for i in range(10)])
+        await conn.execute(insert(Room), [
+            {"name": f"Room {i}", "room_type": "standard", "price_per_night": 100000, "capacity": 2}
+            for i in range(5)
+        ])
+        await conn.execute(insert(Review), [{"user_id": 1, "room_id": 1, "rating": 5}])
+
+
+async def run_crud_queries():
+    """Вызвать проверяемые функции CRUD"""
+    async with SessionLocal() as db:
+        await crud.get_user_by_telegram_id(db, 1001)
+        await crud.get_room(db, 1)
+        await crud.get_room_reviews(db, 1)
+        await crud.get_user_bookings(db, 1)
+        await crud.get_booking(db, 1)
+        await crud.check_room_availability(db, 1, "2025-07-01", "2025-07-05")
+        await crud.get_available_rooms(db, "2025-07-01", "2025-07-05")
+        await crud.get_available_rooms(db, "2025-07-01", "2025-07-05", capacity=2, room_type="standard")
+
+
+async def main():
+    await init_db()
+    await seed()
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(read_engine.sync_engine, "before_cursor_execute", capture)
+    await run_crud_queries()
+    event.remove(read_engine.sync_engine, "before_cursor_execute", capture)
+
+    failures = 0
+    async with engine.connect() as conn:
+        for statement, parameters in statements:
+            result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            plan = [row[-1] for row in result]
+            full_scans = [
+                step for step in plan
+                if step.startswith("SCAN") and "USING" not in step
+                and step.split()[1] in CHECKED_TABLES
+            ]
+            status = "FAIL" if full_scans else "ok"
+            failures += bool(full_scans)
+            print(f"[{status}] {' '.join(statement.split())[:110]}")
+            for step in plan:
+                print(f"       {step}")
+
+    await engine.dispose()
+    await read_engine.dispose()
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+    print(f"\n{len(statements)} queries checked, {failures} with full table scans")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
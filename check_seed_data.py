@@ -0,0 +1,82 @@
+"""
+Смоук-проверка скриптов, которые пишут в базу.
+
+SessionLocal работает только на чтение (для SQLite - PRAGMA query_only),
+поэтому seed_data.py, db_reset.py и update_images.py пишут через db_writer.
+Скрипт запускает их отдельными процессами на новом файле SQLite: seed_data.py
+дважды (второй запуск не должен добавлять номера), затем update_images.py и
+db_reset.py, и после каждого шага проверяет содержимое таблицы rooms.
+Завершается с кодом 1 при ошибках.
+
+Запуск: python check_seed_data.py
+"""
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SEED_ROOMS = 10
+RESET_ROOMS = 10
+
+
+def run_script(name: str, db_url: str) -> subprocess.CompletedProcess:
+    env = {**os.environ, "DATABASE_URL": db_url}
+    return subprocess.run(
+        [sys.executable, os.path.join(ROOT, name)],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=120
+    )
+
+
+def main() -> int:
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, "seed.db")
+    db_url = f"sqlite:///{db_path}"
+    failures = []
+
+    def rooms():
+        with sqlite3.connect(db_path) as conn:
+            return conn.execute("SELECT id, name, image_url FROM rooms ORDER BY id").fetchall()
+
+    def step(name: str, expected_rooms: int, check=None):
+        result = run_script(name, db_url)
+        output = result.stdout + result.stderr
+        problems = []
+        if result.returncode != 0:
+            problems.append(f"exit code {result.returncode}")
+        if "readonly database" in output or "Error" in output or "Ошибка" in output:
+            problems.append("script reported an error")
+        try:
+            rows = rooms()
+        except sqlite3.Error as e:
+            rows = []
+            problems.append(f"cannot read rooms: {e}")
+        if len(rows) != expected_rooms:
+            problems.append(f"{len(rows)} rooms, expected {expected_rooms}")
+        elif check is not None and not check(rows):
+            problems.append("unexpected room data")
+
+        print(f"{name}: {'ok' if not problems else 'FAILED'}")
+        for problem in problems:
+            print(f"  {problem}")
+        if problems:
+            print("  " + output.strip().replace("\n", "\n  "))
+        failures.extend(problems)
+
+    try:
+        step("seed_data.py", SEED_ROOMS)
+        # Повторный запуск не дублирует номера
+        step("seed_data.py", SEED_ROOMS)
+        step("update_images.py", SEED_ROOMS, lambda rows: rows[0][2] == "https://i.imgur.com/Boeke4g.jpg")
+        step("db_reset.py", RESET_ROOMS, lambda rows: rows[0][1] == "Стандарт 2-х местный")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,13 +17,16 @@ def get_safe_database_url():
         return "sqlite:///oqtoshsoy.db"
 
     try:
-        # For PostgreSQL URLs, sanitize the connection string
-        if "postgres" in db_url.lower():
-            logger.info("Using PostgreSQL database with sanitized connection string")
-
-            # Force use of SQLite for development
-            logger.warning("Overriding PostgreSQL with SQLite for development")
-            return "sqlite:///oqtoshsoy.db"
+        # For PostgreSQL URLs, normalize the scheme (Heroku/Railway use postgres://)
+        if db_url.startswith(("postgres://", "postgresql")):
+            if os.environ.get("DB_FORCE_SQLITE", "").lower() in ("1", "true", "yes"):
+                logger.warning("DB_FORCE_SQLITE is set, overriding PostgreSQL with SQLite")
+                return "sqlite:///oqtoshsoy.db"
+
+            if db_url.startswith("postgres://"):
+                db_url = "postgresql://" + db_url[len("postgres://"):]
+            logger.info("Using PostgreSQL database")
+            return db_url
 
         # For SQLite URLs, use as is
         if db_url.startswith("sqlite"):
@@ -36,4 +39,14 @@ def get_safe_database_url():
     except Exception as e:
         logger.error(f"Error processing database URL: {str(e)}")
         logger.info("Falling back to SQLite database")
-        return "sqlite:///oqtoshsoy.db"
\ No newline at end of file
+        return "sqlite:///oqtoshsoy.db"
+
+
+def get_async_database_url(db_url):
+    """Returns the URL with an async driver (aiosqlite / asyncpg)"""
+    scheme, sep, rest = db_url.partition("://")
+    if scheme in ("sqlite", "sqlite+pysqlite"):
+        return "sqlite+aiosqlite://" + rest
+    if scheme in ("postgresql", "postgresql+psycopg2"):
+        return "postgresql+asyncpg://" + rest
+    return db_url
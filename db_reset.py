@@ -1,94 +1,37 @@
 import asyncio
-import os
 import logging
-import sqlite3
 import json
 
+from app.database import engine
+from app.database.migrations import apply_migrations
+from app.database.models import Base, Room
+from app.database.writer import db_writer
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger("db_reset")
 
+# Порядок полей в кортежах номеров ниже
+ROOM_COLUMNS = (
+    "name", "description", "room_type", "price_per_night", "weekend_price", "capacity",
+    "is_available", "image_url", "photos", "video_url", "amenities", "meal_included",
+    "with_breakfast", "season_type"
+)
 
-async def reset_database():
-    """A direct script to reset the database completely"""
-    try:
-        # 1. Delete existing database file if it exists
-        db_path = "oqtoshsoy.db"
-        if os.path.exists(db_path):
-            os.remove(db_path)
-            logger.info(f"Deleted existing database file: {db_path}")
-
-        # 2. Create a new database directly with SQLite
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # 3. Create tables manually
-        # Users table
-        cursor.execute('''
-        CREATE TABLE users (
-            id INTEGER PRIMARY KEY,
-            telegram_id INTEGER UNIQUE NOT NULL,
-            username TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            phone TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-
-        # Rooms table with all required columns
-        cursor.execute('''
-        CREATE TABLE rooms (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            description TEXT,
-            room_type TEXT NOT NULL,
-            price_per_night REAL NOT NULL,
-            weekend_price REAL,
-            capacity INTEGER NOT NULL,
-            is_available INTEGER DEFAULT 1,
-            image_url TEXT,
-            photos TEXT,
-            video_url TEXT,
-            amenities TEXT,
-            meal_included INTEGER DEFAULT 1,
-            with_breakfast INTEGER DEFAULT 1,
-            season_type TEXT DEFAULT 'all'
-        )
-        ''')
 
-        # Bookings table
-        cursor.execute('''
-        CREATE TABLE bookings (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            room_id INTEGER NOT NULL,
-            check_in TIMESTAMP NOT NULL,
-            check_out TIMESTAMP NOT NULL,
-            guests INTEGER DEFAULT 1,
-            total_price REAL NOT NULL,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            phone TEXT,
-            admin_notified INTEGER DEFAULT 0,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (room_id) REFERENCES rooms (id)
-        )
-        ''')
+async def reset_database():
+    """A direct script to reset the database completely
 
-        # Reviews table
-        cursor.execute('''
-        CREATE TABLE reviews (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            room_id INTEGER,
-            rating INTEGER NOT NULL,
-            comment TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (room_id) REFERENCES rooms (id)
-        )
-        ''')
+    Пишет через движок записи и db_writer: SessionLocal работает только на
+    чтение, а сам файл базы берется из DATABASE_URL.
+    """
+    try:
+        # 1-3. Drop and recreate all tables from the models
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(apply_migrations)
+        logger.info("Recreated database tables")
 
         # 4. Add updated rooms data
         rooms = [
@@ -256,29 +199,12 @@ async def reset_database():
             )
         ]
 
-        cursor.executemany('''
-        INSERT INTO rooms (
-            name, 
-            description, 
-            room_type, 
-            price_per_night, 
-            weekend_price, 
-            capacity, 
-            is_available, 
-            image_url, 
-            photos, 
-            video_url, 
-            amenities,
-            meal_included,
-            with_breakfast,
-            season_type
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', rooms)
+        async def write(session):
+            session.add_all([Room(**dict(zip(ROOM_COLUMNS, room))) for room in rooms])
+            await session.flush()
 
-        # 5. Commit changes and close connection
-        conn.commit()
-        conn.close()
+        # 5. Insert rooms in one committed write
+        await db_writer.run(write)
 
         logger.info(f"Database has been successfully reset with {len(rooms)} rooms")
         return {"status": "success", "message": f"База данных успешно сброшена и заполнена {len(rooms)} номерами"}
@@ -286,6 +212,8 @@ async def reset_database():
     except Exception as e:
         logger.error(f"Error resetting database: {str(e)}")
         return {"status": "error", "message": str(e)}
+    finally:
+        await db_writer.stop()
 
 
 # Run the script
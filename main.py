@@ -1,21 +1,39 @@
 import os
+import asyncio
 import logging
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, HTMLResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from aiogram.types import Update
 
-from app.config import BOT_TOKEN, HOST, PORT, WEBHOOK_URL, WEBAPP_URL
-from app.database import init_db
+from app.config import (
+    BOT_TOKEN, HOST, PORT, WEBHOOK_URL, WEBAPP_URL,
+    WEBHOOK_ASYNC, UPDATE_WORKERS, UPDATE_QUEUE_SIZE, UPDATE_ENQUEUE_TIMEOUT,
+    SCHEDULER_ENABLED, OUTBOUND_ENABLED, OCCUPANCY_RELOAD_INTERVAL
+)
+from app.database import init_db, SessionLocal
+from app.database.occupancy import occupancy_index
+from app.database.writer import db_writer
+from app.database.crud import user_cache
+from app.cache import cross_worker_invalidation, delete_cached, memory_cache, shared_cache, ROOMS_CACHE_KEY
 # Import router from web routes but not bot yet
 from app.bot.middleware import DatabaseMiddleware
+from app.bot.update_queue import UpdateQueue
+from app.bot.outbound import install_outbound
+from app.bot.media import media_cache
+from app.bot.keyboards import keyboard_registry
+from app.bot.notifications import notification_scheduler
+from app.bot.scheduler import recent_runs
+from app.bot.broadcast import broadcast_progress, recent_broadcasts, resume_broadcasts
 from app.web.routes import router as web_router
+from app.web.catalog import room_catalog
+from app.web.responses import ORJSONResponse
 
 # Configure logging
 logging.basicConfig(
@@ -31,8 +49,23 @@ bot = Bot(
 )
 dp = Dispatcher(storage=MemoryStorage())
 
+# Исходящие запросы: очередь на чат, лимиты Telegram и повтор после 429
+outbound = install_outbound(bot) if OUTBOUND_ENABLED else None
+
 # Register middleware
-dp.update.outer_middleware(DatabaseMiddleware())
+db_middleware = DatabaseMiddleware()
+dp.update.outer_middleware(db_middleware)
+
+# Очередь обновлений для асинхронного режима webhook
+update_queue = UpdateQueue(
+    dp, bot,
+    workers=UPDATE_WORKERS,
+    maxsize=UPDATE_QUEUE_SIZE,
+    enqueue_timeout=UPDATE_ENQUEUE_TIMEOUT
+) if WEBHOOK_ASYNC else None
+
+# Планировщик уведомлений; в каждом воркере, запуск - только в одном (job_runs)
+scheduler = notification_scheduler(bot) if SCHEDULER_ENABLED else None
 
 
 # Create context manager for FastAPI
@@ -55,16 +88,87 @@ async def lifespan(app: FastAPI):
     await init_db()
     logger.info("Database initialized")
 
+    # Получаем инвалидации кеша от других воркеров (до загрузки индекса,
+    # чтобы не пропустить изменения)
+    shared_cache.on_invalidation(apply_remote_invalidation)
+    shared_cache.start()
+
+    # Загружаем индекс занятости номеров
+    await load_occupancy_index()
+    occupancy_task = asyncio.create_task(refresh_occupancy_index())
+
+    if update_queue is not None:
+        update_queue.start()
+
+    if scheduler is not None:
+        scheduler.start()
+
+    # Продолжаем рассылки, прерванные перезапуском
+    resume_task = asyncio.create_task(resume_broadcasts(bot))
+
     yield
 
+    resume_task.cancel()
+    occupancy_task.cancel()
+    await asyncio.gather(resume_task, occupancy_task, return_exceptions=True)
+    if scheduler is not None:
+        await scheduler.stop()
+    if update_queue is not None:
+        await update_queue.stop()
+    await db_writer.stop()
+    await shared_cache.stop()
+
     # Close bot session when application stops
     await bot.session.close()
     logger.info("Bot session closed")
 
 
+async def load_occupancy_index():
+    async with SessionLocal() as session:
+        await occupancy_index.load(session)
+
+
+async def refresh_occupancy_index():
+    """Периодически сверять индекс занятости с базой (пропущенные инвалидации)"""
+    while True:
+        await asyncio.sleep(OCCUPANCY_RELOAD_INTERVAL)
+        await load_occupancy_index()
+
+
+async def invalidate_room_data():
+    """Сбросить кеши, зависящие от номеров и бронирований, во всех воркерах.
+
+    Вызывается после записи; индекс занятости сразу загружается заново,
+    чтобы проверки доступности не уходили в базу до перезапуска.
+    """
+    occupancy_index.invalidate()
+    room_catalog.invalidate()
+    media_cache.invalidate()
+    keyboard_registry.invalidate()
+    # Сброс базы удаляет и пользователей
+    user_cache.clear()
+    await delete_cached(ROOMS_CACHE_KEY, topic="rooms")
+    await load_occupancy_index()
+
+
+async def apply_remote_invalidation(message):
+    """Обработать изменения, сделанные в другом воркере"""
+    topic = message.get("topic")
+    if topic == "bookings":
+        occupancy_index.apply_booking_event(message["booking"])
+    elif topic == "rooms":
+        occupancy_index.invalidate()
+        room_catalog.invalidate()
+        media_cache.invalidate()
+        keyboard_registry.invalidate()
+        user_cache.clear()
+        await load_occupancy_index()
+
+
 # Create FastAPI application
 app = FastAPI(
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     debug=True,
     docs_url="/docs",
     redoc_url="/redoc",
@@ -92,10 +196,16 @@ app.include_router(web_router, prefix="")
 # Webhook route handler for Telegram updates
 @app.post("/webhook")
 async def webhook(request: Request):
-    update_data = await request.json()
+    # Parse raw JSON bytes straight into Update (pydantic JSON validation,
+    # no intermediate dict)
+    update = Update.model_validate_json(await request.body(), context={"bot": bot})
 
-    # Convert dict to Update object
-    update = Update.model_validate(update_data)
+    # Асинхронный режим: подтверждаем сразу, обработка в очереди
+    if update_queue is not None:
+        if not await update_queue.put(update):
+            # Очередь переполнена - Telegram повторит доставку позже
+            return Response(status_code=503)
+        return Response(status_code=200)
 
     # Process the update
     await dp.feed_update(bot, update)
@@ -103,6 +213,22 @@ async def webhook(request: Request):
     return Response(status_code=200)
 
 
+@app.get("/update-queue-stats")
+async def update_queue_stats():
+    """Depth and backpressure metrics of the webhook update queue"""
+    if update_queue is None:
+        return {"status": "disabled"}
+    return {"status": "success", **update_queue.stats()}
+
+
+@app.get("/outbound-stats")
+async def outbound_stats():
+    """Queue depth, retries and send latency percentiles of outgoing bot requests"""
+    if outbound is None:
+        return {"status": "disabled"}
+    return {"status": "success", **outbound.stats()}
+
+
 # Add root endpoint for health check
 @app.get("/")
 async def root():
@@ -436,6 +562,7 @@ async def reset_database():
     try:
         # Use force_recreate=True to drop and recreate tables with sample data
         await init_db(force_recreate=True)
+        await invalidate_room_data()
         return {"status": "success",
                 "message": "База данных oqtoshsoy.db успешно сброшена и заполнена тестовыми данными"}
     except Exception as e:
@@ -449,6 +576,7 @@ async def add_sample_data_endpoint():
     try:
         from app.database import add_sample_data
         await add_sample_data()
+        await invalidate_room_data()
         return {"status": "success", "message": "Добавлены примеры номеров"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -746,6 +874,9 @@ async def direct_reset():
     except Exception as e:
         logger.error(f"Error resetting database: {str(e)}")
         return {"status": "error", "message": str(e)}
+    finally:
+        # Кеши сбрасываем после записи, иначе их успеют заполнить старыми данными
+        await invalidate_room_data()
 
 
 # Database info endpoint to diagnose issues
@@ -796,6 +927,78 @@ async def db_info():
     }
 
 
+# Occupancy index consistency check
+@app.get("/occupancy-check")
+async def occupancy_check():
+    """Compare the in-memory occupancy index with the database"""
+    try:
+        async with SessionLocal() as session:
+            report = await occupancy_index.check_consistency(session)
+        return {"status": "success", **report}
+    except Exception as e:
+        logger.error(f"Error checking occupancy index: {e}")
+        return {"status": "error", "message": str(e)}
+
+
+# Cache counters and Redis circuit breaker state
+@app.get("/cache-stats")
+async def cache_stats():
+    """Hit/miss/eviction counters of the in-process cache, Redis breaker state and DB session usage"""
+    return {
+        "status": "success",
+        "memory_cache": memory_cache.stats(),
+        "redis_breaker": {
+            **shared_cache.breaker.stats(),
+            "pending_invalidations": shared_cache.pending_invalidations,
+            "replayed_invalidations": shared_cache.replayed
+        },
+        "db_sessions": db_middleware.stats(),
+        "db_writer": db_writer.stats(),
+        "user_cache": user_cache.stats(),
+        "media_cache": media_cache.stats(),
+        "keyboards": keyboard_registry.stats(),
+        "occupancy_index": {**occupancy_index.stats(), "cross_worker_invalidation": cross_worker_invalidation()}
+    }
+
+
+@app.get("/scheduler-jobs")
+async def scheduler_jobs(limit: int = 50):
+    """Scheduled jobs with their next run time and the persisted run history"""
+    try:
+        async with SessionLocal() as session:
+            history = await recent_runs(session, limit)
+        return {
+            "status": "success",
+            "enabled": scheduler is not None,
+            "jobs": scheduler.stats() if scheduler is not None else [],
+            "history": history
+        }
+    except Exception as e:
+        logger.error(f"Error reading scheduler history: {e}")
+        return {"status": "error", "message": str(e)}
+
+
+@app.get("/broadcasts")
+async def broadcasts(limit: int = 20):
+    """Recent broadcasts with delivery progress and throughput"""
+    try:
+        async with SessionLocal() as session:
+            return {"status": "success", "broadcasts": await recent_broadcasts(session, limit)}
+    except Exception as e:
+        logger.error(f"Error reading broadcasts: {e}")
+        return {"status": "error", "message": str(e)}
+
+
+@app.get("/broadcasts/{broadcast_id}")
+async def broadcast_status(broadcast_id: int):
+    """Progress of a single broadcast"""
+    async with SessionLocal() as session:
+        progress = await broadcast_progress(session, broadcast_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return {"status": "success", "broadcast": progress}
+
+
 @app.get("/direct-reset-absolute")
 async def direct_reset_absolute():
     """Endpoint to directly reset and populate the database using raw SQLite with absolute path"""
@@ -1112,6 +1315,9 @@ async def direct_reset_absolute():
     except Exception as e:
         logger.error(f"Error resetting database: {str(e)}")
         return {"status": "error", "message": str(e)}
+    finally:
+        # После записи, как в direct_reset
+        await invalidate_room_data()
 
 
 @app.get("/fix-connection")
@@ -1286,6 +1492,9 @@ async def update_room_images():
     except Exception as e:
         logger.error(f"Error updating room images: {str(e)}")
         return {"status": "error", "message": str(e)}
+    finally:
+        # После записи, как в direct_reset
+        await invalidate_room_data()
 
 # Entry point for server startup
 if __name__ == "__main__":
@@ -1362,125 +1571,3 @@ async def webapp_test():
     </html>
     """
     return HTMLResponse(content=html_content)
-
-
-# Добавляем в main.py планировщик задач
-async def start_notification_scheduler(bot: Bot):
-    """Запуск планировщика уведомлений"""
-    notification_service = NotificationService(bot)
-
-    while True:
-        try:
-            current_time = datetime.now()
-
-            # Ежедневные задачи в 9:00
-            if current_time.hour == 9 and current_time.minute == 0:
-                async with SessionLocal() as session:
-                    await notification_service.send_reminder_24h(session)
-                    await notification_service.send_checkout_reminder(session)
-                    await notification_service.daily_statistics(session)
-
-            # Запрос отзывов в 18:00
-            if current_time.hour == 18 and current_time.minute == 0:
-                async with SessionLocal() as session:
-                    await notification_service.send_review_request(session)
-
-            # Пятничные акции
-            if current_time.weekday() == 4 and current_time.hour == 12 and current_time.minute == 0:
-                async with SessionLocal() as session:
-                    await notification_service.send_special_offers(session, "weekend")
-
-            # Ждем минуту перед следующей проверкой
-            await asyncio.sleep(60)
-
-        except Exception as e:
-            logger.error(f"Error in notification scheduler: {e}")
-            await asyncio.sleep(60)
-            self.bot = bot
-
-    async def send_reminder_24h(self, session: AsyncSession):
-        """Отправка напоминаний за 24 часа до заезда"""
-        tomorrow = datetime.now() + timedelta(days=1)
-        tomorrow_start = tomorrow.replace(hour=0, minute=0, second=0)
-        tomorrow_end = tomorrow.replace(hour=23, minute=59, second=59)
-
-        # Находим бронирования на завтра
-        result = await session.execute(
-            select(Booking).where(
-                and_(
-                    Booking.check_in >= tomorrow_start,
-                    Booking.check_in <= tomorrow_end,
-                    Booking.status == "confirmed"
-                )
-            )
-        )
-        bookings = result.scalars().all()
-
-        for booking in bookings:
-            try:
-                # Отправляем клиенту
-                await self.bot.send_message(
-                    booking.user.telegram_id,
-                    f"🔔 Напоминание о бронировании!\n\n"
-                    f"Завтра ваш заезд в курорт Oqtoshsoy:\n"
-                    f"🛏 Номер: {booking.room.name}\n"
-                    f"📅 Заезд: {booking.check_in.strftime('%d.%m.%Y')} в 14:00\n"
-                    f"📅 Выезд: {booking.check_out.strftime('%d.%m.%Y')} до 12:00\n\n"
-                    f"📍 Адрес: Ташкентская область, Бостанлыкский район\n"
-                    f"📞 Контакт: +998 90 096 50 55\n\n"
-                    f"Ждем вас с нетерпением! 🌟"
-                )
-
-                # Уведомляем админа
-                await self.bot.send_message(
-                    ADMIN_TELEGRAM_ID,
-                    f"📋 Завтра заезд:\n"
-                    f"Бронирование #{booking.id}\n"
-                    f"Гость: @{booking.user.username or booking.user.telegram_id}\n"
-                    f"Номер: {booking.room.name}"
-                )
-
-            except Exception as e:
-                logger.error(f"Error sending 24h reminder for booking {booking.id}: {e}")
-
-    async def send_checkout_reminder(self, session: AsyncSession):
-        """Напоминание о выезде в день выезда"""
-        today = datetime.now().date()
-
-        result = await session.execute(
-            select(Booking).where(
-                and_(
-                    Booking.check_out == today,
-                    Booking.status == "confirmed"
-                )
-            )
-        )
-        bookings = result.scalars().all()
-
-        for booking in bookings:
-            try:
-                await self.bot.send_message(
-                    booking.user.telegram_id,
-                    f"☀️ Доброе утро!\n\n"
-                    f"Напоминаем, что сегодня день вашего выезда.\n"
-                    f"Выезд до 12:00\n\n"
-                    f"Надеемся, вам понравилось у нас! 💚\n"
-                    f"Будем рады видеть вас снова!\n\n"
-                    f"Оставьте отзыв: /review_{booking.id}"
-                )
-            except Exception as e:
-                logger.error(f"Error sending checkout reminder for booking {booking.id}: {e}")
-
-    async def send_review_request(self, session: AsyncSession):
-        """Запрос отзыва через день после выезда"""
-        yesterday = datetime.now().date() - timedelta(days=1)
-
-        result = await session.execute(
-            select(Booking).where(
-                and_(
-                    Booking.check_out == yesterday,
-                    Booking.status == "confirmed"
-                )
-            )
-        )
-        bookings = result.scalars().all()
\ No newline at end of file
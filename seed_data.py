@@ -1,25 +1,31 @@
-from sqlalchemy.orm import Session
-from app.database import SessionLocal, init_db, engine
-from app.database.models import Base, User, Room, Booking, Review
-import datetime
+import asyncio
+import inspect
 import logging
+import sys
+
+from sqlalchemy import func, select
+
+from app.database import init_db
+from app.database.models import Room
+from app.database.writer import db_writer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 
-def seed_database():
+async def seed_database():
+    """Добавить номера в пустую базу (через writer: SessionLocal только для чтения)"""
     # Create tables first to ensure they exist
-    Base.metadata.create_all(bind=engine)
+    result = init_db()
+    if inspect.isawaitable(result):
+        await result
 
-    db = SessionLocal()
-    try:
+    async def write(session) -> int:
         # Check if data already exists
-        existing_rooms = db.query(Room).count()
+        existing_rooms = (await session.execute(select(func.count(Room.id)))).scalar()
         if existing_rooms > 0:
-            logger.info("Database already contains data. Skipping test data creation.")
-            return
+            return 0
 
         # Create sample rooms - обновлено с полным списком номеров согласно прайсу
         rooms = [
@@ -105,25 +111,29 @@ def seed_database():
             )
         ]
 
-        for room in rooms:
-            db.add(room)
+        session.add_all(rooms)
+        await session.flush()
+        return len(rooms)
 
-        db.commit()
-        logger.info("Тестовые данные успешно добавлены в базу данных.")
+    try:
+        added = await db_writer.run(write)
     except Exception as e:
-        db.rollback()
         logger.error(f"Ошибка при создании тестовых данных: {e}")
         raise
     finally:
-        db.close()
+        await db_writer.stop()
+
+    if added:
+        logger.info("Тестовые данные успешно добавлены в базу данных.")
+    else:
+        logger.info("Database already contains data. Skipping test data creation.")
+    return added
 
 
 if __name__ == "__main__":
     try:
-        # Initialize database (create tables)
-        init_db()
-
-        # Seed the database with test data
-        seed_database()
+        # Create tables and seed the database with test data
+        asyncio.run(seed_database())
     except Exception as e:
-        logger.error(f"Error in seed_data.py: {e}")
\ No newline at end of file
+        logger.error(f"Error in seed_data.py: {e}")
+        sys.exit(1)
@@ -1,9 +1,11 @@
-import sqlite3
-import os
+import asyncio
 import json
 
-# Путь к базе данных
-db_path = "oqtoshsoy.db"  # Укажите правильный путь, если нужно
+from sqlalchemy import select, update
+
+from app.database import SessionLocal
+from app.database.models import Room
+from app.database.writer import db_writer
 
 # Список фотографий для стандартного номера (ID 1)
 # Правильный формат: прямые ссылки на изображения
@@ -18,47 +20,46 @@ standard_room_photos = [
 ]
 
 
-def update_room_images():
-    """Обновляет изображения номеров в базе данных"""
-    try:
-        # Проверяем существование файла БД
-        if not os.path.exists(db_path):
-            print(f"Ошибка: файл базы данных {db_path} не найден")
-            return False
-
-        # Подключаемся к базе данных
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
+async def update_room_images():
+    """Обновляет изображения номеров в базе данных (база - из DATABASE_URL)"""
+    async def write(session) -> int:
         # Обновляем основное изображение и массив photos для номера "Стандарт 2-х местный"
-        cursor.execute(
-            "UPDATE rooms SET image_url = ?, photos = ? WHERE id = ?",
-            (standard_room_photos[0], json.dumps(standard_room_photos), 1)
+        result = await session.execute(
+            update(Room)
+            .where(Room.id == 1)
+            .values(image_url=standard_room_photos[0], photos=json.dumps(standard_room_photos))
         )
+        return result.rowcount
+
+    try:
+        # Запись - через writer: SessionLocal только для чтения
+        if not await db_writer.run(write):
+            print("Ошибка: номер ID 1 не найден")
+            return False
 
         print(f"Обновлено изображение и галерея для номера ID 1")
 
         # Проверяем, что данные успешно обновлены
-        cursor.execute("SELECT image_url, photos FROM rooms WHERE id = 1")
-        result = cursor.fetchone()
+        async with SessionLocal() as session:
+            result = (await session.execute(
+                select(Room.image_url, Room.photos).where(Room.id == 1)
+            )).first()
         if result:
             print(f"В базе данных теперь: image_url = {result[0]}")
             print(f"В базе данных теперь: photos = {result[1]}")
 
-        # Сохраняем изменения и закрываем соединение
-        conn.commit()
-        conn.close()
-
         print("Изображения успешно обновлены!")
         return True
 
     except Exception as e:
         print(f"Ошибка при обновлении изображений: {str(e)}")
         return False
+    finally:
+        await db_writer.stop()
 
 
 # Вызываем функцию при запуске скрипта
 if __name__ == "__main__":
     print("Запуск обновления изображений...")
-    update_room_images()
+    asyncio.run(update_room_images())
     print("Обновление завершено.")
\ No newline at end of file
@@ -0,0 +1,47 @@
+"""
+Предварительная загрузка фото номеров в Telegram.
+
+Отправляет в чат администратора (или MEDIA_WARMUP_CHAT_ID) все фото номеров,
+для которых еще нет file_id, сохраняет file_id в media_files и удаляет
+отправленные сообщения. Запускать при деплое, после обновления фото:
+
+    python warm_media.py
+"""
+import asyncio
+import logging
+import os
+import sys
+
+from aiogram import Bot
+
+from app.bot.media import media_cache
+from app.config import ADMIN_TELEGRAM_ID, BOT_TOKEN
+from app.database import engine, init_db, read_engine
+from app.database.writer import db_writer
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+async def main() -> int:
+    chat_id = os.getenv("MEDIA_WARMUP_CHAT_ID") or ADMIN_TELEGRAM_ID
+    if not chat_id:
+        logger.warning("Neither MEDIA_WARMUP_CHAT_ID nor ADMIN_TELEGRAM_ID is set, skipping media warm-up")
+        return 0
+
+    await init_db()
+    bot = Bot(token=BOT_TOKEN)
+    try:
+        result = await media_cache.warm_up(bot, int(chat_id))
+    finally:
+        await bot.session.close()
+        await db_writer.stop()
+        await engine.dispose()
+        await read_engine.dispose()
+
+    print(result)
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))